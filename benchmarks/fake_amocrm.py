@@ -0,0 +1,185 @@
+"""
+Локальная заглушка API amoCRM на aiohttp для нагрузочных тестов.
+
+Реализует то, что вызывает AmocrmService при склейке:
+- GET /api/v4/contacts — постраничная выгрузка с _total_items;
+- GET/PATCH /api/v4/contacts/{id};
+- POST /ajax/merge/contacts/save — поглощённые контакты удаляются из аккаунта.
+Аккаунт определяется по заголовку Host ("<subdomain>.amocrm.ru").
+Задержка ответа, доля ответов 429 и максимальный размер страницы настраиваются.
+GET /_stats возвращает счётчики запросов.
+
+Сервис направляется на заглушку через AMOCRM_BASE_URL=http://127.0.0.1:8081
+
+    python -m benchmarks.fake_amocrm --accounts 3 --contacts 10000 --latency-ms 80 --rate-limit-ratio 0.02
+"""
+
+import argparse
+import asyncio
+import random
+import time
+from collections import Counter
+
+from aiohttp import web
+
+from benchmarks.synthetic import AccountProfile, generate_contacts
+
+
+class FakeAmocrm:
+    def __init__(
+        self,
+        latency_ms: float = 50,
+        jitter_ms: float = 20,
+        rate_limit_ratio: float = 0.0,
+        max_page_size: int = 250,
+        seed: int = 42,
+    ):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.rate_limit_ratio = rate_limit_ratio
+        self.max_page_size = max_page_size
+        self.rng = random.Random(seed)
+        # subdomain → {contact_id: контакт}, в порядке id
+        self.accounts: dict[str, dict[int, dict]] = {}
+        self.stats: Counter[str] = Counter()
+
+    def add_account(self, subdomain: str, contacts: list[dict]) -> None:
+        self.accounts[subdomain] = {contact["id"]: contact for contact in contacts}
+
+    def app(self) -> web.Application:
+        app = web.Application(middlewares=[self._middleware])
+        app.router.add_get("/api/v4/contacts", self.list_contacts)
+        app.router.add_get("/api/v4/contacts/{contact_id:\\d+}", self.get_contact)
+        app.router.add_patch("/api/v4/contacts/{contact_id:\\d+}", self.update_contact)
+        app.router.add_post("/ajax/merge/contacts/save", self.merge_contacts)
+        app.router.add_get("/_stats", self.get_stats)
+        return app
+
+    @web.middleware
+    async def _middleware(self, request: web.Request, handler):
+        if request.path == "/_stats":
+            return await handler(request)
+
+        route = f"{request.method} {request.match_info.route.resource.canonical}"
+        delay = max(0.0, self.rng.gauss(self.latency_ms, self.jitter_ms)) / 1000
+        await asyncio.sleep(delay)
+        if self.rng.random() < self.rate_limit_ratio:
+            response = web.json_response({"title": "Too Many Requests"}, status=429)
+        elif self._subdomain(request) not in self.accounts:
+            response = web.json_response({"title": "Account not found"}, status=401)
+        else:
+            response = await handler(request)
+        self.stats[f"{route} {response.status}"] += 1
+        return response
+
+    @staticmethod
+    def _subdomain(request: web.Request) -> str:
+        return request.host.split(".", 1)[0]
+
+    def _account(self, request: web.Request) -> dict[int, dict]:
+        return self.accounts[self._subdomain(request)]
+
+    async def list_contacts(self, request: web.Request) -> web.Response:
+        contacts = self._account(request)
+        limit = min(int(request.query.get("limit", 50)), self.max_page_size)
+        page = int(request.query.get("page", 1))
+        items = list(contacts.values())[(page - 1) * limit : page * limit]
+        if not items:
+            return web.Response(status=204)
+        return web.json_response(
+            {
+                "_page": page,
+                "_total_items": len(contacts),
+                "_embedded": {"contacts": items},
+            }
+        )
+
+    async def get_contact(self, request: web.Request) -> web.Response:
+        contact = self._account(request).get(int(request.match_info["contact_id"]))
+        if contact is None:
+            return web.Response(status=204)
+        return web.json_response(contact)
+
+    async def update_contact(self, request: web.Request) -> web.Response:
+        contact = self._account(request).get(int(request.match_info["contact_id"]))
+        if contact is None:
+            return web.json_response({"title": "Not found"}, status=404)
+        payload = await request.json()
+        if (tags := payload.get("_embedded", {}).get("tags")) is not None:
+            contact.setdefault("_embedded", {})["tags"] = tags
+        contact["updated_at"] = int(time.time())
+        return web.json_response({"id": contact["id"], "updated_at": contact["updated_at"]})
+
+    async def merge_contacts(self, request: web.Request) -> web.Response:
+        contacts = self._account(request)
+        form = await request.post()
+        ids = [int(contact_id) for contact_id in form.getall("id[]", [])]
+        result_id = int(form.get("result_element[ID]", 0))
+        if result_id not in contacts or any(cid not in contacts for cid in ids):
+            return web.json_response({"title": "Contacts not found"}, status=400)
+
+        survivor = contacts[result_id]
+        if name := form.get("result_element[NAME]"):
+            survivor["name"] = name
+        survivor.setdefault("_embedded", {})["leads"] = [
+            {"id": int(lead_id)} for lead_id in form.getall("result_element[LEADS][]", [])
+        ]
+        for contact_id in ids:
+            if contact_id != result_id:
+                del contacts[contact_id]
+        self.stats["merged_contacts"] += len(ids) - 1
+        return web.json_response({"response": {"id": result_id}}, status=202)
+
+    async def get_stats(self, request: web.Request) -> web.Response:
+        return web.json_response(
+            {
+                "requests": dict(self.stats),
+                "contacts": {
+                    subdomain: len(contacts) for subdomain, contacts in self.accounts.items()
+                },
+            }
+        )
+
+
+def account_subdomain(index: int) -> str:
+    return f"load-{index}"
+
+
+def build_fake(args) -> FakeAmocrm:
+    """Заглушка с args.accounts синтетическими аккаунтами (см. benchmarks.synthetic)."""
+    fake = FakeAmocrm(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        rate_limit_ratio=args.rate_limit_ratio,
+        max_page_size=args.max_page_size,
+        seed=args.seed,
+    )
+    for index in range(args.accounts):
+        profile = AccountProfile(
+            contacts=args.contacts,
+            duplicate_rate=args.duplicate_rate,
+            seed=args.seed + index,
+        )
+        fake.add_account(account_subdomain(index), generate_contacts(profile))
+    return fake
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--accounts", type=int, default=3)
+    parser.add_argument("--contacts", type=int, default=10000)
+    parser.add_argument("--duplicate-rate", type=float, default=0.1)
+    parser.add_argument("--latency-ms", type=float, default=50)
+    parser.add_argument("--jitter-ms", type=float, default=20)
+    parser.add_argument(
+        "--rate-limit-ratio", type=float, default=0.0, help="Доля ответов 429"
+    )
+    parser.add_argument("--max-page-size", type=int, default=250)
+    parser.add_argument("--seed", type=int, default=42)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    add_arguments(parser)
+    args = parser.parse_args()
+    web.run_app(build_fake(args).app(), host="127.0.0.1", port=args.port)
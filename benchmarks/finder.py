@@ -0,0 +1,282 @@
+"""
+Бенчмарк поиска дублей и подготовки payload склейки на синтетическом аккаунте.
+
+Для каждого размера аккаунта измеряются:
+- find_duplicates_all_contacts — полный проход по аккаунту, контактов/с;
+- find_duplicates_single_contact — поиск группы для случайных контактов, вызовов/с;
+- find_duplicates_for_contacts — пакет случайных контактов, как у merge_single, контактов/с;
+- prepare_merge_data — payload для всех найденных групп, групп/с.
+Время — медиана по прогонам. Пиковая память операции измеряется tracemalloc
+отдельным прогоном, чтобы трассировка не искажала время.
+
+Baseline зависит от машины: сохраняйте и сравнивайте его на одном окружении.
+В benchmarks/baselines/finder.json вместе с результатами записано окружение,
+на котором он снят; --compare на другом окружении об этом предупреждает.
+
+    python -m benchmarks.finder --sizes 1000,10000,100000
+    python -m benchmarks.finder --sizes 1000000 --runs 1 --single-targets 3
+    python -m benchmarks.finder --save-baseline
+    python -m benchmarks.finder --compare --tolerance 0.15
+"""
+
+import argparse
+import asyncio
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+import orjson
+from loguru import logger
+
+from benchmarks.synthetic import (
+    AccountProfile,
+    generate_blocks,
+    generate_contacts,
+    generate_priority_fields,
+)
+from src.duplicate_contact.services.find_duplicate import DuplicateFinderService
+from src.duplicate_contact.utils.prepare_merge_data import prepare_merge_data
+
+BASELINE_PATH = Path(__file__).parent / "baselines" / "finder.json"
+
+
+class SyntheticAmocrmService:
+    """Отдаёт контакты синтетического аккаунта вместо API amoCRM."""
+
+    def __init__(self, contacts: list[dict]):
+        self.contacts = contacts
+        self.by_id = {contact["id"]: contact for contact in contacts}
+
+    async def get_all_contacts(self, subdomain: str, access_token: str) -> list[dict]:
+        return self.contacts
+
+    async def get_contact_by_id(
+        self, subdomain: str, access_token: str, contact_id: int, with_leads: bool = False
+    ) -> dict | None:
+        return self.by_id.get(contact_id)
+
+
+async def measure(operation, runs: int) -> dict[str, float]:
+    """Медиана времени по прогонам и пиковая память отдельного прогона под tracemalloc."""
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        await operation()
+        timings.append(time.perf_counter() - started)
+
+    tracemalloc.start()
+    try:
+        await operation()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"seconds": statistics.median(timings), "peak_mb": peak / 2**20}
+
+
+async def run_profile(
+    profile: AccountProfile, runs: int, single_targets: int, batch_targets: int
+) -> dict:
+    started = time.perf_counter()
+    contacts = generate_contacts(profile)
+    blocks = generate_blocks(profile, contacts)
+    priority_fields = generate_priority_fields()
+    print(
+        f"\nКонтактов: {profile.contacts} "
+        f"(сгенерировано за {time.perf_counter() - started:.1f} с)"
+    )
+
+    finder = DuplicateFinderService(SyntheticAmocrmService(contacts))
+    contact_ids = [contact["id"] for contact in contacts]
+    single_ids = random.Random(profile.seed).sample(
+        contact_ids, min(single_targets, len(contacts))
+    )
+    batch_ids = random.Random(profile.seed).sample(
+        contact_ids, min(batch_targets, len(contacts))
+    )
+    # Как и ContactMergeService, склеиваем только группы хотя бы из двух контактов
+    groups = [
+        group
+        for group in await finder.find_duplicates_all_contacts("benchmark", "", blocks)
+        if len(group["group"]) >= 2
+    ]
+
+    async def find_all():
+        await finder.find_duplicates_all_contacts("benchmark", "", blocks)
+
+    async def find_single():
+        for contact_id in single_ids:
+            await finder.find_duplicates_single_contact(
+                "benchmark", "", contact_id, blocks
+            )
+
+    async def find_batch():
+        await finder.find_duplicates_for_contacts(
+            "benchmark", "", batch_ids, blocks
+        )
+
+    async def prepare_payloads():
+        for group in groups:
+            main_contact, *duplicates = group["group"]
+            await prepare_merge_data(main_contact, duplicates, priority_fields)
+
+    results = {
+        "find_all": await measure(find_all, runs),
+        "find_single": await measure(find_single, runs),
+        "find_batch": await measure(find_batch, runs),
+        "prepare_merge_data": await measure(prepare_payloads, runs),
+    }
+    results["find_all"]["throughput"] = profile.contacts / results["find_all"]["seconds"]
+    results["find_single"]["throughput"] = (
+        len(single_ids) / results["find_single"]["seconds"]
+    )
+    results["find_batch"]["throughput"] = (
+        len(batch_ids) / results["find_batch"]["seconds"]
+    )
+    results["prepare_merge_data"]["throughput"] = (
+        len(groups) / results["prepare_merge_data"]["seconds"]
+    )
+    print(
+        f"Найдено групп: {len(groups)}, целевых контактов: "
+        f"{len(single_ids)} по одному, {len(batch_ids)} пакетом"
+    )
+    return results
+
+
+def report(results: dict, baseline: dict | None, tolerance: float) -> bool:
+    """Печатает результаты и сравнение с baseline; возвращает True при регрессии."""
+    units = {
+        "find_all": "контактов/с",
+        "find_single": "вызовов/с",
+        "find_batch": "контактов/с",
+        "prepare_merge_data": "групп/с",
+    }
+    regression = False
+    for name, result in results.items():
+        line = (
+            f"  {name:<20} {result['seconds'] * 1000:10.1f} ms "
+            f"{result['throughput']:12.1f} {units[name]:<12} "
+            f"peak {result['peak_mb']:8.1f} MB"
+        )
+        previous = (baseline or {}).get(name)
+        if previous:
+            time_delta = result["seconds"] / previous["seconds"] - 1
+            # Колебания пика в пределах мегабайта — шум, а не регрессия
+            memory_delta = (result["peak_mb"] - previous["peak_mb"]) / max(
+                previous["peak_mb"], 1.0
+            )
+            line += f"   время {time_delta:+.0%}, память {memory_delta:+.0%}"
+            if time_delta > tolerance or memory_delta > tolerance:
+                line += "  РЕГРЕССИЯ"
+                regression = True
+        print(line)
+    return regression
+
+
+def machine_info() -> dict:
+    """Окружение, на котором снят baseline: сравнение с другим окружением неточно."""
+    cpu = platform.processor() or platform.machine()
+    cpuinfo = Path("/proc/cpuinfo")
+    if cpuinfo.exists():
+        for line in cpuinfo.read_text().splitlines():
+            if line.startswith("model name"):
+                cpu = line.partition(":")[2].strip()
+                break
+    return {
+        "cpu": cpu,
+        "cpu_count": os.cpu_count(),
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+    }
+
+
+def load_baselines() -> dict:
+    if BASELINE_PATH.exists():
+        return orjson.loads(BASELINE_PATH.read_bytes())
+    return {"machine": None, "profiles": {}}
+
+
+def save_baselines(baselines: dict) -> None:
+    BASELINE_PATH.parent.mkdir(parents=True, exist_ok=True)
+    BASELINE_PATH.write_bytes(
+        orjson.dumps(baselines, option=orjson.OPT_INDENT_2 | orjson.OPT_SORT_KEYS)
+    )
+    print(f"\nBaseline сохранён в {BASELINE_PATH}")
+
+
+async def main(args) -> int:
+    baselines = load_baselines()
+    machine = machine_info()
+    if args.compare and baselines["machine"] not in (None, machine):
+        print(
+            f"Baseline снят на другом окружении: {baselines['machine']}, "
+            f"текущее: {machine}"
+        )
+    regression = False
+    for size in args.sizes:
+        profile = AccountProfile(
+            contacts=size,
+            duplicate_rate=args.duplicate_rate,
+            custom_fields=args.custom_fields,
+            phones=args.phones,
+            exclusions=args.exclusions,
+            seed=args.seed,
+        )
+        results = await run_profile(
+            profile, args.runs, args.single_targets, args.batch_targets
+        )
+        baseline = baselines["profiles"].get(profile.key()) if args.compare else None
+        if args.compare and baseline is None:
+            print("  Baseline для этого профиля не найден")
+        regression |= report(results, baseline, args.tolerance)
+        baselines["profiles"][profile.key()] = results
+
+    if args.save_baseline:
+        baselines["machine"] = machine
+        save_baselines(baselines)
+    return 1 if regression else 0
+
+
+def parse_sizes(value: str) -> list[int]:
+    return [int(size) for size in value.split(",") if size.strip()]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", type=parse_sizes, default=[1000, 10000, 100000])
+    parser.add_argument("--duplicate-rate", type=float, default=0.1)
+    parser.add_argument("--custom-fields", type=int, default=10)
+    parser.add_argument("--phones", type=int, default=2)
+    parser.add_argument("--exclusions", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument(
+        "--single-targets",
+        type=int,
+        default=20,
+        help="Число контактов для find_duplicates_single_contact",
+    )
+    parser.add_argument(
+        "--batch-targets",
+        type=int,
+        default=50,
+        help="Размер пакета контактов для find_duplicates_for_contacts",
+    )
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--compare", action="store_true")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.1,
+        help="Допустимое ухудшение времени и памяти относительно baseline",
+    )
+    args = parser.parse_args()
+
+    # Debug-логи поиска искажают измерения
+    logger.remove()
+    logger.add(sys.stderr, level="WARNING")
+    sys.exit(asyncio.run(main(args)))
@@ -0,0 +1,310 @@
+"""
+Сквозной нагрузочный тест склейки: сообщения проходят через настоящие
+консьюмеры, RabbitMQ и Postgres, а вместо amoCRM отвечает локальная заглушка
+(benchmarks.fake_amocrm), запущенная в отдельном потоке.
+
+Нужны локальные RabbitMQ и Postgres из .env: тест сохраняет настройки дублей
+для аккаунтов load-N и публикует сообщения в очередь склейки. Токены выдаёт
+встроенный ответчик RPC-очереди tokens_get_user.
+
+Отчёт: время прогона, пропускная способность, p50/p95/p99 сквозной задержки
+от публикации до завершения обработки, число повторов и откладываний и
+счётчики заглушки. С --hot-share доля сообщений single приходится на один
+аккаунт (load-0), а задержка выводится отдельно для него и для остальных:
+у мелких аккаунтов она не должна расти вместе с потоком крупного.
+
+    python -m benchmarks.load_test --mode all --accounts 5 --contacts 20000
+    python -m benchmarks.load_test --mode single --accounts 3 --messages 2000 --rate-limit-ratio 0.02
+    python -m benchmarks.load_test --mode single --accounts 10 --messages 5000 --hot-share 0.9
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+import uuid
+
+import aio_pika
+from aiohttp import web
+from loguru import logger
+
+from benchmarks.fake_amocrm import (
+    FakeAmocrm,
+    account_subdomain,
+    add_arguments,
+    build_fake,
+)
+from benchmarks.synthetic import (
+    AccountProfile,
+    generate_blocks,
+    generate_priority_fields,
+)
+
+QUEUES = {
+    "all": "duplicate_contacts_merge_all",
+    "single": "duplicate_contacts_merge_single",
+}
+TOKENS_QUEUE = "tokens_get_user"
+
+
+def start_fake_server(fake: FakeAmocrm, port: int) -> None:
+    """Запускает заглушку в отдельном потоке со своим event loop."""
+    started = threading.Event()
+
+    def run():
+        loop = asyncio.new_event_loop()
+        runner = web.AppRunner(fake.app(), access_log=None)
+        loop.run_until_complete(runner.setup())
+        loop.run_until_complete(web.TCPSite(runner, "127.0.0.1", port).start())
+        started.set()
+        loop.run_forever()
+
+    threading.Thread(target=run, name="fake-amocrm", daemon=True).start()
+    started.wait()
+
+
+async def serve_tokens(connection_manager) -> None:
+    """Отвечает на RPC-запросы токенов вместо сервиса токенов."""
+    connection = await connection_manager.connect()
+    channel = await connection.channel()
+    queue = await channel.declare_queue(TOKENS_QUEUE, durable=True)
+
+    async def reply(message: aio_pika.IncomingMessage):
+        async with message.process():
+            tokens = {
+                "access_token": "load-test",
+                "refresh_token": "load-test",
+                "expires_in": 86400,
+            }
+            await channel.default_exchange.publish(
+                aio_pika.Message(
+                    body=json.dumps(tokens).encode(),
+                    correlation_id=message.correlation_id,
+                ),
+                routing_key=message.reply_to,
+            )
+
+    await queue.consume(reply)
+
+
+async def save_settings(container, subdomains: list[str]) -> None:
+    """Сохраняет активные настройки дублей для аккаунтов заглушки."""
+    from src.duplicate_contact.schemas import ContactDuplicateSettingsSchema
+
+    db_manager = container.database.db_manager()
+    settings_service = container.services.duplicate_settings_service()
+    blocks = generate_blocks(AccountProfile(contacts=0, exclusions=0), [])
+    for subdomain in subdomains:
+        settings = ContactDuplicateSettingsSchema(
+            subdomain=subdomain,
+            merge_all=True,
+            merge_is_active=True,
+            priority_fields=generate_priority_fields(),
+            blocks=[
+                {"block_id": block["db_id"], "fields": block["fields"]} for block in blocks
+            ],
+        )
+        async with db_manager.get_session() as session:
+            await settings_service.add_duplicate_settings(session, settings)
+
+
+class LoadTracker:
+    """
+    Сквозная задержка сообщений: от published_at в теле сообщения до
+    завершения последней обработки. Сообщение, отложенное на повтор или
+    из-за очереди своего subdomain, не считается завершённым до повторной
+    доставки.
+    """
+
+    def __init__(self):
+        self.finished: dict[str, float] = {}
+        self.subdomains: dict[str, str] = {}
+        self.awaiting_retry: set[str] = set()
+        self.retries = 0
+        self.deferred = 0
+
+    def track_consumer(self, consumer) -> None:
+        process_message = consumer.process_message
+
+        async def tracked_process_message(message: aio_pika.IncomingMessage):
+            load_id = self._load_id(message)
+            self.awaiting_retry.discard(load_id)
+            await process_message(message)
+            if load_id and load_id not in self.awaiting_retry:
+                body = json.loads(message.body)
+                self.finished[load_id] = time.time() - body["published_at"]
+                self.subdomains[load_id] = body["subdomain"]
+
+        consumer.process_message = tracked_process_message
+
+    def track_retries(self, rmq_publisher) -> None:
+        publish_retry = rmq_publisher.publish_retry
+
+        async def tracked_publish_retry(message, *args, **kwargs):
+            await publish_retry(message, *args, **kwargs)
+            self.retries += 1
+            self.awaiting_retry.add(self._load_id(message))
+
+        rmq_publisher.publish_retry = tracked_publish_retry
+
+        publish_deferred = rmq_publisher.publish_deferred
+
+        async def tracked_publish_deferred(message, *args, **kwargs):
+            await publish_deferred(message, *args, **kwargs)
+            self.deferred += 1
+            self.awaiting_retry.add(self._load_id(message))
+
+        rmq_publisher.publish_deferred = tracked_publish_deferred
+
+    def latencies(self, subdomain: str | None = None, exclude: bool = False) -> list[float]:
+        """Задержки всех сообщений, сообщений subdomain или (exclude) всех остальных."""
+        return sorted(
+            latency
+            for load_id, latency in self.finished.items()
+            if subdomain is None or (self.subdomains[load_id] == subdomain) != exclude
+        )
+
+    @staticmethod
+    def _load_id(message: aio_pika.IncomingMessage) -> str | None:
+        try:
+            return json.loads(message.body).get("load_id")
+        except ValueError:
+            return None
+
+
+def build_messages(args, subdomains: list[str]) -> list[dict]:
+    if args.mode == "all":
+        return [{"subdomain": subdomain} for subdomain in subdomains]
+    rng = random.Random(args.seed)
+
+    def pick_subdomain() -> str:
+        if args.hot_share and len(subdomains) > 1:
+            if rng.random() < args.hot_share:
+                return subdomains[0]
+            return rng.choice(subdomains[1:])
+        return rng.choice(subdomains)
+
+    return [
+        {"subdomain": pick_subdomain(), "contact_id": rng.randint(1, args.contacts)}
+        for _ in range(args.messages)
+    ]
+
+
+def percentile(values: list[float], ratio: float) -> float:
+    return values[min(len(values) - 1, int(len(values) * ratio))]
+
+
+def print_latencies(label: str, latencies: list[float]) -> None:
+    if not latencies:
+        return
+    print(
+        f"{label}: p50={statistics.median(latencies):.2f} с  "
+        f"p95={percentile(latencies, 0.95):.2f} с  "
+        f"p99={percentile(latencies, 0.99):.2f} с  max={latencies[-1]:.2f} с  "
+        f"({len(latencies)} сообщений)"
+    )
+
+
+async def run(args) -> int:
+    # Конфигурация читается при импорте src: адрес заглушки задаём до него
+    os.environ["AMOCRM_BASE_URL"] = f"http://127.0.0.1:{args.port}"
+    from src.containers import ApplicationContainer
+    from src.lifecycle import close_resources, prepare_infrastructure
+
+    fake = build_fake(args)
+    start_fake_server(fake, args.port)
+    subdomains = [account_subdomain(index) for index in range(args.accounts)]
+
+    container = ApplicationContainer()
+    await prepare_infrastructure(container)
+    rabbitmq_manager = container.rabbitmq_manager()
+    rmq_publisher = container.rabbitmq.rmq_publisher()
+    await serve_tokens(container.rabbitmq.connection_manager())
+    await save_settings(container, subdomains)
+
+    queue_name = QUEUES[args.mode]
+    consumers = [
+        consumer
+        for consumer in container.consumers.consumers()
+        if consumer.queue_name == queue_name
+    ]
+    tracker = LoadTracker()
+    tracker.track_retries(rmq_publisher)
+    for consumer in consumers:
+        if args.concurrency:
+            consumer.concurrency = args.concurrency
+        tracker.track_consumer(consumer)
+    consumers_task = asyncio.create_task(
+        rabbitmq_manager.start_consumers(consumers, redrive=False)
+    )
+
+    messages = build_messages(args, subdomains)
+    started = time.time()
+    for message in messages:
+        message.update(load_id=str(uuid.uuid4()), published_at=time.time())
+        await rmq_publisher.publish(
+            aio_pika.Message(
+                body=json.dumps(message).encode(),
+                delivery_mode=aio_pika.DeliveryMode.PERSISTENT,
+            ),
+            routing_key=queue_name,
+        )
+    published = time.time() - started
+    print(f"Опубликовано {len(messages)} сообщений в {queue_name} за {published:.1f} с")
+
+    try:
+        while len(tracker.finished) < len(messages):
+            if time.time() - started > args.timeout:
+                print(f"Таймаут: завершено {len(tracker.finished)} из {len(messages)}")
+                break
+            await asyncio.sleep(0.2)
+        elapsed = time.time() - started
+    finally:
+        await rabbitmq_manager.stop_consumers()
+        consumers_task.cancel()
+        await asyncio.gather(consumers_task, return_exceptions=True)
+        await close_resources(container)
+
+    latencies = tracker.latencies()
+    if latencies:
+        print(
+            f"Завершено {len(latencies)} сообщений за {elapsed:.1f} с "
+            f"({len(latencies) / elapsed:.1f} сообщений/с), повторов: {tracker.retries}, "
+            f"отложено: {tracker.deferred}"
+        )
+        print_latencies("Задержка", latencies)
+        if args.hot_share:
+            hot = subdomains[0]
+            print_latencies(f"  {hot}", tracker.latencies(hot))
+            print_latencies("  остальные", tracker.latencies(hot, exclude=True))
+    print("Запросы к заглушке amoCRM:")
+    for key, count in sorted(fake.stats.items()):
+        print(f"  {key:<50} {count}")
+    return 0 if len(latencies) == len(messages) else 1
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    add_arguments(parser)
+    parser.add_argument("--mode", choices=sorted(QUEUES), default="all")
+    parser.add_argument(
+        "--messages", type=int, default=1000, help="Число сообщений в режиме single"
+    )
+    parser.add_argument(
+        "--hot-share",
+        type=float,
+        default=0.0,
+        help="Доля сообщений single для одного аккаунта (load-0)",
+    )
+    parser.add_argument("--concurrency", type=int, default=None)
+    parser.add_argument("--timeout", type=float, default=600)
+    args = parser.parse_args()
+
+    logger.remove()
+    logger.add(sys.stderr, level="WARNING")
+    sys.exit(asyncio.run(run(args)))
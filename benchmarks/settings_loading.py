@@ -0,0 +1,127 @@
+"""
+Сравнение загрузки дерева настроек: ORM (цепочка selectinload + _map_to_schema)
+и один запрос с json_agg, декодируемый orjson.
+
+Синтетические настройки создаются в транзакции, которая в конце откатывается.
+
+    python -m benchmarks.settings_loading --blocks 10 --fields 5 --exclusions 2000 --runs 50
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+import orjson
+
+from src.common.config import CONNECTION_URL_DB
+from src.common.database import DatabaseManager
+from src.duplicate_contact.repository import ContactDuplicateRepository
+from src.duplicate_contact.schemas import ContactDuplicateSettingsSchema
+from src.duplicate_contact.services.duplicate_settings import DuplicateSettingsService
+
+
+def synthetic_settings(
+    subdomain: str, blocks: int, fields: int, exclusions: int
+) -> ContactDuplicateSettingsSchema:
+    return ContactDuplicateSettingsSchema(
+        subdomain=subdomain,
+        priority_fields=[{"field_name": f"priority_{i}"} for i in range(5)],
+        blocks=[
+            {
+                "block_id": block_id,
+                "fields": [
+                    {
+                        "field_name": f"field_{field}",
+                        "exclusion_fields": [
+                            {"value": f"value_{block_id}_{field}_{i}"}
+                            for i in range(exclusions)
+                        ],
+                    }
+                    for field in range(fields)
+                ],
+            }
+            for block_id in range(blocks)
+        ],
+    )
+
+
+async def load_orm(repo, session, subdomain: str) -> ContactDuplicateSettingsSchema:
+    # Сбрасываем identity map, чтобы каждый прогон заново создавал ORM-объекты
+    session.expunge_all()
+    settings = await repo.get_settings_by_subdomain(session, subdomain)
+    return DuplicateSettingsService._map_to_schema(settings)
+
+
+async def load_json(repo, session, subdomain: str) -> ContactDuplicateSettingsSchema:
+    settings_json = await repo.get_settings_tree_json(session, subdomain)
+    return ContactDuplicateSettingsSchema.model_validate(orjson.loads(settings_json))
+
+
+async def measure(loader, repo, session, subdomain: str, runs: int):
+    timings = []
+    result = None
+    for _ in range(runs):
+        started = time.perf_counter()
+        result = await loader(repo, session, subdomain)
+        timings.append((time.perf_counter() - started) * 1000)
+    return result, timings
+
+
+def report(name: str, timings: list[float]):
+    timings = sorted(timings)
+    p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+    print(
+        f"{name:<6} mean={statistics.mean(timings):8.2f} ms  "
+        f"p50={statistics.median(timings):8.2f} ms  p95={p95:8.2f} ms"
+    )
+
+
+async def main(args):
+    db_manager = DatabaseManager(CONNECTION_URL_DB)
+    repo = ContactDuplicateRepository()
+    subdomain = f"benchmark-settings-{os.getpid()}"
+    data = synthetic_settings(subdomain, args.blocks, args.fields, args.exclusions)
+    total = args.blocks * args.fields * args.exclusions
+    print(
+        f"Блоков: {args.blocks}, полей в блоке: {args.fields}, "
+        f"исключений на поле: {args.exclusions} (всего {total}), прогонов: {args.runs}"
+    )
+
+    try:
+        async with db_manager.get_session() as session:
+            transaction = await session.begin()
+            try:
+                await DuplicateSettingsService(repo, None)._save_settings_tree(
+                    session, data
+                )
+                await session.flush()
+
+                orm_result, orm_timings = await measure(
+                    load_orm, repo, session, subdomain, args.runs
+                )
+                json_result, json_timings = await measure(
+                    load_json, repo, session, subdomain, args.runs
+                )
+            finally:
+                await transaction.rollback()
+
+        report("orm", orm_timings)
+        report("json", json_timings)
+        print(
+            f"Ускорение: {statistics.mean(orm_timings) / statistics.mean(json_timings):.1f}x"
+        )
+        if orm_result.model_dump() != json_result.model_dump():
+            print("ВНИМАНИЕ: результаты ORM и JSON различаются")
+    finally:
+        await db_manager.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--blocks", type=int, default=10)
+    parser.add_argument("--fields", type=int, default=5)
+    parser.add_argument("--exclusions", type=int, default=2000)
+    parser.add_argument("--runs", type=int, default=50)
+    asyncio.run(main(parser.parse_args()))
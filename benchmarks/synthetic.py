@@ -0,0 +1,171 @@
+"""
+Генератор синтетического аккаунта amoCRM: контакты в формате API v4
+и блоки настроек дублей для них.
+
+Генерация детерминирована при одинаковых параметрах и seed, поэтому
+результаты разных прогонов и сохранённые baseline сравнимы.
+"""
+
+import random
+from dataclasses import asdict, dataclass
+
+from src.duplicate_contact.utils.prepare_merge_data import normalize_phone
+
+PHONE_FIELD_ID = 1
+EMAIL_FIELD_ID = 2
+CITY_FIELD_ID = 3
+# ID остальных кастомных полей начинаются отсюда
+EXTRA_FIELD_ID = 100
+
+# Фиксированное "сейчас": даты создания не зависят от момента запуска
+NOW = 1_700_000_000
+
+CITIES = ["Москва", "Казань", "Новосибирск", "Екатеринбург", "Самара", "Омск"]
+
+
+@dataclass
+class AccountProfile:
+    """Параметры синтетического аккаунта."""
+
+    contacts: int = 10000
+    # Доля контактов, являющихся дублями ранее созданных
+    duplicate_rate: float = 0.1
+    # Число дополнительных текстовых кастомных полей у контакта
+    custom_fields: int = 10
+    # Число телефонов у контакта (мультиполе)
+    phones: int = 2
+    # Размер списка исключений на поле телефона
+    exclusions: int = 100
+    seed: int = 42
+
+    def key(self) -> str:
+        """Ключ профиля для baseline: размер аккаунта и параметры генерации."""
+        return ",".join(f"{name}={value}" for name, value in asdict(self).items())
+
+
+def _phone(rng: random.Random) -> str:
+    digits = "".join(rng.choices("0123456789", k=10))
+    # Разные форматы одного номера должны нормализоваться одинаково
+    return rng.choice(
+        [f"+7{digits}", f"8{digits}", f"+7 ({digits[:3]}) {digits[3:6]}-{digits[6:]}"]
+    )
+
+
+def _contact(rng: random.Random, contact_id: int, profile: AccountProfile) -> dict:
+    custom_fields = [
+        {
+            "field_id": PHONE_FIELD_ID,
+            "field_name": "Телефон",
+            "field_code": "PHONE",
+            "values": [
+                {"value": _phone(rng), "enum_code": "WORK"} for _ in range(profile.phones)
+            ],
+        },
+        {
+            "field_id": EMAIL_FIELD_ID,
+            "field_name": "Email",
+            "field_code": "EMAIL",
+            "values": [{"value": f"user{contact_id}@example.com", "enum_code": "WORK"}],
+        },
+        {
+            "field_id": CITY_FIELD_ID,
+            "field_name": "Город",
+            "field_code": None,
+            "values": [{"value": rng.choice(CITIES)}],
+        },
+        *(
+            {
+                "field_id": EXTRA_FIELD_ID + i,
+                "field_name": f"Поле {i}",
+                "field_code": None,
+                "values": [{"value": f"значение {rng.randrange(1000)}"}],
+            }
+            for i in range(profile.custom_fields)
+        ),
+    ]
+    # Часть контактов без телефона: поиск должен их пропускать
+    if rng.random() < 0.05:
+        custom_fields[0]["values"] = []
+    return {
+        "id": contact_id,
+        "name": f"Контакт {rng.randrange(profile.contacts)}",
+        "responsible_user_id": rng.randrange(1, 50),
+        "created_at": NOW - rng.randrange(0, 365 * 86400),
+        "custom_fields_values": custom_fields,
+        "_embedded": {
+            "tags": [{"id": rng.randrange(1, 200)} for _ in range(rng.randrange(3))],
+            "leads": [{"id": contact_id * 10 + i} for i in range(rng.randrange(3))],
+            "companies": (
+                [{"id": rng.randrange(1, 1000)}] if rng.random() < 0.3 else []
+            ),
+        },
+    }
+
+
+def _make_duplicate(rng: random.Random, original: dict, duplicate: dict) -> None:
+    """Копирует в контакт признаки оригинала, по которым его найдёт один из блоков."""
+    original_fields = {f["field_id"]: f for f in original["custom_fields_values"]}
+    duplicate_fields = {f["field_id"]: f for f in duplicate["custom_fields_values"]}
+    kind = rng.choice(["phone", "email", "name_city"])
+    if kind == "phone":
+        duplicate_fields[PHONE_FIELD_ID]["values"] = [
+            dict(value) for value in original_fields[PHONE_FIELD_ID]["values"]
+        ]
+    elif kind == "email":
+        # Тот же email в другом регистре
+        value = original_fields[EMAIL_FIELD_ID]["values"][0]["value"]
+        duplicate_fields[EMAIL_FIELD_ID]["values"] = [
+            {"value": value.upper(), "enum_code": "WORK"}
+        ]
+    else:
+        duplicate["name"] = f"  {original['name'].upper()} "
+        duplicate_fields[CITY_FIELD_ID]["values"] = [
+            dict(value) for value in original_fields[CITY_FIELD_ID]["values"]
+        ]
+
+
+def generate_contacts(profile: AccountProfile) -> list[dict]:
+    rng = random.Random(profile.seed)
+    contacts = []
+    for contact_id in range(1, profile.contacts + 1):
+        contact = _contact(rng, contact_id, profile)
+        if contacts and rng.random() < profile.duplicate_rate:
+            _make_duplicate(rng, rng.choice(contacts), contact)
+        contacts.append(contact)
+    return contacts
+
+
+def generate_blocks(profile: AccountProfile, contacts: list[dict]) -> list[dict]:
+    """
+    Блоки настроек в формате, который получает DuplicateFinderService:
+    телефон, email и пара имя + город. В исключения телефона попадают
+    и реальные номера контактов, и номера, которых в аккаунте нет.
+    """
+    rng = random.Random(profile.seed + 1)
+    # Значения сравниваются с исключениями после нормализации
+    phones = [
+        normalize_phone(field["values"][0]["value"])
+        for contact in rng.sample(contacts, min(len(contacts), profile.exclusions // 2))
+        for field in contact["custom_fields_values"]
+        if field["field_id"] == PHONE_FIELD_ID and field["values"]
+    ]
+    phones += [
+        normalize_phone(_phone(rng)) for _ in range(profile.exclusions - len(phones))
+    ]
+    return [
+        {
+            "db_id": 1,
+            "fields": [
+                {
+                    "field_name": "Телефон",
+                    "exclusion_fields": [{"value": phone} for phone in phones],
+                }
+            ],
+        },
+        {"db_id": 2, "fields": [{"field_name": "Email"}]},
+        {"db_id": 3, "fields": [{"field_name": "name"}, {"field_name": "Город"}]},
+    ]
+
+
+def generate_priority_fields() -> list[str]:
+    return ["name", "Город", "Поле 0"]
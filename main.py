@@ -1,41 +1,52 @@
 import asyncio
 from contextlib import asynccontextmanager
 import uvicorn
-from fastapi import FastAPI
+from fastapi import FastAPI, Response
 from starlette.middleware.cors import CORSMiddleware
 from loguru import logger
+from src.admin.router import router as admin_router
+from src.common.config import EMBEDDED_CONSUMERS
+from src.common.log_config import setup_logging, shutdown_logging
+from src.common.metrics import render_metrics
 from src.containers import ApplicationContainer
+from src.lifecycle import (
+    close_resources,
+    prepare_infrastructure,
+    start_background_tasks,
+)
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Управление жизненным циклом FastAPI."""
-    # setup_logging()
+    setup_logging()
     container = ApplicationContainer()
-    db_manager = container.database.db_manager()
-    rabbitmq_manager = container.rabbitmq_manager()
+    if not EMBEDDED_CONSUMERS:
+        # Консьюмеры и миграции запускает отдельный процесс run_consumers.py
+        try:
+            yield
+        finally:
+            shutdown_logging()
+        return
 
-    await db_manager.wait_for_db()
-    await db_manager.run_migrations()
+    rabbitmq_manager = container.rabbitmq_manager()
+    await prepare_infrastructure(container)
 
-    consumers_task = asyncio.create_task(rabbitmq_manager.start_all_consumers())
+    background_tasks = start_background_tasks(container)
+    consumers_task = asyncio.create_task(rabbitmq_manager.start_consumers())
 
     logger.info("Все консьюмеры запущены.")
 
     try:
         yield
     finally:
-        logger.info("Остановка консьюмеров...")
+        await rabbitmq_manager.stop_consumers()
         consumers_task.cancel()
-        await asyncio.gather(consumers_task, return_exceptions=True)
-
-        logger.info("Закрытие соединения с БД...")
-        await db_manager.close()
-
-        logger.info("Закрытие соединения с RabbitMQ...")
-        await rabbitmq_manager.connection_manager.close()
-
-        logger.info("Все ресурсы успешно освобождены.")
+        for task in background_tasks:
+            task.cancel()
+        await asyncio.gather(consumers_task, *background_tasks, return_exceptions=True)
+        await close_resources(container)
+        shutdown_logging()
 
 
 app = FastAPI(
@@ -55,6 +66,15 @@ app.add_middleware(
 )
 
 
+app.include_router(admin_router)
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    content, content_type = render_metrics()
+    return Response(content=content, media_type=content_type)
+
+
 @app.post("/test_log")
 async def test_log():
     logger.info("Test log message")
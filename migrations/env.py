@@ -19,7 +19,11 @@ config.set_section_option(section, "DB_USER", DB_USER)
 config.set_section_option(section, "DB_NAME", DB_NAME)
 config.set_section_option(section, "DB_PASS", DB_PASS)
 
-if config.config_file_name is not None:
+# При запуске из приложения соединение передаётся через config.attributes,
+# а логирование приложения не перенастраивается
+connection = config.attributes.get("connection")
+
+if config.config_file_name is not None and connection is None:
     fileConfig(config.config_file_name)
 
 target_metadata = Base.metadata
@@ -75,7 +79,10 @@ async def run_async_migrations() -> None:
 
 def run_migrations_online() -> None:
     """Run migrations in 'online' mode."""
-    asyncio.run(run_async_migrations())
+    if connection is not None:
+        do_run_migrations(connection)
+    else:
+        asyncio.run(run_async_migrations())
 
 
 if context.is_offline_mode():
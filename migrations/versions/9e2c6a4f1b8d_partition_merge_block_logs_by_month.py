@@ -0,0 +1,109 @@
+"""Partition merge_block_logs by month
+
+Revision ID: 9e2c6a4f1b8d
+Revises: d5f08b3e6c17
+Create Date: 2026-10-19 15:32:18.094512
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9e2c6a4f1b8d'
+down_revision: Union[str, None] = 'd5f08b3e6c17'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Сколько месяцев вперёд создаются партиции при миграции
+PARTITIONS_AHEAD = 3
+
+
+def upgrade() -> None:
+    op.drop_index('ix_merge_block_logs_subdomain_contact_id', table_name='merge_block_logs')
+    op.execute("ALTER TABLE merge_block_logs RENAME TO merge_block_logs_old")
+    op.execute("ALTER TABLE merge_block_logs_old RENAME CONSTRAINT merge_block_logs_pkey TO merge_block_logs_old_pkey")
+    op.execute("ALTER TABLE merge_block_logs_old ALTER COLUMN id DROP DEFAULT")
+
+    op.execute(
+        """
+        CREATE TABLE merge_block_logs (
+            id INTEGER NOT NULL DEFAULT nextval('merge_block_logs_id_seq'),
+            subdomain VARCHAR(256) NOT NULL,
+            block_id INTEGER NOT NULL REFERENCES blocks (id) ON DELETE CASCADE,
+            contact_id VARCHAR(256) NOT NULL,
+            created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+            CONSTRAINT merge_block_logs_pkey PRIMARY KEY (id, created_at)
+        ) PARTITION BY RANGE (created_at)
+        """
+    )
+    op.execute("ALTER SEQUENCE merge_block_logs_id_seq OWNED BY merge_block_logs.id")
+    op.execute("CREATE TABLE merge_block_logs_default PARTITION OF merge_block_logs DEFAULT")
+
+    # Помесячные партиции от самой старой записи до PARTITIONS_AHEAD месяцев вперёд
+    op.execute(
+        f"""
+        DO $$
+        DECLARE
+            month_start DATE := date_trunc(
+                'month', COALESCE((SELECT min(created_at) FROM merge_block_logs_old), now())
+            );
+            last_month DATE := date_trunc('month', now()) + INTERVAL '{PARTITIONS_AHEAD} months';
+        BEGIN
+            WHILE month_start <= last_month LOOP
+                EXECUTE format(
+                    'CREATE TABLE IF NOT EXISTS %I PARTITION OF merge_block_logs '
+                    'FOR VALUES FROM (%L) TO (%L)',
+                    'merge_block_logs_p' || to_char(month_start, 'YYYYMM'),
+                    month_start,
+                    month_start + INTERVAL '1 month'
+                );
+                month_start := month_start + INTERVAL '1 month';
+            END LOOP;
+        END $$
+        """
+    )
+    op.execute(
+        """
+        INSERT INTO merge_block_logs (id, subdomain, block_id, contact_id, created_at)
+        SELECT id, subdomain, block_id, contact_id, created_at FROM merge_block_logs_old
+        """
+    )
+    op.drop_table('merge_block_logs_old')
+    op.create_index(
+        'ix_merge_block_logs_subdomain_contact_created',
+        'merge_block_logs',
+        ['subdomain', 'contact_id', sa.text('created_at DESC')],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    op.execute(
+        """
+        CREATE TABLE merge_block_logs_old (
+            id INTEGER NOT NULL,
+            subdomain VARCHAR(256) NOT NULL,
+            block_id INTEGER NOT NULL REFERENCES blocks (id) ON DELETE CASCADE,
+            contact_id VARCHAR(256) NOT NULL,
+            created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+            CONSTRAINT merge_block_logs_old_pkey PRIMARY KEY (id)
+        )
+        """
+    )
+    op.execute(
+        """
+        INSERT INTO merge_block_logs_old (id, subdomain, block_id, contact_id, created_at)
+        SELECT id, subdomain, block_id, contact_id, created_at FROM merge_block_logs
+        """
+    )
+    op.execute("ALTER SEQUENCE merge_block_logs_id_seq OWNED BY merge_block_logs_old.id")
+    op.execute("ALTER TABLE merge_block_logs ALTER COLUMN id DROP DEFAULT")
+    # Вместе с родительской таблицей удаляются все партиции
+    op.drop_table('merge_block_logs')
+    op.execute("ALTER TABLE merge_block_logs_old RENAME TO merge_block_logs")
+    op.execute("ALTER TABLE merge_block_logs RENAME CONSTRAINT merge_block_logs_old_pkey TO merge_block_logs_pkey")
+    op.execute("ALTER TABLE merge_block_logs ALTER COLUMN id SET DEFAULT nextval('merge_block_logs_id_seq')")
+    op.create_index('ix_merge_block_logs_subdomain_contact_id', 'merge_block_logs', ['subdomain', 'contact_id'], unique=False)
@@ -0,0 +1,228 @@
+"""
+Запуск консьюмеров RabbitMQ отдельно от FastAPI-приложения.
+
+Главный процесс один раз ждёт БД, применяет миграции и объявляет очереди,
+затем запускает процессы-обработчики и перезапускает упавшие.
+SIGTERM/SIGINT пересылается обработчикам, которые корректно завершаются.
+
+Примеры:
+    python run_consumers.py --workers 4
+    python run_consumers.py --workers 2 --queues duplicate_contacts_merge_single --concurrency 20
+    python run_consumers.py \\
+        --process duplicate_contacts_merge_single:20 \\
+        --process duplicate_contacts_merge_all,duplicate_contacts_save_settings
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import signal
+import time
+from dataclasses import dataclass
+
+from loguru import logger
+
+from src.common import tracing
+from src.common.config import (
+    CONSUMER_QUEUES,
+    CONSUMER_STOP_TIMEOUT,
+    CONSUMER_WORKERS,
+    METRICS_PORT,
+)
+from src.common.log_config import setup_logging, shutdown_logging
+from src.common.metrics import reset_multiprocess_dir, start_metrics_server
+from src.containers import ApplicationContainer
+from src.lifecycle import (
+    close_resources,
+    prepare_infrastructure,
+    start_background_tasks,
+)
+
+# Пауза перед перезапуском упавшего процесса, секунд
+RESTART_DELAY = 5
+
+
+@dataclass
+class WorkerSpec:
+    """Очереди и параллелизм одного процесса-обработчика."""
+
+    index: int
+    queues: list[str]
+    concurrency: int | None = None
+    # Возврат из DLQ выполняет только один процесс
+    redrive: bool = False
+
+
+def parse_process(index: int, value: str) -> WorkerSpec:
+    """Разбирает описание процесса вида "queue_a,queue_b:20"."""
+    queues, _, concurrency = value.partition(":")
+    return WorkerSpec(
+        index=index,
+        queues=[queue.strip() for queue in queues.split(",") if queue.strip()],
+        concurrency=int(concurrency) if concurrency else None,
+    )
+
+
+def parse_args() -> list[WorkerSpec]:
+    parser = argparse.ArgumentParser(description="Консьюмеры RabbitMQ")
+    parser.add_argument(
+        "--workers", type=int, default=CONSUMER_WORKERS, help="Число процессов"
+    )
+    parser.add_argument(
+        "--queues",
+        default=",".join(CONSUMER_QUEUES),
+        help="Очереди через запятую; по умолчанию все",
+    )
+    parser.add_argument(
+        "--concurrency", type=int, default=None, help="Параллелизм каждой очереди"
+    )
+    parser.add_argument(
+        "--process",
+        action="append",
+        default=[],
+        help='Отдельный процесс: "queue_a,queue_b[:concurrency]"; можно повторять',
+    )
+    args = parser.parse_args()
+
+    if args.process:
+        specs = [parse_process(i, value) for i, value in enumerate(args.process)]
+    else:
+        specs = [
+            parse_process(i, args.queues) for i in range(max(1, args.workers))
+        ]
+        for spec in specs:
+            spec.concurrency = args.concurrency
+    specs[0].redrive = True
+    return specs
+
+
+async def run_worker(spec: WorkerSpec):
+    """Запускает консьюмеры процесса и останавливает их по SIGTERM."""
+    # Спаны экспортирует каждый процесс сам: у spawn-процесса свой провайдер
+    tracing.configure()
+    container = ApplicationContainer()
+    rabbitmq_manager = container.rabbitmq_manager()
+
+    consumers = [
+        consumer
+        for consumer in container.consumers.consumers()
+        if not spec.queues or consumer.queue_name in spec.queues
+    ]
+    unknown = set(spec.queues) - {consumer.queue_name for consumer in consumers}
+    if unknown:
+        raise ValueError(f"Неизвестные очереди: {sorted(unknown)}")
+    if spec.concurrency:
+        for consumer in consumers:
+            consumer.concurrency = spec.concurrency
+
+    background_tasks = start_background_tasks(container)
+    consumers_task = asyncio.create_task(
+        rabbitmq_manager.start_consumers(consumers, redrive=spec.redrive)
+    )
+    stop_event = asyncio.Event()
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stop_event.set)
+
+    try:
+        await asyncio.wait(
+            {consumers_task, asyncio.create_task(stop_event.wait())},
+            return_when=asyncio.FIRST_COMPLETED,
+        )
+        logger.info(f"Процесс консьюмеров #{spec.index} останавливается...")
+        await rabbitmq_manager.stop_consumers()
+    finally:
+        consumers_task.cancel()
+        for task in background_tasks:
+            task.cancel()
+        await asyncio.gather(consumers_task, *background_tasks, return_exceptions=True)
+        await close_resources(container)
+
+
+def worker_main(spec: WorkerSpec):
+    # Ctrl+C приходит всей группе процессов; останавливает обработчики главный процесс
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # У spawn-процесса свои sink'и loguru и свой поток отправки логов
+    setup_logging()
+    logger.info(f"Процесс консьюмеров #{spec.index} запущен: {spec.queues or 'все очереди'}")
+    try:
+        asyncio.run(run_worker(spec))
+    finally:
+        shutdown_logging()
+
+
+class WorkerSupervisor:
+    """Запускает процессы-обработчики, перезапускает упавшие и останавливает все по сигналу."""
+
+    def __init__(self, specs: list[WorkerSpec]):
+        self.specs = specs
+        self.context = multiprocessing.get_context("spawn")
+        self.processes: dict[int, multiprocessing.Process] = {}
+        self.stopping = False
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self._on_signal)
+        signal.signal(signal.SIGINT, self._on_signal)
+
+        for spec in self.specs:
+            self._start(spec)
+
+        while not self.stopping:
+            for spec in self.specs:
+                process = self.processes[spec.index]
+                if not process.is_alive() and not self.stopping:
+                    logger.error(
+                        f"Процесс консьюмеров #{spec.index} завершился с кодом "
+                        f"{process.exitcode}, перезапуск через {RESTART_DELAY} с"
+                    )
+                    time.sleep(RESTART_DELAY)
+                    if not self.stopping:
+                        self._start(spec)
+            time.sleep(1)
+
+        self._stop()
+
+    def _start(self, spec: WorkerSpec):
+        process = self.context.Process(
+            target=worker_main, args=(spec,), name=f"consumers-{spec.index}"
+        )
+        process.start()
+        self.processes[spec.index] = process
+
+    def _on_signal(self, signum, frame):
+        logger.info(f"Получен сигнал {signal.Signals(signum).name}, остановка процессов...")
+        self.stopping = True
+
+    def _stop(self):
+        for process in self.processes.values():
+            if process.is_alive():
+                process.terminate()  # SIGTERM
+
+        deadline = time.monotonic() + CONSUMER_STOP_TIMEOUT
+        for process in self.processes.values():
+            process.join(max(0.0, deadline - time.monotonic()))
+            if process.is_alive():
+                logger.warning(f"Процесс {process.name} не остановился вовремя, kill")
+                process.kill()
+                process.join()
+        logger.info("Все процессы консьюмеров остановлены.")
+
+
+async def prepare():
+    container = ApplicationContainer()
+    try:
+        await prepare_infrastructure(container)
+    finally:
+        await close_resources(container)
+
+
+if __name__ == "__main__":
+    worker_specs = parse_args()
+    setup_logging()
+    reset_multiprocess_dir()
+    if METRICS_PORT:
+        # Метрики процессов-обработчиков собираются из PROMETHEUS_MULTIPROC_DIR
+        start_metrics_server(METRICS_PORT)
+    asyncio.run(prepare())
+    try:
+        WorkerSupervisor(worker_specs).run()
+    finally:
+        shutdown_logging()
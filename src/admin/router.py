@@ -0,0 +1,54 @@
+import re
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from fastapi.responses import FileResponse
+
+from src.common import profiling
+from src.common.config import ADMIN_TOKEN
+
+SUBDOMAIN_PATTERN = re.compile(r"^[a-z0-9][a-z0-9-]*$")
+
+
+def check_admin_token(x_admin_token: str = Header(default="")):
+    """Пропускает запрос только с верным X-Admin-Token; без ADMIN_TOKEN эндпоинты отключены."""
+    if not ADMIN_TOKEN or x_admin_token != ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+
+router = APIRouter(
+    prefix="/admin", dependencies=[Depends(check_admin_token)], include_in_schema=False
+)
+
+
+@router.get("/profiling")
+async def get_profiling(limit: int = Query(default=100, ge=1, le=1000)):
+    """Subdomain с включённым профилированием и последние профили."""
+    return {
+        "enabled": profiling.toggles.active(),
+        "profiles": profiling.list_profiles(limit),
+    }
+
+
+@router.put("/profiling/{subdomain}")
+async def enable_profiling(subdomain: str, ttl: int = Query(default=600, ge=1, le=86400)):
+    """Профилировать все сообщения subdomain в течение ttl секунд."""
+    if not SUBDOMAIN_PATTERN.match(subdomain):
+        raise HTTPException(status_code=422, detail="Invalid subdomain")
+    return {"subdomain": subdomain, "until": profiling.toggles.enable(subdomain, ttl)}
+
+
+@router.delete("/profiling/{subdomain}")
+async def disable_profiling(subdomain: str):
+    if not SUBDOMAIN_PATTERN.match(subdomain):
+        raise HTTPException(status_code=422, detail="Invalid subdomain")
+    profiling.toggles.disable(subdomain)
+    return {"subdomain": subdomain}
+
+
+@router.get("/profiling/profiles/{name}")
+async def download_profile(name: str, format: str = Query(default="html", pattern="^(html|json)$")):
+    """Отчёт pyinstrument (html) или время по этапам (json)."""
+    path = profiling.profile_path(name, format)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(path, filename=path.name)
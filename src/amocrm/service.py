@@ -4,20 +4,42 @@ import aiohttp
 from aiohttp import ClientSession
 from loguru import logger
 
-from src.common.exceptions import NetworkError, AmoCRMServiceError
+from src.common import tracing
+from src.common.config import AMOCRM_BASE_URL
+from src.common.exceptions import (
+    NetworkError,
+    AmoCRMServiceError,
+    RateLimitError,
+    TokenError,
+)
+from src.common.metrics import (
+    AMOCRM_PAGES_FETCHED,
+    normalize_endpoint,
+    observe_amocrm_request,
+)
+from src.common.token_service import TokenService
 
 
 class AmocrmService:
     """Сервис для работы с API amoCRM."""
 
-    def __init__(self, client_session: ClientSession):
+    def __init__(
+        self, client_session: ClientSession, token_service: TokenService | None = None
+    ):
         self.client_session = client_session
+        self.token_service = token_service
+
+    def _handle_unauthorized(self, subdomain: str, error_message: str):
+        """Сбрасывает закэшированный токен и поднимает ошибку для retry с новым токеном."""
+        if self.token_service:
+            self.token_service.invalidate(subdomain)
+        raise TokenError(f"Токен отклонён amoCRM (401): {error_message}")
 
     async def request(
         self, method: str, subdomain: str, access_token: str, endpoint: str, **kwargs
     ) -> any:
         log = logger.bind(subdomain=subdomain, endpoint=endpoint)
-        base_url = f"https://{subdomain}.amocrm.ru"
+        base_url = AMOCRM_BASE_URL.format(subdomain=subdomain)
         url = f"{base_url}{endpoint}"
         headers = {
             "Host": f"{subdomain}.amocrm.ru",
@@ -26,21 +48,36 @@ class AmocrmService:
         }
 
         try:
-            async with self.client_session.request(
-                method, url, headers=headers, **kwargs
-            ) as response:
-                if response.status in [200, 201, 202]:
-                    log.debug(f"Успешный запрос: {method} {url}")
-                    return await response.json()
-                elif response.status == 204:
-                    log.warning(f"Нет данных (204) для {url}")
-                    return []
-                else:
-                    error_message = await response.text()
-                    log.error(f"Ошибка {response.status} для {url}: {error_message}")
-                    raise AmoCRMServiceError(
-                        f"Ошибка API: {response.status} - {error_message}"
-                    )
+            with observe_amocrm_request(method, endpoint) as observed, tracing.span(
+                f"amocrm {method} {normalize_endpoint(endpoint)}",
+                kind=tracing.SpanKind.CLIENT,
+                attributes={
+                    "http.request.method": method,
+                    "url.path": endpoint,
+                    "subdomain": subdomain,
+                },
+            ) as span:
+                async with self.client_session.request(
+                    method, url, headers=headers, **kwargs
+                ) as response:
+                    observed["status"] = response.status
+                    span.set_attribute("http.response.status_code", response.status)
+                    if response.status in [200, 201, 202]:
+                        log.debug(f"Успешный запрос: {method} {url}")
+                        return await response.json()
+                    elif response.status == 204:
+                        log.warning(f"Нет данных (204) для {url}")
+                        return []
+                    else:
+                        error_message = await response.text()
+                        log.error(f"Ошибка {response.status} для {url}: {error_message}")
+                        if response.status == 401:
+                            self._handle_unauthorized(subdomain, error_message)
+                        if response.status == 429:
+                            raise RateLimitError(f"Лимит запросов amoCRM: {error_message}")
+                        raise AmoCRMServiceError(
+                            f"Ошибка API: {response.status} - {error_message}"
+                        )
         except aiohttp.ClientError as e:
             log.error(f"Сетевая ошибка при запросе {url}: {e}")
             raise NetworkError(f"Сетевая ошибка: {e}")
@@ -66,6 +103,7 @@ class AmocrmService:
         total_items = first_response.get("_total_items", 0)
         total_pages = (total_items // limit) + (1 if total_items % limit > 0 else 0)
 
+        AMOCRM_PAGES_FETCHED.labels(subdomain).inc()
         if total_pages <= 1:
             log.info(f"Получено {len(all_contacts)} контактов на 1 странице")
             return all_contacts
@@ -81,6 +119,7 @@ class AmocrmService:
             for p in range(2, total_pages + 1)
         ]
         responses = await asyncio.gather(*tasks)
+        AMOCRM_PAGES_FETCHED.labels(subdomain).inc(len(responses))
         for response in responses:
             contacts = response.get("_embedded", {}).get("contacts", [])
             all_contacts.extend(contacts)
@@ -89,12 +128,17 @@ class AmocrmService:
         return all_contacts
 
     async def get_contact_by_id(
-        self, subdomain: str, access_token: str, contact_id: int
+        self,
+        subdomain: str,
+        access_token: str,
+        contact_id: int,
+        with_leads: bool = False,
     ) -> dict[str, any]:
         """Получает информацию о контакте по его ID."""
-        return await self.request(
-            "GET", subdomain, access_token, f"/api/v4/contacts/{contact_id}"
-        )
+        endpoint = f"/api/v4/contacts/{contact_id}"
+        if with_leads:
+            endpoint += "?with=leads"
+        return await self.request("GET", subdomain, access_token, endpoint)
 
     async def get_leads_by_filter(
         self,
@@ -152,7 +196,8 @@ class AmocrmService:
         self, subdomain: str, access_token: str, result_element: dict
     ) -> dict[str, any]:
         log = logger.bind(subdomain=subdomain)
-        url = f"https://{subdomain}.amocrm.ru/ajax/merge/contacts/save"
+        base_url = AMOCRM_BASE_URL.format(subdomain=subdomain)
+        url = f"{base_url}/ajax/merge/contacts/save"
         headers = {
             "Host": f"{subdomain}.amocrm.ru",
             "Content-Type": "application/x-www-form-urlencoded",
@@ -161,18 +206,35 @@ class AmocrmService:
         }
 
         try:
-            async with self.client_session.post(
-                url, data=result_element, headers=headers
-            ) as response:
-                if response.status != 202:
-                    error_message = await response.text()
-                    log.error(
-                        f"Ошибка слияния контактов: {response.status} - {error_message}"
-                    )
-                    raise AmoCRMServiceError(f"Ошибка слияния: {error_message}")
-                result = await response.json()
-                log.info(f"Контакты успешно объединены: {result_element['id[]']}")
-                return result
+            with observe_amocrm_request(
+                "POST", "/ajax/merge/contacts/save"
+            ) as observed, tracing.span(
+                "amocrm POST /ajax/merge/contacts/save",
+                kind=tracing.SpanKind.CLIENT,
+                attributes={
+                    "http.request.method": "POST",
+                    "url.path": "/ajax/merge/contacts/save",
+                    "subdomain": subdomain,
+                },
+            ) as span:
+                async with self.client_session.post(
+                    url, data=result_element, headers=headers
+                ) as response:
+                    observed["status"] = response.status
+                    span.set_attribute("http.response.status_code", response.status)
+                    if response.status != 202:
+                        error_message = await response.text()
+                        log.error(
+                            f"Ошибка слияния контактов: {response.status} - {error_message}"
+                        )
+                        if response.status == 401:
+                            self._handle_unauthorized(subdomain, error_message)
+                        if response.status == 429:
+                            raise RateLimitError(f"Лимит запросов amoCRM: {error_message}")
+                        raise AmoCRMServiceError(f"Ошибка слияния: {error_message}")
+                    result = await response.json()
+                    log.info(f"Контакты успешно объединены: {result_element['id[]']}")
+                    return result
         except aiohttp.ClientError as e:
             log.error(f"Сетевая ошибка при слиянии: {e}")
             raise NetworkError(f"Сетевая ошибка: {e}")
@@ -1,9 +1,13 @@
 from dotenv import load_dotenv
+import json
 import os
 
 load_dotenv()
 
 CLIENT_ID = os.environ.get("CLIENT_ID")
+# Адрес API amoCRM; {subdomain} подставляется. Для нагрузочных тестов
+# указывается локальная заглушка, например http://127.0.0.1:8081
+AMOCRM_BASE_URL = os.environ.get("AMOCRM_BASE_URL", "https://{subdomain}.amocrm.ru")
 
 DB_HOST = os.environ.get("DB_HOST")
 DB_PORT = os.environ.get("DB_PORT")
@@ -19,3 +23,154 @@ RMQ_VHOST = os.environ.get("RMQ_VHOST")
 
 CONNECTION_URL_RMQ = f"amqp://{RMQ_USER}:{RMQ_PASSWORD}@{RMQ_HOST}:{RMQ_PORT}/{RMQ_VHOST}"
 CONNECTION_URL_DB = f"postgresql+asyncpg://{DB_USER}:{DB_PASS}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+
+# Размер чанка при древовидной склейке больших групп дублей
+MERGE_CHUNK_SIZE = max(2, int(os.environ.get("MERGE_CHUNK_SIZE", 50)))
+# Сколько чанков одного уровня склеиваются параллельно
+MERGE_CHUNK_CONCURRENCY = int(os.environ.get("MERGE_CHUNK_CONCURRENCY", 5))
+
+# Сколько секунд помнить контакты, поглощённые при склейке
+MERGED_CONTACT_TTL = int(os.environ.get("MERGED_CONTACT_TTL", 3600))
+
+# Сколько месяцев хранить партиции merge_block_logs; 0 — хранить всё
+MERGE_LOG_RETENTION_MONTHS = int(os.environ.get("MERGE_LOG_RETENTION_MONTHS", 12))
+# На сколько месяцев вперёд заранее создаются партиции
+MERGE_LOG_PARTITIONS_AHEAD = int(os.environ.get("MERGE_LOG_PARTITIONS_AHEAD", 3))
+# Сколько строк партиции по умолчанию удалять за один DELETE и за один проход
+MERGE_LOG_DEFAULT_DELETE_BATCH = int(
+    os.environ.get("MERGE_LOG_DEFAULT_DELETE_BATCH", 5000)
+)
+MERGE_LOG_DEFAULT_DELETE_MAX = int(os.environ.get("MERGE_LOG_DEFAULT_DELETE_MAX", 100000))
+# Период обслуживания партиций, секунд
+MERGE_LOG_MAINTENANCE_INTERVAL = int(
+    os.environ.get("MERGE_LOG_MAINTENANCE_INTERVAL", 3600)
+)
+
+# Страховочный TTL кэша настроек дублей (основной сброс — по NOTIFY), секунд
+SETTINGS_CACHE_TTL = int(os.environ.get("SETTINGS_CACHE_TTL", 600))
+
+
+def _int_mapping(env_name: str) -> dict[str, int]:
+    """Разбирает переменную вида "name=1,other=2" в словарь."""
+    return {
+        name.strip(): int(value)
+        for name, value in (
+            item.split("=", 1)
+            for item in os.environ.get(env_name, "").split(",")
+            if "=" in item
+        )
+    }
+
+
+# Сколько сообщений каждая очередь обрабатывает одновременно
+CONSUMER_CONCURRENCY = int(os.environ.get("CONSUMER_CONCURRENCY", 10))
+# Переопределения по очередям: "duplicate_contacts_merge_all=2,duplicate_contacts_merge_single=20"
+QUEUE_CONCURRENCY = _int_mapping("CONSUMER_QUEUE_CONCURRENCY")
+# prefetch_count = concurrency * множитель: запас сообщений разных subdomain для планировщика
+CONSUMER_PREFETCH_MULTIPLIER = int(os.environ.get("CONSUMER_PREFETCH_MULTIPLIER", 3))
+# Сколько сообщений одного subdomain очередь обрабатывает одновременно
+TENANT_CONCURRENCY = int(os.environ.get("TENANT_CONCURRENCY", 2))
+QUEUE_TENANT_CONCURRENCY = _int_mapping("CONSUMER_QUEUE_TENANT_CONCURRENCY")
+# Сколько ожидающих сообщений одного subdomain консьюмер держит сверх выполняемых
+# (кратно tenant_concurrency); остальные откладываются, чтобы не занимать prefetch
+TENANT_BACKLOG_MULTIPLIER = int(os.environ.get("TENANT_BACKLOG_MULTIPLIER", 5))
+# Сколько раз сообщение можно отложить (заголовок x-deferred); дальше оно ждёт
+# очереди subdomain в консьюмере, а не уходит в очередь задержки снова
+TENANT_MAX_DEFERRALS = int(os.environ.get("TENANT_MAX_DEFERRALS", 3))
+# Веса subdomain в планировщике: "bigclient=3" — три сообщения за круг вместо одного
+TENANT_WEIGHTS = _int_mapping("TENANT_WEIGHTS")
+
+# Количество долгоживущих каналов публикации в RMQPublisher
+RMQ_PUBLISHER_CHANNELS = int(os.environ.get("RMQ_PUBLISHER_CHANNELS", 4))
+# Таймаут ожидания publisher confirm, секунд
+RMQ_PUBLISH_TIMEOUT = float(os.environ.get("RMQ_PUBLISH_TIMEOUT", 10))
+
+# Максимальное время жизни токена в кэше TokenService, секунд
+TOKEN_CACHE_TTL = int(os.environ.get("TOKEN_CACHE_TTL", 900))
+# За сколько секунд до истечения токен обновляется в фоне
+TOKEN_REFRESH_MARGIN = int(os.environ.get("TOKEN_REFRESH_MARGIN", 120))
+
+# Повторы с экспоненциальной задержкой: base, base*2, base*4, ... (мс)
+RETRY_MAX_ATTEMPTS = int(os.environ.get("RETRY_MAX_ATTEMPTS", 5))
+RETRY_BASE_DELAY_MS = int(os.environ.get("RETRY_BASE_DELAY_MS", 2000))
+
+# Окно накопления сообщений merge_single одного subdomain перед общей обработкой
+MERGE_SINGLE_DEBOUNCE_SECONDS = float(
+    os.environ.get("MERGE_SINGLE_DEBOUNCE_SECONDS", 2.0)
+)
+# Максимальный размер пакета; он же параллелизм очереди merge_single по умолчанию
+MERGE_SINGLE_BATCH_SIZE = int(os.environ.get("MERGE_SINGLE_BATCH_SIZE", 50))
+
+# Шардирование очередей склейки по subdomain (x-consistent-hash); 0 — выключено
+RMQ_SHARD_COUNT = int(os.environ.get("RMQ_SHARD_COUNT", 0))
+# Шарды, которые обрабатывает эта реплика: "0,1". Если не заданы, шарды
+# распределяются по номеру реплики: реплике RMQ_REPLICA_INDEX из RMQ_REPLICA_COUNT
+# достаются шарды с shard_id % RMQ_REPLICA_COUNT == RMQ_REPLICA_INDEX.
+# При RMQ_SHARD_COUNT > 0 консьюмеры не запустятся без одного из этих вариантов
+RMQ_SHARD_IDS = [
+    int(shard_id)
+    for shard_id in os.environ.get("RMQ_SHARD_IDS", "").split(",")
+    if shard_id.strip()
+]
+RMQ_REPLICA_INDEX = int(os.environ.get("RMQ_REPLICA_INDEX") or -1)
+RMQ_REPLICA_COUNT = int(os.environ.get("RMQ_REPLICA_COUNT", 0))
+
+# Параметры основных очередей по умолчанию
+RMQ_QUEUE_MAX_LENGTH = int(os.environ.get("RMQ_QUEUE_MAX_LENGTH", 10000))
+# Политика переполнения: reject-publish-dlx (паблишер получает nack, а сообщения из
+# очередей задержки уходят в DLQ), reject-publish (сообщения повторов теряются), drop-head
+RMQ_QUEUE_OVERFLOW = os.environ.get("RMQ_QUEUE_OVERFLOW", "reject-publish-dlx")
+# TTL сообщений основной очереди, мс; 0 — без TTL
+RMQ_QUEUE_MESSAGE_TTL = int(os.environ.get("RMQ_QUEUE_MESSAGE_TTL", 0))
+# Lazy-очереди держат сообщения на диске, а не в памяти брокера
+RMQ_QUEUE_LAZY = os.environ.get("RMQ_QUEUE_LAZY", "true").lower() == "true"
+# Переопределения по очередям, JSON:
+# {"duplicate_contacts_merge_single": {"max_length": 50000, "overflow": "reject-publish", "message_ttl": 0, "lazy": true, "redrive": true}}
+RMQ_QUEUE_SETTINGS = json.loads(os.environ.get("RMQ_QUEUE_SETTINGS") or "{}")
+
+# Management API для применения политик очередей (src.rabbitmq.policies),
+# например http://rabbitmq:15672; пусто — политики применяются вручную
+RMQ_MANAGEMENT_URL = os.environ.get("RMQ_MANAGEMENT_URL", "")
+
+# Автоматический возврат сообщений из DLQ в основные очереди
+RMQ_REDRIVE_ENABLED = os.environ.get("RMQ_REDRIVE_ENABLED", "true").lower() == "true"
+# Пауза между проходами по DLQ, секунд
+RMQ_REDRIVE_INTERVAL = float(os.environ.get("RMQ_REDRIVE_INTERVAL", 30))
+# Не больше стольких сообщений в секунду и за один проход по очереди
+RMQ_REDRIVE_RATE = float(os.environ.get("RMQ_REDRIVE_RATE", 20))
+RMQ_REDRIVE_BATCH = int(os.environ.get("RMQ_REDRIVE_BATCH", 200))
+# Возвращать, пока основная очередь заполнена меньше чем на эту долю max_length
+RMQ_REDRIVE_FILL_RATIO = float(os.environ.get("RMQ_REDRIVE_FILL_RATIO", 0.5))
+# После стольких возвратов сообщение уходит в parking-очередь
+RMQ_REDRIVE_MAX_COUNT = int(os.environ.get("RMQ_REDRIVE_MAX_COUNT", 3))
+
+# Запускать консьюмеры внутри FastAPI-приложения; false — их запускает run_consumers.py
+EMBEDDED_CONSUMERS = os.environ.get("EMBEDDED_CONSUMERS", "true").lower() == "true"
+# Число процессов-обработчиков run_consumers.py и очереди каждого из них (пусто — все)
+CONSUMER_WORKERS = int(os.environ.get("CONSUMER_WORKERS", 1))
+CONSUMER_QUEUES = [
+    queue.strip()
+    for queue in os.environ.get("CONSUMER_QUEUES", "").split(",")
+    if queue.strip()
+]
+# Сколько секунд run_consumers.py ждёт остановки процессов после SIGTERM
+CONSUMER_STOP_TIMEOUT = float(os.environ.get("CONSUMER_STOP_TIMEOUT", 60))
+# Сколько секунд при остановке ждать завершения обрабатываемых сообщений
+SHUTDOWN_DRAIN_TIMEOUT = float(os.environ.get("SHUTDOWN_DRAIN_TIMEOUT", 30))
+
+# Порт /metrics процесса run_consumers.py; 0 — не поднимать
+METRICS_PORT = int(os.environ.get("METRICS_PORT", 0))
+
+# Каталог профилей сообщений и включений профилирования; общий для app и consumers
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "/tmp/profiles")
+# Сколько последних профилей хранить в PROFILE_DIR (0 — все); старые удаляются при сохранении
+PROFILE_MAX_FILES = int(os.environ.get("PROFILE_MAX_FILES", 200))
+# enabled — семплируется только задача сообщения, disabled — весь поток event loop
+PROFILE_ASYNC_MODE = os.environ.get("PROFILE_ASYNC_MODE", "enabled")
+# Токен админ-эндпоинтов (заголовок X-Admin-Token); пусто — эндпоинты отключены
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN", "")
+
+# Экспорт трассировки: console, file или otlp (OTEL_EXPORTER_OTLP_ENDPOINT); пусто — выключена
+TRACING_EXPORTER = os.environ.get("TRACING_EXPORTER", "").lower()
+TRACING_FILE = os.environ.get("TRACING_FILE", "/tmp/traces.jsonl")
+TRACING_SERVICE_NAME = os.environ.get("TRACING_SERVICE_NAME", "duplicate-contact")
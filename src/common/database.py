@@ -1,22 +1,48 @@
 import asyncio
-import subprocess
+import time
 from contextlib import asynccontextmanager
+from pathlib import Path
 from loguru import logger
 
 import asyncpg
+from alembic import command
+from alembic.config import Config
+from alembic.runtime.migration import MigrationContext
+from alembic.script import ScriptDirectory
+from sqlalchemy import Connection, text
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from src.common import tracing
 from src.common.config import DB_HOST, DB_NAME, DB_PASS, DB_PORT, DB_USER, CONNECTION_URL_DB
+from src.common.metrics import DB_POOL_CHECKOUT_SECONDS
 
 Base = declarative_base()
 
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+# Ключ advisory lock: миграции применяет только одна реплика
+MIGRATION_LOCK_KEY = 7300
+
+
+class InstrumentedAsyncPool(AsyncAdaptedQueuePool):
+    """Пул соединений, измеряющий ожидание свободного соединения при checkout."""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            DB_POOL_CHECKOUT_SECONDS.observe(time.perf_counter() - started)
+
+
 class DatabaseManager:
     def __init__(self, connection_url: str):
         """Инициализируем параметры подключения и движок SQLAlchemy."""
         self.connection_url = connection_url
         self.engine = create_async_engine(
             self.connection_url,
+            poolclass=InstrumentedAsyncPool,
             pool_size=30,
             max_overflow=25,
             echo=False,
@@ -24,6 +50,7 @@ class DatabaseManager:
             pool_recycle=1800,
             pool_pre_ping=True,
         )
+        tracing.instrument_engine(self.engine.sync_engine)
         self.async_session_maker = sessionmaker(
             self.engine, class_=AsyncSession, expire_on_commit=False
         )
@@ -64,12 +91,54 @@ class DatabaseManager:
         logger.error("Database is not available, exiting.")
         exit(1)
 
+    async def run_migrations(self):
+        """
+        Применяет Alembic миграции в текущем процессе, если ревизия БД
+        отстаёт от head. Миграции выполняются в одной транзакции под
+        advisory lock, поэтому при одновременном старте реплик мигрирует одна,
+        а остальные дожидаются её и пропускают уже применённые изменения.
+        """
+        started = time.perf_counter()
+        config = self._alembic_config()
+        head = ScriptDirectory.from_config(config).get_current_head()
+
+        async with self.engine.connect() as connection:
+            current = await connection.run_sync(self._current_revision)
+        if current == head:
+            logger.info(
+                f"Migrations are up to date ({head}), "
+                f"checked in {(time.perf_counter() - started) * 1000:.0f} ms."
+            )
+            return
+
+        logger.info(f"Running database migrations {current} -> {head}...")
+        async with self.engine.begin() as connection:
+            await connection.execute(
+                text("SELECT pg_advisory_xact_lock(:key)"), {"key": MIGRATION_LOCK_KEY}
+            )
+            await connection.run_sync(self._upgrade, config, head)
+        logger.info(
+            f"Migrations completed in {(time.perf_counter() - started) * 1000:.0f} ms."
+        )
+
     @staticmethod
-    async def run_migrations():
-        """Запускает Alembic миграции перед стартом сервиса."""
-        logger.info("Running database migrations...")
-        subprocess.run("alembic upgrade head", shell=True, check=True)
-        logger.info("Migrations completed.")
+    def _alembic_config() -> Config:
+        config = Config(str(PROJECT_ROOT / "alembic.ini"))
+        config.set_main_option("script_location", str(PROJECT_ROOT / "migrations"))
+        return config
+
+    @staticmethod
+    def _current_revision(connection: Connection) -> str | None:
+        return MigrationContext.configure(connection).get_current_revision()
+
+    def _upgrade(self, connection: Connection, config: Config, head: str) -> None:
+        # Другая реплика могла применить миграции, пока мы ждали lock
+        if self._current_revision(connection) == head:
+            logger.info("Migrations were applied by another instance.")
+            return
+        # env.py использует переданное соединение вместо создания своего движка
+        config.attributes["connection"] = connection
+        command.upgrade(config, "head")
 
     async def close(self):
         """Закрывает соединение с БД."""
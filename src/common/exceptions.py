@@ -50,3 +50,15 @@ class TokenError(Exception):
     """Общая ошибка обработки данных."""
 
     pass
+
+
+class RateLimitError(NetworkError):
+    """Превышен лимит запросов к amoCRM (429)."""
+
+    pass
+
+
+class SubdomainLockedError(NetworkError):
+    """Склейка для subdomain уже выполняется в другом процессе."""
+
+    pass
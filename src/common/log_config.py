@@ -1,46 +1,61 @@
-from loguru import logger
-from elasticsearch import AsyncElasticsearch
-import asyncio
+import atexit
 import os
 
+from loguru import logger
+
+from src.common.log_shipper import ElasticsearchBulkSink
+
+# Без LOG_SHIPPING_ENABLED логи остаются в stdout и в Elasticsearch не уходят
+LOG_SHIPPING_ENABLED = os.getenv("LOG_SHIPPING_ENABLED", "false").lower() == "true"
 ELASTICSEARCH_HOST = os.getenv("ELASTICSEARCH_HOST", "http://localhost:9200")
-es_client = AsyncElasticsearch([ELASTICSEARCH_HOST])
 LOG_INDEX = "amocrm-logs"
+# Размер пачки и максимальная задержка отправки логов в Elasticsearch
+LOG_BULK_SIZE = int(os.getenv("LOG_BULK_SIZE", 500))
+LOG_BULK_INTERVAL = float(os.getenv("LOG_BULK_INTERVAL", 2.0))
+# Сверх этого числа ожидающих отправки записей логи отбрасываются
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", 10000))
 
-
-async def elasticsearch_handler(message):
-    """
-    Асинхронный обработчик для отправки логов в Elasticsearch.
-    """
-    record = message.record
-    log_data = {
-        "@timestamp": record["time"].isoformat(),
-        "log.level": record["level"].name,
-        "message": record["message"],
-        "module": record["module"],
-        "function": record["function"],
-        "line": record["line"],
-        "extra": record["extra"],  # Сохраняем дополнительные поля, если они есть
-    }
-    try:
-        await es_client.index(index=LOG_INDEX, document=log_data)
-    except Exception as e:
-        print(f"[Log Error] Failed to send log to Elasticsearch: {e}")
+elasticsearch_sink = ElasticsearchBulkSink(
+    host=ELASTICSEARCH_HOST,
+    index=LOG_INDEX,
+    batch_size=LOG_BULK_SIZE,
+    flush_interval=LOG_BULK_INTERVAL,
+    max_queue_size=LOG_QUEUE_SIZE,
+)
 
 
 def setup_logging():
     """
     Устанавливает loguru-логирование в Elasticsearch:
-    - В Elasticsearch
+    - В Elasticsearch, пачками через _bulk API
+    Вызывается в каждом процессе; без LOG_SHIPPING_ENABLED ничего не делает.
     """
+    if not LOG_SHIPPING_ENABLED:
+        return
+
     logger.remove()  # Удаляем стандартный stdout
 
+    elasticsearch_sink.start()
+    atexit.register(shutdown_logging)
     logger.add(
-        elasticsearch_handler,
+        elasticsearch_sink,
         level="INFO",
-        enqueue=True,
         backtrace=True,
         diagnose=True,
     )
 
     logger.info("✅ Логирование инициализировано.")
+
+
+def shutdown_logging():
+    """
+    Отправляет оставшиеся логи и останавливает отправку в Elasticsearch.
+    Вызывается при остановке процесса до завершения интерпретатора: из atexit
+    поток отправки уже не может резолвить адрес (пул потоков закрыт), поэтому
+    atexit — только запасной вариант.
+    """
+    atexit.unregister(shutdown_logging)
+    elasticsearch_sink.stop()
+    stats = elasticsearch_sink.stats
+    if stats["dropped"] or stats["failed"]:
+        print(f"[Log Error] Elasticsearch log shipping stats: {stats}")
@@ -0,0 +1,51 @@
+import time
+from collections import Counter
+
+from loguru import logger
+
+
+class SkipCounter:
+    """
+    Счётчик повторяющихся событий горячего цикла.
+    Вместо строки лога на каждый контакт события считаются по ключу,
+    а итог выводится одной строкой в конце задачи.
+    """
+
+    def __init__(self):
+        self._counts: Counter[str] = Counter()
+
+    def add(self, key: str) -> None:
+        self._counts[key] += 1
+
+    def flush(self, message: str, level: str = "DEBUG", log=logger) -> None:
+        """Логирует накопленные счётчики как "message: {ключ: число}" и обнуляет их."""
+        if not self._counts:
+            return
+        counts, self._counts = dict(self._counts.most_common()), Counter()
+        # opt(depth=1): в логе указывается место вызова flush, а не этот модуль
+        log.opt(depth=1).log(level, "{}: {}", message, counts)
+
+
+class LogSampler:
+    """
+    Ограничивает частоту логов одного места: не чаще раза в interval секунд
+    на ключ. Подавленные записи считаются и дописываются к следующей.
+    Сообщение форматируется loguru лениво, только если запись пропущена
+    и уровень включён.
+    """
+
+    def __init__(self, interval: float = 10.0):
+        self.interval = interval
+        # ключ → (monotonic-время последней записи, число подавленных)
+        self._sites: dict[str, tuple[float, int]] = {}
+
+    def log(self, key: str, level: str, message: str, *args, log=logger, **kwargs) -> None:
+        now = time.monotonic()
+        last, suppressed = self._sites.get(key, (float("-inf"), 0))
+        if now - last < self.interval:
+            self._sites[key] = (last, suppressed + 1)
+            return
+        self._sites[key] = (now, 0)
+        if suppressed:
+            message = f"{message} (ещё {suppressed} подавлено)"
+        log.opt(depth=1).log(level, message, *args, **kwargs)
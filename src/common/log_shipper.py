@@ -0,0 +1,152 @@
+import asyncio
+import queue
+import sys
+import threading
+import time
+
+import aiohttp
+import orjson
+
+
+class ElasticsearchBulkSink:
+    """
+    Loguru sink, отправляющий логи в Elasticsearch пачками через _bulk API.
+
+    Вызов sink только кладёт запись в ограниченную очередь и никогда не ждёт:
+    при переполнении запись отбрасывается и учитывается в счётчике dropped.
+    Отправкой занимается отдельный поток со своим event loop, поэтому
+    медленный или недоступный Elasticsearch не блокирует loop приложения.
+    Пачка уходит, когда набралось batch_size записей или прошло
+    flush_interval секунд с первой записи пачки.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        index: str,
+        batch_size: int = 500,
+        flush_interval: float = 2.0,
+        max_queue_size: int = 10000,
+        request_timeout: float = 10.0,
+    ):
+        self.bulk_url = f"{host.rstrip('/')}/_bulk"
+        self.index = index
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.request_timeout = request_timeout
+        self._queue: queue.Queue[bytes] = queue.Queue(maxsize=max_queue_size)
+        self._stop_event = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._lock = threading.Lock()
+        self.stats = {"enqueued": 0, "dropped": 0, "sent": 0, "failed": 0}
+
+    def __call__(self, message) -> None:
+        record = message.record
+        document = {
+            "@timestamp": record["time"].isoformat(),
+            "log.level": record["level"].name,
+            "message": record["message"],
+            "module": record["module"],
+            "function": record["function"],
+            "line": record["line"],
+            "extra": record["extra"],  # Сохраняем дополнительные поля, если они есть
+        }
+        if record["exception"] is not None:
+            document["exception"] = str(message).rstrip()
+        try:
+            self._queue.put_nowait(orjson.dumps(document, default=str))
+        except (queue.Full, TypeError):
+            self._count("dropped")
+            return
+        self._count("enqueued")
+
+    def start(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="elasticsearch-log-shipper", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self, timeout: float = 10.0) -> None:
+        """Отправляет накопленные записи и останавливает поток отправки."""
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _count(self, key: str, value: int = 1) -> None:
+        with self._lock:
+            self.stats[key] += value
+
+    def _run(self) -> None:
+        loop = asyncio.new_event_loop()
+        session = loop.run_until_complete(self._create_session())
+        try:
+            while True:
+                batch = self._collect_batch()
+                if batch:
+                    loop.run_until_complete(self._send(session, batch))
+                elif self._stop_event.is_set():
+                    break
+        finally:
+            loop.run_until_complete(session.close())
+            loop.close()
+
+    async def _create_session(self) -> aiohttp.ClientSession:
+        return aiohttp.ClientSession(
+            timeout=aiohttp.ClientTimeout(total=self.request_timeout),
+            headers={"Content-Type": "application/x-ndjson"},
+        )
+
+    def _collect_batch(self) -> list[bytes]:
+        """Ждёт первую запись, затем добирает пачку до batch_size или flush_interval."""
+        batch = []
+        deadline = None
+        while len(batch) < self.batch_size:
+            if self._stop_event.is_set():
+                timeout = None
+            elif deadline is None:
+                timeout = self.flush_interval
+            else:
+                timeout = max(0.0, deadline - time.monotonic())
+            try:
+                # При остановке вычитываем остаток очереди без ожидания
+                batch.append(self._queue.get(block=timeout is not None, timeout=timeout))
+            except queue.Empty:
+                if batch or self._stop_event.is_set():
+                    break
+                continue
+            if deadline is None:
+                deadline = time.monotonic() + self.flush_interval
+        return batch
+
+    async def _send(self, session: aiohttp.ClientSession, batch: list[bytes]) -> None:
+        action = orjson.dumps({"index": {"_index": self.index}})
+        body = b"".join(action + b"\n" + line + b"\n" for line in batch)
+        try:
+            async with session.post(self.bulk_url, data=body) as response:
+                response.raise_for_status()
+                result = await response.json(loads=orjson.loads)
+        except Exception as e:
+            self._count("failed", len(batch))
+            # Логировать через loguru нельзя: запись вернётся в этот же sink
+            print(
+                f"[Log Error] Failed to send {len(batch)} logs to Elasticsearch: {e}",
+                file=sys.stderr,
+            )
+            return
+
+        failed = 0
+        if result.get("errors"):
+            failed = sum(
+                1 for item in result.get("items", []) if item.get("index", {}).get("error")
+            )
+        self._count("sent", len(batch) - failed)
+        if failed:
+            self._count("failed", failed)
+            print(
+                f"[Log Error] Elasticsearch rejected {failed} of {len(batch)} logs",
+                file=sys.stderr,
+            )
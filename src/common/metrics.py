@@ -0,0 +1,148 @@
+"""
+Метрики Prometheus.
+
+При нескольких процессах (воркеры gunicorn, процессы run_consumers.py)
+задайте PROMETHEUS_MULTIPROC_DIR — общий пустой каталог: процессы пишут
+значения в файлы, а /metrics собирает их через MultiProcessCollector.
+"""
+
+import glob
+import os
+import re
+import time
+from contextlib import contextmanager
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    REGISTRY,
+    generate_latest,
+    multiprocess,
+    start_http_server,
+)
+
+MULTIPROC_DIR = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+if MULTIPROC_DIR:
+    # Файлы значений создаются вместе с метриками, каталог нужен до них
+    os.makedirs(MULTIPROC_DIR, exist_ok=True)
+
+# Границы для операций от миллисекунд до минут (склейка больших аккаунтов)
+LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600,
+)
+
+CONSUMER_MESSAGE_SECONDS = Histogram(
+    "consumer_message_duration_seconds",
+    "Время обработки сообщения консьюмером",
+    ["queue", "outcome"],
+    buckets=LATENCY_BUCKETS,
+)
+
+CONSUMER_DEFERRED_TOTAL = Counter(
+    "consumer_messages_deferred_total",
+    "Сообщения, отложенные в очередь задержки без расхода попыток",
+    ["queue", "reason"],
+)
+
+QUEUE_ARGUMENTS_MISMATCH = Gauge(
+    "rabbitmq_queue_arguments_mismatch",
+    "1 — очередь объявлена с другими аргументами и работает со старыми параметрами",
+    ["queue"],
+    multiprocess_mode="max",
+)
+
+AMOCRM_REQUESTS_TOTAL = Counter(
+    "amocrm_requests_total",
+    "Запросы к API amoCRM",
+    ["method", "endpoint", "status"],
+)
+AMOCRM_REQUEST_SECONDS = Histogram(
+    "amocrm_request_duration_seconds",
+    "Время запроса к API amoCRM",
+    ["method", "endpoint"],
+    buckets=LATENCY_BUCKETS,
+)
+
+AMOCRM_PAGES_FETCHED = Counter(
+    "amocrm_contact_pages_fetched_total",
+    "Загруженные страницы контактов",
+    ["subdomain"],
+)
+CONTACTS_SCANNED = Counter(
+    "duplicate_contacts_scanned_total",
+    "Контакты, проверенные при поиске дублей",
+    ["subdomain"],
+)
+DUPLICATE_GROUPS_FOUND = Counter(
+    "duplicate_groups_found_total",
+    "Найденные группы дублей",
+    ["subdomain"],
+)
+MERGE_SECONDS = Histogram(
+    "duplicate_merge_duration_seconds",
+    "Время поиска и склейки дублей за одну задачу",
+    ["subdomain", "mode"],
+    buckets=LATENCY_BUCKETS,
+)
+
+DB_POOL_CHECKOUT_SECONDS = Histogram(
+    "db_pool_checkout_duration_seconds",
+    "Ожидание соединения из пула БД",
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30),
+)
+
+_ID_SEGMENT = re.compile(r"/\d+(?=/|$)")
+
+
+def normalize_endpoint(endpoint: str) -> str:
+    """Убирает query и ID из пути, чтобы число значений метки было ограничено."""
+    return _ID_SEGMENT.sub("/{id}", endpoint.split("?", 1)[0])
+
+
+@contextmanager
+def observe_amocrm_request(method: str, endpoint: str):
+    """
+    Учитывает запрос к amoCRM. Статус ответа записывается в выдаваемый
+    словарь; если ответа нет (сетевая ошибка), статус будет "error".
+    """
+    endpoint = normalize_endpoint(endpoint)
+    observed = {"status": "error"}
+    started = time.perf_counter()
+    try:
+        yield observed
+    finally:
+        AMOCRM_REQUEST_SECONDS.labels(method, endpoint).observe(
+            time.perf_counter() - started
+        )
+        AMOCRM_REQUESTS_TOTAL.labels(method, endpoint, str(observed["status"])).inc()
+
+
+def _registry() -> CollectorRegistry:
+    if not MULTIPROC_DIR:
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+
+def render_metrics() -> tuple[bytes, str]:
+    """Возвращает метрики в текстовом формате Prometheus и их content type."""
+    return generate_latest(_registry()), CONTENT_TYPE_LATEST
+
+
+def reset_multiprocess_dir() -> None:
+    """Удаляет файлы метрик процессов прошлого запуска; вызывается до старта обработчиков."""
+    if not MULTIPROC_DIR:
+        return
+    own_suffix = f"_{os.getpid()}.db"
+    for path in glob.glob(os.path.join(MULTIPROC_DIR, "*.db")):
+        if not path.endswith(own_suffix):
+            os.remove(path)
+
+
+def start_metrics_server(port: int) -> None:
+    """Отдаёт /metrics отдельным HTTP-сервером (для процессов без FastAPI)."""
+    start_http_server(port, registry=_registry())
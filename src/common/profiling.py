@@ -0,0 +1,229 @@
+"""
+Профилирование обработки отдельных сообщений по запросу.
+
+Сообщение профилируется, если у него есть заголовок x-profile или профилирование
+включено для его subdomain через админ-эндпоинт. Обработка выполняется под
+семплирующим профайлером pyinstrument, а участки, размеченные stage(),
+суммируются по wall и CPU времени. Результат сохраняется в PROFILE_DIR:
+<имя>.html — отчёт pyinstrument, <имя>.json — время по этапам. Хранятся
+последние PROFILE_MAX_FILES профилей, старые удаляются при сохранении нового.
+
+Включения хранятся файлами в PROFILE_DIR/toggles, поэтому их видят и
+FastAPI-приложение, и процессы run_consumers.py с общим каталогом.
+Когда профилирование выключено, stage() — проверка contextvar,
+а проверка сообщения — поиск заголовка и subdomain в словаре; включения
+перечитываются в фоновом потоке, не блокируя event loop.
+"""
+
+import asyncio
+import time
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from pathlib import Path
+
+import orjson
+from loguru import logger
+
+from src.common.config import PROFILE_ASYNC_MODE, PROFILE_DIR, PROFILE_MAX_FILES
+
+PROFILE_HEADER = "x-profile"
+# Как часто перечитывать включения из PROFILE_DIR/toggles, секунд
+TOGGLES_REFRESH_INTERVAL = 5.0
+
+
+class ProfileSession:
+    """Время этапов обработки одного сообщения."""
+
+    def __init__(self):
+        # этап → [wall, cpu, число вызовов]
+        self.stages: dict[str, list[float]] = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        wall = time.perf_counter()
+        # CPU потока event loop: при конкурентных задачах включает и их работу
+        # между await, поэтому это оценка сверху
+        cpu = time.thread_time()
+        try:
+            yield
+        finally:
+            totals = self.stages.setdefault(name, [0.0, 0.0, 0])
+            totals[0] += time.perf_counter() - wall
+            totals[1] += time.thread_time() - cpu
+            totals[2] += 1
+
+
+_session: ContextVar[ProfileSession | None] = ContextVar("profile_session", default=None)
+
+
+def active() -> bool:
+    """Выполняется ли текущая задача под профайлером."""
+    return _session.get() is not None
+
+
+def stage(name: str):
+    """Отмечает этап обработки; вне профилируемого сообщения ничего не делает."""
+    session = _session.get()
+    return session.stage(name) if session else nullcontext()
+
+
+class ProfileToggles:
+    """Subdomain, для которых профилирование включено, с временем окончания."""
+
+    def __init__(self, directory: Path):
+        self.directory = directory / "toggles"
+        self._until: dict[str, float] = {}
+        self._refreshed_at = float("-inf")
+        self._refresh_task: asyncio.Task | None = None
+
+    def enabled(self, subdomain: str) -> bool:
+        """
+        Проверка по уже прочитанным включениям. Устаревшие включения
+        перечитываются в фоне, до окончания чтения действуют прежние.
+        """
+        if time.monotonic() - self._refreshed_at > TOGGLES_REFRESH_INTERVAL:
+            self._schedule_refresh()
+        return self._until.get(subdomain, 0) > time.time()
+
+    def enable(self, subdomain: str, ttl: int) -> float:
+        until = time.time() + ttl
+        self.directory.mkdir(parents=True, exist_ok=True)
+        (self.directory / f"{subdomain}.json").write_bytes(orjson.dumps({"until": until}))
+        self._until = {**self._until, subdomain: until}
+        self._refreshed_at = float("-inf")
+        return until
+
+    def disable(self, subdomain: str) -> None:
+        (self.directory / f"{subdomain}.json").unlink(missing_ok=True)
+        self._until = {key: value for key, value in self._until.items() if key != subdomain}
+        self._refreshed_at = float("-inf")
+
+    def active(self) -> dict[str, float]:
+        self._refreshed_at = time.monotonic()
+        self._until = self._read()
+        now = time.time()
+        return {subdomain: until for subdomain, until in self._until.items() if until > now}
+
+    def _schedule_refresh(self) -> None:
+        if self._refresh_task is not None:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.active()
+            return
+        self._refreshed_at = time.monotonic()
+        self._refresh_task = loop.create_task(asyncio.to_thread(self._read))
+        self._refresh_task.add_done_callback(self._on_refreshed)
+
+    def _on_refreshed(self, task: asyncio.Task) -> None:
+        self._refresh_task = None
+        if not task.cancelled() and task.exception() is None:
+            self._until = task.result()
+
+    def _read(self) -> dict[str, float]:
+        until = {}
+        try:
+            for path in self.directory.glob("*.json"):
+                try:
+                    until[path.stem] = orjson.loads(path.read_bytes())["until"]
+                except (OSError, ValueError, KeyError):
+                    continue
+        except OSError:
+            pass
+        return until
+
+
+toggles = ProfileToggles(Path(PROFILE_DIR))
+
+
+def should_profile(headers: dict | None, subdomain: str) -> bool:
+    return bool(headers and headers.get(PROFILE_HEADER)) or toggles.enabled(subdomain)
+
+
+async def run_profiled(coro, queue_name: str, subdomain: str) -> None:
+    """Выполняет обработку сообщения под профайлером и сохраняет результат."""
+    from pyinstrument import Profiler
+
+    session = ProfileSession()
+    token = _session.set(session)
+    profiler = Profiler(async_mode=PROFILE_ASYNC_MODE)
+    started_at = datetime.now(timezone.utc)
+    wall, cpu = time.perf_counter(), time.thread_time()
+    profiler.start()
+    try:
+        await coro
+    finally:
+        profiler.stop()
+        _session.reset(token)
+        summary = {
+            "queue": queue_name,
+            "subdomain": subdomain,
+            "started_at": started_at.isoformat(),
+            "wall_seconds": time.perf_counter() - wall,
+            "cpu_seconds": time.thread_time() - cpu,
+            "stages": {
+                name: {"wall_seconds": w, "cpu_seconds": c, "calls": n}
+                for name, (w, c, n) in session.stages.items()
+            },
+        }
+        name = f"{started_at:%Y%m%dT%H%M%S%f}_{queue_name}_{subdomain or 'unknown'}"
+        try:
+            await asyncio.to_thread(_save, name, profiler.output_html(), summary)
+            logger.bind(queue=queue_name, subdomain=subdomain).info(
+                "Профиль сообщения сохранён: {} ({:.3f} с)", name, summary["wall_seconds"]
+            )
+        except Exception as e:
+            logger.error(f"Не удалось сохранить профиль {name}: {e}")
+
+
+def _save(name: str, html: str, summary: dict) -> None:
+    directory = Path(PROFILE_DIR)
+    directory.mkdir(parents=True, exist_ok=True)
+    (directory / f"{name}.html").write_text(html, encoding="utf-8")
+    (directory / f"{name}.json").write_bytes(
+        orjson.dumps(summary, option=orjson.OPT_INDENT_2)
+    )
+    if PROFILE_MAX_FILES:
+        _prune(directory, PROFILE_MAX_FILES)
+
+
+def _prune(directory: Path, keep: int) -> None:
+    """Удаляет профили сверх `keep` последних."""
+    summaries = sorted(directory.glob("*.json"), key=_mtime, reverse=True)
+    for path in summaries[keep:]:
+        path.unlink(missing_ok=True)
+        path.with_suffix(".html").unlink(missing_ok=True)
+
+
+def _mtime(path: Path) -> float:
+    # Файл мог удалить другой процесс с тем же PROFILE_DIR
+    try:
+        return path.stat().st_mtime
+    except OSError:
+        return 0.0
+
+
+def list_profiles(limit: int = 100) -> list[dict]:
+    """Последние сохранённые профили, новые первыми."""
+    directory = Path(PROFILE_DIR)
+    if not directory.exists():
+        return []
+    summaries = sorted(directory.glob("*.json"), key=_mtime, reverse=True)
+    profiles = []
+    for path in summaries[:limit]:
+        try:
+            profiles.append({"name": path.stem, **orjson.loads(path.read_bytes())})
+        except OSError:
+            continue  # удалён при очистке старых профилей
+    return profiles
+
+
+def profile_path(name: str, extension: str) -> Path | None:
+    """Путь к файлу профиля; имена вне PROFILE_DIR не принимаются."""
+    directory = Path(PROFILE_DIR).resolve()
+    path = (directory / f"{name}.{extension}").resolve()
+    if path.parent != directory or not path.is_file():
+        return None
+    return path
@@ -1,19 +1,83 @@
-from src.common.config import CLIENT_ID
+import asyncio
+import time
+
+from src.common.config import CLIENT_ID, TOKEN_CACHE_TTL, TOKEN_REFRESH_MARGIN
 from loguru import logger
-from fastapi import HTTPException
 
-from src.common.exceptions import AmoCRMServiceError, TokenError
+from src.common.exceptions import TokenError
 from src.rabbitmq.rpc_client import RPCClient
 
 
 class TokenService:
-    """Класс для работы с токенами"""
+    """
+    Класс для работы с токенами.
+    Токены кэшируются по subdomain до истечения срока; параллельные запросы
+    одного subdomain ждут один общий RPC, а токен, близкий к истечению,
+    обновляется в фоне.
+    """
 
-    def __init__(self, rpc_client: RPCClient):
+    def __init__(
+        self,
+        rpc_client: RPCClient,
+        ttl: int = TOKEN_CACHE_TTL,
+        refresh_margin: int = TOKEN_REFRESH_MARGIN,
+    ):
         self.rpc_client = rpc_client
+        self.ttl = ttl
+        self.refresh_margin = refresh_margin
+        # subdomain → (access_token, monotonic-время истечения)
+        self._cache: dict[str, tuple[str, float]] = {}
+        self._in_flight: dict[str, asyncio.Task] = {}
+        # subdomain → номер сброса кэша: запрос, начатый до invalidate(),
+        # не должен вернуть в кэш отозванный токен
+        self._generations: dict[str, int] = {}
 
     async def get_tokens(self, subdomain: str) -> str:
-        """Запрашивает токен у другого сервиса через RPC"""
+        """Возвращает access_token из кэша или запрашивает его у другого сервиса."""
+        cached = self._cache.get(subdomain)
+        if cached:
+            access_token, expires = cached
+            remaining = expires - time.monotonic()
+            if remaining > self.refresh_margin:
+                return access_token
+            if remaining > 0:
+                self._refresh(subdomain)
+                return access_token
+
+        return await asyncio.shield(self._refresh(subdomain))
+
+    def invalidate(self, subdomain: str) -> None:
+        """Удаляет токен из кэша, например после ответа 401 от amoCRM."""
+        self._generations[subdomain] = self._generations.get(subdomain, 0) + 1
+        # Следующий get_tokens не должен присоединиться к уже начатому запросу
+        self._in_flight.pop(subdomain, None)
+        if self._cache.pop(subdomain, None):
+            logger.bind(subdomain=subdomain).info("Токен удалён из кэша")
+
+    def _refresh(self, subdomain: str) -> asyncio.Task:
+        """Запускает запрос токена, если для subdomain он ещё не выполняется."""
+        task = self._in_flight.get(subdomain)
+        if task is None:
+            task = asyncio.create_task(
+                self._fetch_tokens(subdomain, self._generations.get(subdomain, 0))
+            )
+            self._in_flight[subdomain] = task
+            task.add_done_callback(lambda t: self._on_refreshed(subdomain, t))
+        return task
+
+    def _on_refreshed(self, subdomain: str, task: asyncio.Task) -> None:
+        if self._in_flight.get(subdomain) is task:
+            del self._in_flight[subdomain]
+        # Ошибка фонового обновления уже залогирована; забираем её,
+        # чтобы asyncio не ругался на непрочитанное исключение.
+        if not task.cancelled():
+            task.exception()
+
+    async def _fetch_tokens(self, subdomain: str, generation: int) -> str:
+        """
+        Запрашивает токен у другого сервиса через RPC. Токен кэшируется, только
+        если с момента запуска запроса (generation) кэш subdomain не сбрасывался.
+        """
         log = logger.bind(subdomain=subdomain)
         try:
             tokens = await self.rpc_client.send_rpc_request_and_wait_for_reply(
@@ -23,7 +87,22 @@ class TokenService:
                 log.error("Получены некорректные токены: {}", tokens)
                 raise TokenError("Invalid tokens received")
 
+            if self._generations.get(subdomain, 0) == generation:
+                self._cache[subdomain] = (
+                    tokens["access_token"],
+                    time.monotonic() + self._token_lifetime(tokens),
+                )
+            else:
+                log.info("Кэш сброшен во время запроса токена, токен не кэшируется")
             return tokens["access_token"]
         except Exception as e:
             log.error("Ошибка RPC при запросе токена: {}", e)
             raise TokenError(f"Failed to fetch tokens: {e}")
+
+    def _token_lifetime(self, tokens: dict) -> float:
+        """Время жизни токена: по expires_in/expires_at из ответа, но не больше ttl."""
+        if expires_in := tokens.get("expires_in"):
+            return min(float(expires_in), self.ttl)
+        if expires_at := tokens.get("expires_at"):
+            return min(float(expires_at) - time.time(), self.ttl)
+        return self.ttl
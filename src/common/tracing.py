@@ -0,0 +1,186 @@
+"""
+Трассировка OpenTelemetry.
+
+Включается TRACING_EXPORTER:
+- console — спаны выводятся в stdout;
+- file — в TRACING_FILE, по JSON-объекту на спан;
+- otlp — в коллектор по OTLP/HTTP (адрес в OTEL_EXPORTER_OTLP_ENDPOINT).
+Без TRACING_EXPORTER используется no-op трассировщик API: span() и traced()
+почти ничего не стоят, а слушатели событий SQLAlchemy не подключаются.
+
+Контекст трассы передаётся между сервисами в заголовках сообщений RabbitMQ
+(W3C traceparent/tracestate).
+"""
+
+import functools
+import os
+
+from loguru import logger
+from opentelemetry import context, propagate, trace
+from opentelemetry.trace import SpanKind, Status, StatusCode
+
+from src.common.config import TRACING_EXPORTER, TRACING_FILE, TRACING_SERVICE_NAME
+
+tracer = trace.get_tracer("duplicate_contact")
+
+# Длина SQL в атрибуте db.query.text
+MAX_STATEMENT_LENGTH = 1000
+
+_provider = None
+
+
+def configure() -> bool:
+    """Настраивает экспорт спанов процесса; возвращает False, если трассировка выключена."""
+    global _provider
+    if not TRACING_EXPORTER or _provider is not None:
+        return _provider is not None
+
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+
+    if TRACING_EXPORTER == "otlp":
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+
+        exporter = OTLPSpanExporter()
+    elif TRACING_EXPORTER == "file":
+        exporter = ConsoleSpanExporter(
+            out=open(TRACING_FILE, "a", encoding="utf-8"),
+            formatter=lambda span: span.to_json(indent=None) + os.linesep,
+        )
+    elif TRACING_EXPORTER == "console":
+        exporter = ConsoleSpanExporter()
+    else:
+        logger.error(f"Неизвестный TRACING_EXPORTER: {TRACING_EXPORTER}")
+        return False
+
+    _provider = TracerProvider(
+        resource=Resource.create(
+            {"service.name": TRACING_SERVICE_NAME, "process.pid": os.getpid()}
+        )
+    )
+    _provider.add_span_processor(BatchSpanProcessor(exporter))
+    trace.set_tracer_provider(_provider)
+    logger.info(f"Трассировка включена, экспорт: {TRACING_EXPORTER}")
+    return True
+
+
+def shutdown() -> None:
+    """Отправляет накопленные спаны; вызывается при остановке процесса."""
+    if _provider is not None:
+        _provider.shutdown()
+
+
+def span(
+    name: str,
+    kind: SpanKind = SpanKind.INTERNAL,
+    attributes: dict | None = None,
+    parent: context.Context | None = None,
+    links: list[trace.Link] | None = None,
+):
+    """
+    Спан, текущий на время блока with. По умолчанию дочерний для текущего
+    спана, parent задаёт контекст явно, links — связанные спаны других трасс.
+    Атрибуты со значением None пропускаются.
+    """
+    return tracer.start_as_current_span(
+        name,
+        context=parent,
+        kind=kind,
+        attributes=_clean(attributes),
+        links=links,
+    )
+
+
+def traced(name: str):
+    """Декоратор корутины: выполняет её в спане name."""
+
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with tracer.start_as_current_span(name):
+                return await func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def current_link() -> trace.Link | None:
+    """
+    Ссылка на текущий спан для спана, который обрабатывает работу нескольких
+    сообщений; вне спана — None.
+    """
+    span_context = trace.get_current_span().get_span_context()
+    return trace.Link(span_context) if span_context.is_valid else None
+
+
+def set_attributes(attributes: dict) -> None:
+    """Добавляет атрибуты текущему спану."""
+    trace.get_current_span().set_attributes(_clean(attributes))
+
+
+def set_error(description: str) -> None:
+    """Помечает текущий спан ошибкой, когда исключение обработано внутри него."""
+    trace.get_current_span().set_status(Status(StatusCode.ERROR, description))
+
+
+def _clean(attributes: dict | None) -> dict:
+    return {key: value for key, value in (attributes or {}).items() if value is not None}
+
+
+def inject_headers(headers: dict) -> None:
+    """
+    Дописывает контекст текущей трассы в заголовки сообщения. Вне спана
+    заголовки не меняются: повтор сохраняет traceparent исходного сообщения.
+    """
+    propagate.inject(headers)
+
+
+def extract_context(headers: dict | None) -> context.Context:
+    """Контекст трассы из заголовков входящего сообщения."""
+    carrier = {
+        key: value.decode() if isinstance(value, bytes) else value
+        for key, value in (headers or {}).items()
+        if isinstance(value, (str, bytes))
+    }
+    return propagate.extract(carrier)
+
+
+def instrument_engine(engine) -> None:
+    """
+    Спан на каждый SQL-запрос движка SQLAlchemy (для async — sync_engine).
+    Без TRACING_EXPORTER слушатели не подключаются.
+    """
+    if not TRACING_EXPORTER:
+        return
+
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, exec_context, executemany):
+        operation = statement.lstrip().split(None, 1)[0].upper() if statement else "SQL"
+        span_ = tracer.start_span(
+            f"db {operation}",
+            kind=SpanKind.CLIENT,
+            attributes={
+                "db.system": "postgresql",
+                "db.operation.name": operation,
+                "db.query.text": statement[:MAX_STATEMENT_LENGTH],
+            },
+        )
+        if exec_context is not None:
+            exec_context._tracing_span = span_
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, exec_context, executemany):
+        span_ = getattr(exec_context, "_tracing_span", None)
+        if span_ is not None:
+            span_.end()
+
+    @event.listens_for(engine, "handle_error")
+    def handle_error(exception_context):
+        span_ = getattr(exception_context.execution_context, "_tracing_span", None)
+        if span_ is not None:
+            span_.set_status(Status(StatusCode.ERROR, str(exception_context.original_exception)))
+            span_.end()
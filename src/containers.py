@@ -10,6 +10,9 @@ from src.duplicate_contact.services.contact_merge_service import ContactMergeSer
 from src.duplicate_contact.services.duplicate_settings import DuplicateSettingsService
 from src.duplicate_contact.services.exclusion import ContactExclusionService
 from src.duplicate_contact.services.find_duplicate import DuplicateFinderService
+from src.duplicate_contact.services.merge_log_retention import MergeLogRetentionService
+from src.duplicate_contact.services.merged_contacts import MergedContactsService
+from src.duplicate_contact.services.settings_cache import SettingsCache
 from src.rabbitmq.consumers.add_exclusion import ExclusionConsumer
 from src.rabbitmq.consumers.get_settings import GetSettingsConsumer
 from src.rabbitmq.consumers.merge_all_contacts_consumer import MergeAllContactsConsumer
@@ -20,6 +23,7 @@ from src.rabbitmq.consumers.save_settings import SaveSettingsConsumer
 from src.rabbitmq.connection import RMQConnectionManager
 from src.rabbitmq.manager import RMQManager
 from src.rabbitmq.publisher import RMQPublisher
+from src.rabbitmq.redrive import DeadLetterRedriver
 from src.rabbitmq.rpc_client import RPCClient
 
 
@@ -47,17 +51,27 @@ class ServiceContainer(containers.DeclarativeContainer):
     client_session = providers.Resource(
         lambda: aiohttp.ClientSession(connector=aiohttp.TCPConnector(ssl=False))
     )
-    amocrm_service = providers.Singleton(AmocrmService, client_session=client_session)
     token_service = providers.Singleton(
         TokenService, rpc_client=RabbitMQContainer.rpc_client
     )
+    amocrm_service = providers.Singleton(
+        AmocrmService, client_session=client_session, token_service=token_service
+    )
 
     duplicate_repo = providers.Factory(ContactDuplicateRepository)
     find_duplicate_service = providers.Factory(
         DuplicateFinderService, amocrm_service=amocrm_service
     )
+    # Singleton: кэш настроек общий для всех консьюмеров процесса
+    settings_cache = providers.Singleton(SettingsCache)
     duplicate_settings_service = providers.Factory(
-        DuplicateSettingsService, duplicate_repo=duplicate_repo
+        DuplicateSettingsService,
+        duplicate_repo=duplicate_repo,
+        settings_cache=settings_cache,
+    )
+    # Singleton: tombstones в памяти общие для всех консьюмеров процесса
+    merged_contacts_service = providers.Singleton(
+        MergedContactsService, duplicate_repo=duplicate_repo
     )
 
     merge_contact_service = providers.Factory(
@@ -65,6 +79,7 @@ class ServiceContainer(containers.DeclarativeContainer):
         find_duplicate_service=find_duplicate_service,
         duplicate_repo=duplicate_repo,
         amocrm_service=amocrm_service,  # Передаём явно для ContactService
+        merged_contacts_service=merged_contacts_service,
     )
 
     exclusion_service = providers.Factory(
@@ -72,6 +87,7 @@ class ServiceContainer(containers.DeclarativeContainer):
         duplicate_repo=duplicate_repo,
         amocrm_service=amocrm_service,  # Передаём явно для ContactService
         find_duplicate_service=find_duplicate_service,  # Новая зависимость
+        settings_cache=settings_cache,
     )
 
 
@@ -81,10 +97,13 @@ class ConsumerContainer(containers.DeclarativeContainer):
     connection_manager = RabbitMQContainer.connection_manager
     rmq_publisher = RabbitMQContainer.rmq_publisher
     db_manager = DatabaseContainer.db_manager
+    client_session = ServiceContainer.client_session
     token_service = ServiceContainer.token_service
     duplicate_settings_service = ServiceContainer.duplicate_settings_service
     merge_contact_service = ServiceContainer.merge_contact_service
     exclusion_service = ServiceContainer.exclusion_service
+    merged_contacts_service = ServiceContainer.merged_contacts_service
+    settings_cache = ServiceContainer.settings_cache
 
     save_contact_duplicates_settings_consumer = providers.Singleton(
         SaveSettingsConsumer,
@@ -124,6 +143,7 @@ class ConsumerContainer(containers.DeclarativeContainer):
         duplicate_service=merge_contact_service,
         token_service=token_service,
         duplicate_settings_service=duplicate_settings_service,
+        merged_contacts_service=merged_contacts_service,
     )
 
     add_contact_in_exclusion_consumer = providers.Singleton(
@@ -154,10 +174,23 @@ class ApplicationContainer(containers.DeclarativeContainer):
     services = providers.Container(ServiceContainer)
     consumers = providers.Container(ConsumerContainer)
 
+    merge_log_retention = providers.Singleton(
+        MergeLogRetentionService,
+        db_manager=database.db_manager,
+        duplicate_repo=services.duplicate_repo,
+    )
+
+    dead_letter_redriver = providers.Singleton(
+        DeadLetterRedriver,
+        connection_manager=rabbitmq.connection_manager,
+        rmq_publisher=rabbitmq.rmq_publisher,
+    )
+
     rabbitmq_manager = providers.Singleton(
         RMQManager,
         connection_manager=rabbitmq.connection_manager,
         db_manager=database.db_manager,
         rmq_publisher=rabbitmq.rmq_publisher,
         consumers=consumers.consumers,
+        redriver=dead_letter_redriver,
     )
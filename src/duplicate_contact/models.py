@@ -47,6 +47,7 @@ class PriorityField(Base):
 
     __table_args__ = (
         sa.UniqueConstraint("field_name", "settings_id", name="uq_priority_fields"),
+        Index("ix_priority_fields_settings_id", "settings_id"),
     )
 
 
@@ -76,6 +77,7 @@ class Block(Base):
         sa.UniqueConstraint(
             "block_id", "settings_id", name="uq_block_blockid_settings"
         ),
+        Index("ix_blocks_settings_id", "settings_id"),
     )
 
 
@@ -96,6 +98,12 @@ class BlockField(Base):
         "ExclusionField", back_populates="block_field", cascade="all, delete-orphan"
     )
 
+    __table_args__ = (
+        sa.UniqueConstraint(
+            "block_id", "field_name", name="uq_block_fields_block_field"
+        ),
+    )
+
 
 class ExclusionField(Base):
     """Исключённые поля в дублях контактов."""
@@ -113,13 +121,23 @@ class ExclusionField(Base):
         "BlockField", back_populates="exclusion_values"
     )
 
+    __table_args__ = (
+        sa.UniqueConstraint(
+            "block_field_id", "value", name="uq_exclusion_fields_block_field_value"
+        ),
+    )
+
 
 class MergeBlockLog(Base):
-    """Лог объединения контактов."""
+    """
+    Лог объединения контактов.
+    Таблица партиционирована по месяцам created_at (merge_block_logs_pYYYYMM
+    и партиция по умолчанию), см. MergeLogRetentionService.
+    """
 
     __tablename__ = "merge_block_logs"
 
-    id: Mapped[int] = mapped_column(primary_key=True)
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
     subdomain: Mapped[str] = mapped_column(sa.String(256), nullable=False)
     block_id: Mapped[int] = mapped_column(
         sa.ForeignKey("blocks.id", ondelete="CASCADE"), nullable=False
@@ -127,12 +145,42 @@ class MergeBlockLog(Base):
     contact_id: Mapped[str] = mapped_column(
         sa.String(256), nullable=False
     )  # Итоговый контакт после склейки
+    # Ключ партиционирования входит в первичный ключ
     created_at: Mapped[datetime] = mapped_column(
-        sa.DateTime(timezone=True), server_default=func.now(), nullable=False
+        sa.DateTime(timezone=True),
+        server_default=func.now(),
+        nullable=False,
+        primary_key=True,
     )
 
     block: Mapped["Block"] = relationship("Block", back_populates="merge_logs")
 
     __table_args__ = (
-        Index("ix_merge_block_logs_subdomain_contact_id", "subdomain", "contact_id"),
+        Index(
+            "ix_merge_block_logs_subdomain_contact_created",
+            "subdomain",
+            "contact_id",
+            sa.text("created_at DESC"),
+        ),
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
+
+
+class MergedContact(Base):
+    """Контакты, поглощённые при склейке (tombstones)."""
+
+    __tablename__ = "merged_contacts"
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    subdomain: Mapped[str] = mapped_column(sa.String(256), nullable=False)
+    contact_id: Mapped[int] = mapped_column(sa.BigInteger, nullable=False)
+    expires_at: Mapped[datetime] = mapped_column(
+        sa.DateTime(timezone=True), nullable=False
+    )
+
+    __table_args__ = (
+        sa.UniqueConstraint(
+            "subdomain", "contact_id", name="uq_merged_contacts_subdomain_contact"
+        ),
+        Index("ix_merged_contacts_expires_at", "expires_at"),
     )
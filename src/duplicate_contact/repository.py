@@ -1,6 +1,9 @@
+from datetime import date, datetime
+
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
-from sqlalchemy import select, insert, delete
+from sqlalchemy import select, insert, delete, func, text, tuple_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from src.duplicate_contact.models import (
     Settings,
     PriorityField,
@@ -8,10 +11,62 @@ from src.duplicate_contact.models import (
     BlockField,
     ExclusionField,
     MergeBlockLog,
+    MergedContact,
 )
 from src.duplicate_contact.schemas import ContactDuplicateSettingsSchema
 
 
+# Пространство ключей advisory lock для склейки контактов
+MERGE_LOCK_NAMESPACE = 7301
+# Ключ advisory lock обслуживания партиций merge_block_logs
+MERGE_LOG_MAINTENANCE_LOCK = 7302
+# Помесячные партиции merge_block_logs: merge_block_logs_pYYYYMM
+MERGE_LOG_PARTITION_PREFIX = "merge_block_logs_p"
+# Партиция merge_block_logs по умолчанию: строки вне помесячных партиций
+MERGE_LOG_DEFAULT_PARTITION = "merge_block_logs_default"
+
+# Всё дерево настроек одним запросом в форме ContactDuplicateSettingsSchema
+SETTINGS_TREE_JSON_QUERY = text(
+    """
+    SELECT json_build_object(
+        'subdomain', s.subdomain,
+        'merge_all', s.merge_all,
+        'blocked_creation', s.blocked_creation,
+        'merge_is_active', s.merge_is_active,
+        'priority_fields', COALESCE((
+            SELECT json_agg(pf.field_name ORDER BY pf.id)
+            FROM priority_fields pf
+            WHERE pf.settings_id = s.id
+        ), '[]'::json),
+        'blocks', COALESCE((
+            SELECT json_agg(json_build_object(
+                'db_id', b.id,
+                'block_id', b.block_id,
+                'fields', COALESCE((
+                    SELECT json_agg(json_build_object(
+                        'field_name', bf.field_name,
+                        'exclusion_fields', COALESCE((
+                            SELECT json_agg(
+                                json_build_object('value', ef.value) ORDER BY ef.id
+                            )
+                            FROM exclusion_fields ef
+                            WHERE ef.block_field_id = bf.id
+                        ), '[]'::json)
+                    ) ORDER BY bf.id)
+                    FROM block_fields bf
+                    WHERE bf.block_id = b.id
+                ), '[]'::json)
+            ) ORDER BY b.id)
+            FROM blocks b
+            WHERE b.settings_id = s.id
+        ), '[]'::json)
+    )::text
+    FROM settings s
+    WHERE s.subdomain = :subdomain
+    """
+)
+
+
 class ContactDuplicateRepository:
     """Репозиторий для работы с настройками дублей контактов."""
 
@@ -21,6 +76,7 @@ class ContactDuplicateRepository:
     block_field: type[BlockField] = BlockField
     exclusion_fields: type[ExclusionField] = ExclusionField
     merge_block_log: type[MergeBlockLog] = MergeBlockLog
+    merged_contact: type[MergedContact] = MergedContact
 
     async def get_settings_by_subdomain(
         self, session: AsyncSession, subdomain: str
@@ -39,6 +95,16 @@ class ContactDuplicateRepository:
         result = await session.execute(stmt)
         return result.scalar_one_or_none()
 
+    async def get_settings_tree_json(
+        self, session: AsyncSession, subdomain: str
+    ) -> str | None:
+        """
+        Получает дерево настроек по subdomain одним запросом, собранным
+        в JSON на стороне Postgres, без загрузки ORM-объектов.
+        """
+        result = await session.execute(SETTINGS_TREE_JSON_QUERY, {"subdomain": subdomain})
+        return result.scalar_one_or_none()
+
     async def delete_settings_by_subdomain(
         self, session: AsyncSession, subdomain: str
     ) -> None:
@@ -47,82 +113,164 @@ class ContactDuplicateRepository:
             delete(self.settings).where(self.settings.subdomain == subdomain)
         )
 
-    async def insert_settings(
+    async def upsert_settings(
         self, session: AsyncSession, data: ContactDuplicateSettingsSchema
     ) -> int:
-        """Вставляет новую запись в таблицу `settings`."""
-        stmt = (
-            insert(self.settings)
-            .values(
-                subdomain=data.subdomain,
-                merge_all=data.merge_all,
-                blocked_creation=data.blocked_creation,
-                merge_is_active=data.merge_is_active,
-            )
-            .returning(self.settings.id)
+        """Вставляет или обновляет запись в таблице `settings`, сохраняя её id."""
+        stmt = pg_insert(self.settings).values(
+            subdomain=data.subdomain,
+            merge_all=data.merge_all,
+            blocked_creation=data.blocked_creation,
+            merge_is_active=data.merge_is_active,
         )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[self.settings.subdomain],
+            set_={
+                "merge_all": stmt.excluded.merge_all,
+                "blocked_creation": stmt.excluded.blocked_creation,
+                "merge_is_active": stmt.excluded.merge_is_active,
+            },
+        ).returning(self.settings.id)
         result = await session.execute(stmt)
         return result.scalar_one()
 
-    async def insert_priority_fields(
-        self, session: AsyncSession, settings_id: int, fields: list
+    async def sync_priority_fields(
+        self, session: AsyncSession, settings_id: int, field_names: list[str]
     ) -> None:
-        """Вставляет записи в `priority_fields`."""
-        if not fields:
+        """Приводит `priority_fields` к переданному списку: удаляет лишние, добавляет новые."""
+        await session.execute(
+            delete(self.priority_fields).where(
+                self.priority_fields.settings_id == settings_id,
+                self.priority_fields.field_name.not_in(field_names),
+            )
+        )
+        if not field_names:
             return
 
-        stmt = insert(self.priority_fields).values(
+        stmt = pg_insert(self.priority_fields).values(
             [
-                {
-                    "field_name": field["field_name"],
-                    "settings_id": settings_id,
-                }
-                for field in fields
+                {"field_name": field_name, "settings_id": settings_id}
+                for field_name in field_names
             ]
         )
-        await session.execute(stmt)
+        await session.execute(
+            stmt.on_conflict_do_nothing(constraint="uq_priority_fields")
+        )
 
-    async def insert_blocks(
-        self, session: AsyncSession, settings_id: int, blocks: list[dict]
+    async def sync_blocks(
+        self, session: AsyncSession, settings_id: int, block_ids: list[int]
     ) -> dict[int, int]:
-        """Вставляет записи в `blocks` с сохранением block_id из клиента и возвращает соответствие: client block_id → db id."""
-        if not blocks:
+        """
+        Приводит `blocks` к переданным block_id из клиента. Сохранённые блоки
+        сохраняют свой db id и логи склейки. Возвращает: client block_id → db id.
+        """
+        await session.execute(
+            delete(self.block).where(
+                self.block.settings_id == settings_id,
+                self.block.block_id.not_in(block_ids),
+            )
+        )
+        if not block_ids:
             return {}
 
-        stmt = (
-            insert(self.block)
-            .values(
-                [
-                    {"settings_id": settings_id, "block_id": block["block_id"]}
-                    for block in blocks
-                ]
-            )
-            .returning(self.block.id, self.block.block_id)
+        stmt = pg_insert(self.block).values(
+            [{"settings_id": settings_id, "block_id": block_id} for block_id in block_ids]
         )
+        # DO UPDATE без изменений, чтобы RETURNING вернул и уже существующие блоки
+        stmt = stmt.on_conflict_do_update(
+            constraint="uq_block_blockid_settings",
+            set_={"block_id": stmt.excluded.block_id},
+        ).returning(self.block.id, self.block.block_id)
         result = await session.execute(stmt)
-        rows = result.all()
-        return {row.block_id: row.id for row in rows}
+        return {row.block_id: row.id for row in result.all()}
 
-    async def insert_block_fields(
-        self, session: AsyncSession, block_id: int, fields: list[dict]
-    ) -> dict[str, int]:
-        """Вставляет записи в `block_fields` и возвращает сопоставление: field_name → db id."""
-        if not fields:
+    async def sync_block_fields(
+        self,
+        session: AsyncSession,
+        block_db_ids: list[int],
+        fields: list[tuple[int, str]],
+    ) -> dict[tuple[int, str], int]:
+        """
+        Приводит `block_fields` блоков к переданным парам (db id блока, field_name).
+        Возвращает сопоставление: (db id блока, field_name) → db id поля.
+        """
+        if not block_db_ids:
             return {}
 
-        stmt = (
-            insert(self.block_field)
-            .values(
-                [
-                    {"field_name": field["field_name"], "block_id": block_id}
-                    for field in fields
-                ]
+        await session.execute(
+            delete(self.block_field).where(
+                self.block_field.block_id.in_(block_db_ids),
+                tuple_(self.block_field.block_id, self.block_field.field_name).not_in(
+                    fields
+                ),
             )
-            .returning(self.block_field.id, self.block_field.field_name)
+        )
+        if not fields:
+            return {}
+
+        stmt = pg_insert(self.block_field).values(
+            [{"block_id": block_id, "field_name": field_name} for block_id, field_name in fields]
+        )
+        stmt = stmt.on_conflict_do_update(
+            constraint="uq_block_fields_block_field",
+            set_={"field_name": stmt.excluded.field_name},
+        ).returning(
+            self.block_field.id, self.block_field.block_id, self.block_field.field_name
         )
         result = await session.execute(stmt)
-        rows = result.all()
-        return {row.field_name: row.id for row in rows}
+        return {(row.block_id, row.field_name): row.id for row in result.all()}
+
+    async def sync_exclusion_values(
+        self,
+        session: AsyncSession,
+        block_field_ids: list[int],
+        exclusions: list[tuple[int, str, str]],
+    ) -> None:
+        """
+        Приводит `exclusion_fields` полей к переданным (db id поля, field_name, value).
+        Списки исключений бывают большими, поэтому они передаются массивами
+        и разворачиваются через unnest: два запроса при любом объёме.
+        """
+        if not block_field_ids:
+            return
+
+        field_ids = [block_field_id for block_field_id, _, _ in exclusions]
+        field_names = [field_name for _, field_name, _ in exclusions]
+        values = [value for _, _, value in exclusions]
+        await session.execute(
+            text(
+                """
+                DELETE FROM exclusion_fields ef
+                WHERE ef.block_field_id = ANY(CAST(:block_field_ids AS integer[]))
+                  AND NOT EXISTS (
+                      SELECT 1
+                      FROM unnest(
+                          CAST(:field_ids AS integer[]), CAST(:values AS text[])
+                      ) AS keep(block_field_id, value)
+                      WHERE keep.block_field_id = ef.block_field_id
+                        AND keep.value = ef.value
+                  )
+                """
+            ),
+            {"block_field_ids": block_field_ids, "field_ids": field_ids, "values": values},
+        )
+        if not exclusions:
+            return
+
+        await session.execute(
+            text(
+                """
+                INSERT INTO exclusion_fields (block_field_id, field_name, value)
+                SELECT * FROM unnest(
+                    CAST(:field_ids AS integer[]),
+                    CAST(:field_names AS text[]),
+                    CAST(:values AS text[])
+                )
+                ON CONFLICT ON CONSTRAINT uq_exclusion_fields_block_field_value DO NOTHING
+                """
+            ),
+            {"field_ids": field_ids, "field_names": field_names, "values": values},
+        )
 
     async def insert_exclusion_values(
         self,
@@ -131,11 +279,11 @@ class ContactDuplicateRepository:
         field_name: str,
         exclusion_fields: list[dict],
     ) -> None:
-        """Вставляет записи в `exclusion_fields` для конкретного поля блока."""
+        """Вставляет записи в `exclusion_fields` для конкретного поля блока, пропуская уже существующие."""
         if not exclusion_fields:
             return
 
-        stmt = insert(self.exclusion_fields).values(
+        stmt = pg_insert(self.exclusion_fields).values(
             [
                 {
                     "value": ex["value"],
@@ -145,7 +293,11 @@ class ContactDuplicateRepository:
                 for ex in exclusion_fields
             ]
         )
-        await session.execute(stmt)
+        await session.execute(
+            stmt.on_conflict_do_nothing(
+                constraint="uq_exclusion_fields_block_field_value"
+            )
+        )
 
     # Метод для вставки записи лога склейки
     async def insert_merge_block_log(
@@ -181,3 +333,144 @@ class ContactDuplicateRepository:
         )
         result = await session.execute(stmt)
         return result.scalar_one_or_none()
+
+    async def upsert_merged_contacts(
+        self,
+        session: AsyncSession,
+        subdomain: str,
+        contact_ids: list[int],
+        expires_at: datetime,
+    ) -> None:
+        """Сохраняет поглощённые при склейке контакты и удаляет просроченные записи."""
+        await session.execute(
+            delete(self.merged_contact).where(
+                self.merged_contact.expires_at <= func.now()
+            )
+        )
+        if not contact_ids:
+            return
+
+        stmt = pg_insert(self.merged_contact).values(
+            [
+                {
+                    "subdomain": subdomain,
+                    "contact_id": contact_id,
+                    "expires_at": expires_at,
+                }
+                for contact_id in contact_ids
+            ]
+        )
+        stmt = stmt.on_conflict_do_update(
+            constraint="uq_merged_contacts_subdomain_contact",
+            set_={"expires_at": stmt.excluded.expires_at},
+        )
+        await session.execute(stmt)
+
+    async def get_merged_contacts(
+        self, session: AsyncSession, subdomain: str, contact_ids: list[int]
+    ) -> dict[int, datetime]:
+        """Возвращает актуальные записи о поглощённых контактах: contact_id → expires_at."""
+        if not contact_ids:
+            return {}
+
+        stmt = select(
+            self.merged_contact.contact_id, self.merged_contact.expires_at
+        ).where(
+            self.merged_contact.subdomain == subdomain,
+            self.merged_contact.contact_id.in_(contact_ids),
+            self.merged_contact.expires_at > func.now(),
+        )
+        result = await session.execute(stmt)
+        return {row.contact_id: row.expires_at for row in result.all()}
+
+    async def try_lock_subdomain(self, session: AsyncSession, subdomain: str) -> bool:
+        """
+        Пытается взять транзакционный advisory lock на склейку subdomain.
+        Lock освобождается автоматически при завершении транзакции.
+        """
+        result = await session.execute(
+            text("SELECT pg_try_advisory_xact_lock(:namespace, hashtext(:subdomain))"),
+            {"namespace": MERGE_LOCK_NAMESPACE, "subdomain": subdomain},
+        )
+        return bool(result.scalar_one())
+
+    async def try_lock_merge_log_maintenance(self, session: AsyncSession) -> bool:
+        """Транзакционный advisory lock: партиции обслуживает только одна реплика."""
+        result = await session.execute(
+            text("SELECT pg_try_advisory_xact_lock(:key)"),
+            {"key": MERGE_LOG_MAINTENANCE_LOCK},
+        )
+        return bool(result.scalar_one())
+
+    async def set_lock_timeout(self, session: AsyncSession, seconds: int) -> None:
+        """Ограничивает ожидание блокировок до конца текущей транзакции."""
+        await session.execute(text(f"SET LOCAL lock_timeout = '{int(seconds)}s'"))
+
+    async def get_merge_log_partitions(self, session: AsyncSession) -> list[str]:
+        """Возвращает имена помесячных партиций merge_block_logs."""
+        result = await session.execute(
+            text(
+                """
+                SELECT c.relname
+                FROM pg_inherits i
+                JOIN pg_class c ON c.oid = i.inhrelid
+                JOIN pg_class p ON p.oid = i.inhparent
+                WHERE p.relname = :table AND c.relname LIKE :prefix
+                """
+            ),
+            {
+                "table": self.merge_block_log.__tablename__,
+                "prefix": f"{MERGE_LOG_PARTITION_PREFIX}%",
+            },
+        )
+        return list(result.scalars().all())
+
+    async def create_merge_log_partition(
+        self, session: AsyncSession, month_start: date, month_end: date
+    ) -> None:
+        """Создаёт партицию merge_block_logs за месяц, если её ещё нет."""
+        name = f"{MERGE_LOG_PARTITION_PREFIX}{month_start:%Y%m}"
+        await session.execute(
+            text(
+                f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF merge_block_logs "
+                f"FOR VALUES FROM ('{month_start.isoformat()}') "
+                f"TO ('{month_end.isoformat()}')"
+            )
+        )
+
+    async def drop_merge_log_partition(self, session: AsyncSession, name: str) -> None:
+        """Удаляет партицию целиком — за постоянное время, без DELETE по строкам."""
+        if not name.startswith(MERGE_LOG_PARTITION_PREFIX):
+            raise ValueError(f"Не партиция merge_block_logs: {name}")
+        await session.execute(text(f"DROP TABLE IF EXISTS {name}"))
+
+    async def delete_default_partition_logs(
+        self, session: AsyncSession, cutoff: date, limit: int
+    ) -> int:
+        """
+        Удаляет из партиции по умолчанию не больше `limit` строк старше `cutoff`;
+        возвращает число удалённых строк.
+        """
+        result = await session.execute(
+            text(
+                f"""
+                DELETE FROM {MERGE_LOG_DEFAULT_PARTITION}
+                WHERE ctid IN (
+                    SELECT ctid FROM {MERGE_LOG_DEFAULT_PARTITION}
+                    WHERE created_at < :cutoff
+                    LIMIT :limit
+                )
+                """
+            ),
+            {"cutoff": cutoff, "limit": limit},
+        )
+        return result.rowcount
+
+    async def notify_settings_changed(
+        self, session: AsyncSession, channel: str, subdomain: str
+    ) -> None:
+        """Публикует NOTIFY об изменении настроек; доставляется при коммите транзакции."""
+        await session.execute(
+            text("SELECT pg_notify(:channel, :subdomain)"),
+            {"channel": channel, "subdomain": subdomain},
+        )
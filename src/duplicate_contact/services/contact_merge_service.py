@@ -1,12 +1,29 @@
+import asyncio
+import time
+
 from loguru import logger
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.amocrm.service import AmocrmService
-from src.common.exceptions import AmoCRMServiceError, NetworkError, ProcessingError
+from src.common import tracing
+from src.common.config import (
+    MERGE_CHUNK_CONCURRENCY,
+    MERGE_CHUNK_SIZE,
+)
+from src.common.exceptions import (
+    AmoCRMServiceError,
+    NetworkError,
+    ProcessingError,
+    SubdomainLockedError,
+    TokenError,
+)
+from src.common.metrics import DUPLICATE_GROUPS_FOUND, MERGE_SECONDS
+from src.common.profiling import stage
 from src.duplicate_contact.repository import ContactDuplicateRepository
 from src.duplicate_contact.schemas import ContactDuplicateSettingsSchema
 from src.duplicate_contact.services.base import ContactService
 from src.duplicate_contact.services.find_duplicate import DuplicateFinderService
+from src.duplicate_contact.services.merged_contacts import MergedContactsService
 from src.duplicate_contact.utils.prepare_merge_data import prepare_merge_data
 
 
@@ -18,10 +35,12 @@ class ContactMergeService(ContactService):
         find_duplicate_service: DuplicateFinderService,
         duplicate_repo: ContactDuplicateRepository,
         amocrm_service: AmocrmService,
+        merged_contacts_service: MergedContactsService,
     ):
         super().__init__(amocrm_service)
         self.find_duplicate_service = find_duplicate_service
         self.duplicate_repo = duplicate_repo
+        self.merged_contacts_service = merged_contacts_service
 
     async def merge_all_contacts(
         self,
@@ -30,13 +49,16 @@ class ContactMergeService(ContactService):
         session: AsyncSession,
     ) -> list[dict[str, any]]:
         log = logger.bind(subdomain=settings.subdomain)
+        started = time.perf_counter()
         try:
+            await self._lock_subdomain(session, settings.subdomain)
             groups = await self.find_duplicate_service.find_duplicates_all_contacts(
                 subdomain=settings.subdomain,
                 access_token=access_token,
-                blocks=settings.keys,
+                blocks=settings.blocks,
                 merge_all=settings.merge_all,
             )
+            DUPLICATE_GROUPS_FOUND.labels(settings.subdomain).inc(len(groups))
             if not groups:
                 log.info("Дубли не найдены для объединения.")
                 return []
@@ -51,12 +73,16 @@ class ContactMergeService(ContactService):
             ]
             log.info(f"Обработано {len(results)} групп дублей")
             return results
-        except NetworkError:
+        except (NetworkError, TokenError):
             log.error("Сетевая ошибка при поиске дублей")
             raise  # Для retry
         except Exception as e:
             log.exception(f"Неизвестная ошибка при объединении всех контактов: {e}")
             raise ProcessingError("Ошибка обработки дублей")
+        finally:
+            MERGE_SECONDS.labels(settings.subdomain, "all").observe(
+                time.perf_counter() - started
+            )
 
     async def merge_single_contact(
         self,
@@ -65,18 +91,26 @@ class ContactMergeService(ContactService):
         contact_id: int,
         session: AsyncSession,
     ) -> dict[str, any]:
+        """
+        Объединяет дубли одного контакта. Консьюмер merge_single склеивает
+        контакты пакетами (merge_contacts_batch); метод остаётся для разовой
+        склейки одного контакта.
+        """
         log = logger.bind(subdomain=settings.subdomain, contact_id=contact_id)
+        started = time.perf_counter()
         try:
+            await self._lock_subdomain(session, settings.subdomain)
             group = await self.find_duplicate_service.find_duplicates_single_contact(
                 subdomain=settings.subdomain,
                 access_token=access_token,
                 target_contact_id=contact_id,
-                blocks=settings.keys,
+                blocks=settings.blocks,
                 merge_all=settings.merge_all,
             )
             if not group or len(group.get("group", [])) < 2:
                 log.debug("Дубли не найдены для одного контакта")
                 return {}
+            DUPLICATE_GROUPS_FOUND.labels(settings.subdomain).inc()
 
             contact_ids = [c["id"] for c in group.get("group", [])]
             log.info(
@@ -86,9 +120,73 @@ class ContactMergeService(ContactService):
                 group, settings, access_token, session
             )
             return result or {}
+        except (NetworkError, TokenError):
+            raise  # Для retry
         except Exception as e:
             log.exception(f"Ошибка при объединении контакта: {e}")
             raise ProcessingError(f"Ошибка обработки контакта {contact_id}")
+        finally:
+            MERGE_SECONDS.labels(settings.subdomain, "single").observe(
+                time.perf_counter() - started
+            )
+
+    async def merge_contacts_batch(
+        self,
+        settings: ContactDuplicateSettingsSchema,
+        access_token: str,
+        contact_ids: list[int],
+        session: AsyncSession,
+    ) -> list[dict[str, any]]:
+        """Объединяет дубли для пакета контактов одного subdomain."""
+        log = logger.bind(subdomain=settings.subdomain)
+        started = time.perf_counter()
+        try:
+            await self._lock_subdomain(session, settings.subdomain)
+            groups = await self.find_duplicate_service.find_duplicates_for_contacts(
+                subdomain=settings.subdomain,
+                access_token=access_token,
+                target_contact_ids=contact_ids,
+                blocks=settings.blocks,
+                merge_all=settings.merge_all,
+            )
+            DUPLICATE_GROUPS_FOUND.labels(settings.subdomain).inc(len(groups))
+            if not groups:
+                log.debug(f"Дубли не найдены для пакета из {len(contact_ids)} контактов")
+                return []
+
+            log.info(
+                f"Найдено {len(groups)} групп дублей для пакета из {len(contact_ids)} контактов"
+            )
+            return [
+                result
+                async for result in self._process_groups(
+                    groups, settings, access_token, session
+                )
+                if result
+            ]
+        except (NetworkError, TokenError):
+            raise  # Для retry
+        except Exception as e:
+            log.exception(f"Ошибка при объединении пакета контактов: {e}")
+            raise ProcessingError(f"Ошибка обработки пакета контактов {contact_ids}")
+        finally:
+            MERGE_SECONDS.labels(settings.subdomain, "batch").observe(
+                time.perf_counter() - started
+            )
+
+    async def _lock_subdomain(self, session: AsyncSession, subdomain: str) -> None:
+        """
+        Берёт advisory lock subdomain на время транзакции, чтобы реплики
+        не склеивали пересекающиеся группы одного аккаунта одновременно.
+        Lock не ждём: склейка всех контактов может держать его минутами,
+        поэтому занятый lock сразу поднимает SubdomainLockedError, и консьюмер
+        откладывает сообщение, не занимая соединение и слот обработки.
+        """
+        with stage("db"):
+            if not await self.duplicate_repo.try_lock_subdomain(session, subdomain):
+                raise SubdomainLockedError(
+                    f"Склейка для {subdomain} уже выполняется другим процессом"
+                )
 
     async def _process_groups(
         self,
@@ -104,6 +202,7 @@ class ContactMergeService(ContactService):
                     group_data, settings, access_token, session
                 )
 
+    @tracing.traced("merge contact group")
     async def _merge_contact_group(
         self,
         group_data: dict[str, any],
@@ -114,31 +213,135 @@ class ContactMergeService(ContactService):
         log = logger.bind(subdomain=settings.subdomain)
         group = group_data["group"]
         contact_ids = [c["id"] for c in group]
+        tracing.set_attributes(
+            {"subdomain": settings.subdomain, "contacts.group_size": len(group)}
+        )
         try:
-            main_contact, *duplicates = group
-            payload = await prepare_merge_data(
-                main_contact, duplicates, settings.priority_fields
-            )
-            log.debug(f"Payload для слияния: {payload}")
+            with stage("merge"):
+                main_contact, *duplicates = group
+                # Значения полей итогового контакта считаются по всей группе сразу,
+                # чтобы склейка деревом совпадала со склейкой в самый старый контакт
+                payload = await prepare_merge_data(
+                    main_contact, duplicates, settings.priority_fields
+                )
+                if len(group) > MERGE_CHUNK_SIZE:
+                    log.info(
+                        f"Группа из {len(group)} контактов склеивается по чанкам "
+                        f"по {MERGE_CHUNK_SIZE}"
+                    )
+                    survivors = await self._reduce_group(
+                        group, settings, access_token, session
+                    )
+                    payload["id[]"] = [c["id"] for c in survivors]
+                log.debug("Payload для слияния: {}", payload)
 
-            merge_response = await self.amocrm_service.merge_contacts(
-                settings.subdomain, access_token, payload
-            )
+                merge_response = await self.amocrm_service.merge_contacts(
+                    settings.subdomain, access_token, payload
+                )
             log.info(f"Слияние успешно для контактов: {contact_ids}")
+            with stage("db"):
+                await self.merged_contacts_service.add(
+                    session,
+                    settings.subdomain,
+                    [cid for cid in contact_ids if cid != main_contact["id"]],
+                )
 
-            await self._add_merged_tag(
-                settings.subdomain, access_token, main_contact["id"], payload
-            )
-            if matched_block_db_id := group_data.get("matched_block_db_id"):
-                await self.duplicate_repo.insert_merge_block_log(
-                    session, settings.subdomain, matched_block_db_id, main_contact["id"]
+            with stage("merge"):
+                await self._add_merged_tag(
+                    settings.subdomain, access_token, main_contact["id"], payload
                 )
+            if matched_block_db_id := group_data.get("matched_block_db_id"):
+                with stage("db"):
+                    await self.duplicate_repo.insert_merge_block_log(
+                        session,
+                        settings.subdomain,
+                        matched_block_db_id,
+                        main_contact["id"],
+                    )
 
             return merge_response
+        except (NetworkError, TokenError):
+            log.error(f"Повторяемая ошибка при слиянии группы {contact_ids}")
+            raise  # Для retry
         except Exception as e:
             log.exception(f"Неизвестная ошибка при слиянии группы {contact_ids}: {e}")
+            tracing.set_error(str(e))
             return None
 
+    async def _reduce_group(
+        self,
+        group: list[dict[str, any]],
+        settings: ContactDuplicateSettingsSchema,
+        access_token: str,
+        session: AsyncSession,
+    ) -> list[dict[str, any]]:
+        """
+        Сводит большую группу к не более чем MERGE_CHUNK_SIZE контактам.
+        Группа отсортирована по created_at, поэтому каждый чанк склеивается
+        в свой самый старый контакт, а самый старый контакт всей группы
+        остаётся первым выжившим на каждом уровне дерева. Значения полей
+        промежуточных склеек не важны: итоговая склейка задаёт их по всей группе.
+        """
+        semaphore = asyncio.Semaphore(MERGE_CHUNK_CONCURRENCY)
+        # Чанки склеиваются параллельно, а сессия БД одна на всех
+        session_lock = asyncio.Lock()
+
+        async def merge_chunk(chunk: list[dict[str, any]]) -> dict[str, any]:
+            async with semaphore:
+                survivor = await self._merge_chunk(chunk, settings, access_token)
+            # Поглощённые контакты запоминаются сразу: если следующий уровень
+            # или итоговая склейка упадут, они уже не будут склеиваться повторно
+            async with session_lock:
+                with stage("db"):
+                    await self.merged_contacts_service.add(
+                        session,
+                        settings.subdomain,
+                        [c["id"] for c in chunk if c["id"] != survivor["id"]],
+                    )
+            return survivor
+
+        while len(group) > MERGE_CHUNK_SIZE:
+            chunks = [
+                group[i : i + MERGE_CHUNK_SIZE]
+                for i in range(0, len(group), MERGE_CHUNK_SIZE)
+            ]
+            # Дожидаемся всех чанков уровня, даже если какой-то упал: успешные
+            # должны записать tombstones, пока сессия ещё принадлежит группе
+            results = await asyncio.gather(
+                *(merge_chunk(c) for c in chunks), return_exceptions=True
+            )
+            for result in results:
+                if isinstance(result, BaseException):
+                    raise result
+            group = list(results)
+        return group
+
+    async def _merge_chunk(
+        self,
+        chunk: list[dict[str, any]],
+        settings: ContactDuplicateSettingsSchema,
+        access_token: str,
+    ) -> dict[str, any]:
+        """Склеивает чанк в его самый старый контакт и возвращает актуальное состояние выжившего."""
+        main_contact, *duplicates = chunk
+        if not duplicates:
+            return main_contact
+
+        payload = await prepare_merge_data(
+            main_contact, duplicates, settings.priority_fields
+        )
+        await self.amocrm_service.merge_contacts(
+            settings.subdomain, access_token, payload
+        )
+        survivor = await self.amocrm_service.get_contact_by_id(
+            settings.subdomain, access_token, main_contact["id"], with_leads=True
+        )
+        if not survivor:
+            raise AmoCRMServiceError(
+                f"Контакт {main_contact['id']} не найден после промежуточной склейки"
+            )
+        return survivor
+
     async def _add_merged_tag(
         self,
         subdomain: str,
@@ -1,3 +1,4 @@
+import orjson
 from loguru import logger
 from sqlalchemy.ext.asyncio import AsyncSession
 
@@ -6,29 +7,56 @@ from src.common.exceptions import (
     ProcessingError,
     ValidationError,
 )
-from src.duplicate_contact.models import Settings
 from src.duplicate_contact.repository import ContactDuplicateRepository
 from src.duplicate_contact.schemas import ContactDuplicateSettingsSchema
+from src.duplicate_contact.services.settings_cache import (
+    SETTINGS_CHANGED_CHANNEL,
+    SettingsCache,
+)
 
 
 class DuplicateSettingsService:
     """Сервис для управления настройками дублей."""
 
-    def __init__(self, duplicate_repo: ContactDuplicateRepository):
+    def __init__(
+        self, duplicate_repo: ContactDuplicateRepository, settings_cache: SettingsCache
+    ):
         self.duplicate_repo = duplicate_repo
+        self.settings_cache = settings_cache
 
     async def get_duplicate_settings(
         self, session: AsyncSession, subdomain: str
     ) -> ContactDuplicateSettingsSchema:
         """Получает настройки дублей по subdomain."""
+        settings, _ = await self._get_cached(session, subdomain)
+        return settings
+
+    async def get_duplicate_settings_json(
+        self, session: AsyncSession, subdomain: str
+    ) -> str:
+        """Получает настройки дублей по subdomain, сериализованные в JSON."""
+        _, settings_json = await self._get_cached(session, subdomain)
+        return settings_json
+
+    async def _get_cached(
+        self, session: AsyncSession, subdomain: str
+    ) -> tuple[ContactDuplicateSettingsSchema, str]:
+        """Возвращает настройки из кэша, при промахе загружает их из БД."""
+        cached = self.settings_cache.get(subdomain)
+        if cached:
+            return cached
+
         try:
-            settings = await self.duplicate_repo.get_settings_by_subdomain(
+            version = self.settings_cache.version(subdomain)
+            settings_json = await self.duplicate_repo.get_settings_tree_json(
                 session, subdomain
             )
-            if not settings:
+            if not settings_json:
                 raise SettingsNotFoundError(f"Настройки не найдены для {subdomain}")
-            result = self._map_to_schema(settings)
-            return result
+            result = ContactDuplicateSettingsSchema.model_validate(
+                orjson.loads(settings_json)
+            )
+            return result, self.settings_cache.set(subdomain, result, version)
         except Exception as e:
             raise ProcessingError(
                 f"Ошибка получения настроек для subdomain={subdomain}, message={e}"
@@ -37,22 +65,22 @@ class DuplicateSettingsService:
     async def add_duplicate_settings(
         self, session: AsyncSession, data: ContactDuplicateSettingsSchema
     ) -> dict[str, any]:
-        """Добавляет или обновляет настройки дублей."""
+        """
+        Добавляет или обновляет настройки дублей. Сохранённое дерево сравнивается
+        с новым и применяются только изменения, поэтому id блоков и логи склейки
+        не меняются, а число запросов не зависит от размера настроек.
+        """
         try:
             logger.info("Добавление или обновление настроек дублей")
             if not data.subdomain:
                 raise ValidationError("Subdomain обязателен для настроек")
 
-            existing_settings = await self.duplicate_repo.get_settings_by_subdomain(
-                session, data.subdomain
+            settings_id = await self._save_settings_tree(session, data)
+            await self.duplicate_repo.notify_settings_changed(
+                session, SETTINGS_CHANGED_CHANNEL, data.subdomain
             )
-            if existing_settings:
-                await self.duplicate_repo.delete_settings_by_subdomain(
-                    session, data.subdomain
-                )
-
-            settings_id = await self._insert_settings(session, data)
             await session.commit()
+            self.settings_cache.invalidate(data.subdomain)
             logger.info(f"Настройки успешно сохранены с id={settings_id}")
             return {"id": settings_id, "subdomain": data.subdomain}
         except Exception as e:
@@ -61,88 +89,62 @@ class DuplicateSettingsService:
                 f"Ошибка добавления настроек для subdomain={data.subdomain}, message={e}"
             )
 
-    async def _insert_settings(
+    async def _save_settings_tree(
         self, session: AsyncSession, data: ContactDuplicateSettingsSchema
     ) -> int:
-        """Вставляет настройки и связанные данные."""
-        settings_id = await self.duplicate_repo.insert_settings(session, data)
-        logger.debug(f"Вставлены основные настройки с id={settings_id}")
-
-        if data.priority_fields:
-            await self.duplicate_repo.insert_priority_fields(
-                session, settings_id, data.priority_fields
+        """Синхронизирует настройки и связанные данные пакетными upsert/delete."""
+        settings_id = await self.duplicate_repo.upsert_settings(session, data)
+        logger.debug(f"Сохранены основные настройки с id={settings_id}")
+
+        priority_fields = list(
+            dict.fromkeys(
+                field if isinstance(field, str) else field["field_name"]
+                for field in data.priority_fields or []
             )
-            logger.debug(f"Вставлены приоритетные поля: {data.priority_fields}")
-
-        block_mapping = (
-            await self.duplicate_repo.insert_blocks(session, settings_id, data.keys)
-            if data.keys
-            else {}
         )
-        logger.debug(f"Вставлены блоки: {block_mapping.keys()}")
-
-        for block in data.keys or []:
-            await self._insert_block_fields(
-                session, block, block_mapping.get(block["block_id"])
-            )
-        return settings_id
-
-    async def _insert_block_fields(
-        self, session: AsyncSession, block: dict[str, any], db_block_id: int | None
-    ) -> None:
-        """Вставляет поля блока и их исключения."""
-        if not db_block_id or "fields" not in block or not block["fields"]:
-            logger.warning("Пропущен блок без db_block_id или полей: {}", block)
-            return
-
-        field_mapping = await self.duplicate_repo.insert_block_fields(
-            session, db_block_id, block["fields"]
+        await self.duplicate_repo.sync_priority_fields(
+            session, settings_id, priority_fields
         )
-        logger.debug(
-            f"Вставлены поля блока: {block.get('block_id')}, поля {field_mapping.keys()}"
+        logger.debug(f"Сохранены приоритетные поля: {priority_fields}")
+
+        # client block_id → {field_name: [значения исключений]}
+        blocks: dict[int, dict[str, list[str]]] = {}
+        for block in data.blocks or []:
+            fields = blocks.setdefault(block["block_id"], {})
+            if not block.get("fields"):
+                logger.warning("Блок без полей: {}", block)
+                continue
+            for field in block["fields"]:
+                values = fields.setdefault(field["field_name"], [])
+                values.extend(ex["value"] for ex in field.get("exclusion_fields") or [])
+
+        block_mapping = await self.duplicate_repo.sync_blocks(
+            session, settings_id, list(blocks)
         )
-
-        for field in block["fields"]:
-            if field.get("exclusion_fields"):
-                db_field_id = field_mapping.get(field["field_name"])
-                if db_field_id:
-                    await self.duplicate_repo.insert_exclusion_values(
-                        session,
-                        db_field_id,
-                        field["field_name"],
-                        field["exclusion_fields"],
-                    )
-                    logger.debug(
-                        "Добавлены исключения для поля {}: {}",
-                        field["field_name"],
-                        field["exclusion_fields"],
-                    )
-                else:
-                    logger.warning(f"Не найдено поле для исключений: {field}")
-
-    @staticmethod
-    def _map_to_schema(settings: "Settings") -> ContactDuplicateSettingsSchema:
-        """Преобразует объект Settings в схему."""
-        return ContactDuplicateSettingsSchema(
-            subdomain=settings.subdomain,
-            merge_all=settings.merge_all,
-            blocked_creation=settings.blocked_creation,
-            merge_is_active=settings.merge_is_active,
-            priority_fields=[f.field_name for f in settings.priority_fields],
-            blocks=[
-                {
-                    "db_id": b.id,
-                    "block_id": b.block_id,
-                    "fields": [
-                        {
-                            "field_name": bf.field_name,
-                            "exclusion_fields": [
-                                {"value": ex.value} for ex in bf.exclusion_values or []
-                            ],
-                        }
-                        for bf in b.fields
-                    ],
-                }
-                for b in settings.keys
+        logger.debug(f"Сохранены блоки: {block_mapping.keys()}")
+
+        field_mapping = await self.duplicate_repo.sync_block_fields(
+            session,
+            list(block_mapping.values()),
+            [
+                (block_mapping[block_id], field_name)
+                for block_id, fields in blocks.items()
+                for field_name in fields
             ],
         )
+        logger.debug(f"Сохранено полей блоков: {len(field_mapping)}")
+
+        exclusions = list(
+            dict.fromkeys(
+                (field_mapping[(block_mapping[block_id], field_name)], field_name, value)
+                for block_id, fields in blocks.items()
+                for field_name, values in fields.items()
+                for value in values
+            )
+        )
+        await self.duplicate_repo.sync_exclusion_values(
+            session, list(field_mapping.values()), exclusions
+        )
+        logger.debug(f"Сохранено исключений: {len(exclusions)}")
+        return settings_id
+
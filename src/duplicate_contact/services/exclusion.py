@@ -2,6 +2,10 @@ from loguru import logger
 from sqlalchemy.ext.asyncio import AsyncSession
 from src.duplicate_contact.repository import ContactDuplicateRepository
 from src.duplicate_contact.services.find_duplicate import DuplicateFinderService
+from src.duplicate_contact.services.settings_cache import (
+    SETTINGS_CHANGED_CHANNEL,
+    SettingsCache,
+)
 from .base import ContactService
 from ...amocrm.service import AmocrmService
 
@@ -14,10 +18,12 @@ class ContactExclusionService(ContactService):
         duplicate_repo: ContactDuplicateRepository,
         amocrm_service: AmocrmService,
         find_duplicate_service: DuplicateFinderService,
+        settings_cache: SettingsCache,
     ):
         super().__init__(amocrm_service)
         self.duplicate_repo = duplicate_repo
         self.find_duplicate_service = find_duplicate_service
+        self.settings_cache = settings_cache
 
     async def add_contact_to_exclusion(
         self, session: AsyncSession, subdomain: str, contact_id: int, access_token: str
@@ -42,7 +48,13 @@ class ContactExclusionService(ContactService):
             return {"error": "Контакт не найден"}
 
         added_exclusions = await self._add_exclusions(session, contact, block.fields)
+        if added_exclusions:
+            await self.duplicate_repo.notify_settings_changed(
+                session, SETTINGS_CHANGED_CHANNEL, subdomain
+            )
         await session.commit()
+        if added_exclusions:
+            self.settings_cache.invalidate(subdomain)
 
         return {"status": "success", "added_exclusions": added_exclusions}
 
@@ -2,15 +2,22 @@ import time
 from collections import defaultdict
 from loguru import logger
 from src.amocrm.service import AmocrmService
+from src.common import tracing
+from src.common.exceptions import AmoCRMServiceError
+from src.common.log_sampling import LogSampler, SkipCounter
+from src.common.metrics import CONTACTS_SCANNED
+from src.common.profiling import stage
 
 
 class DuplicateFinderService:
     """Сервис для поиска дублей контактов."""
 
     DAY_SECONDS = 86400
+    EMPTY_FIELD_MESSAGE = "Контакты пропущены из-за пустого поля"
 
     def __init__(self, amocrm_service: AmocrmService):
         self.amocrm_service = amocrm_service
+        self.log_sampler = LogSampler()
 
     async def find_duplicates_single_contact(
         self,
@@ -20,10 +27,15 @@ class DuplicateFinderService:
         blocks: list[dict],
         merge_all: bool = True,
     ) -> dict[str, any] | None:
-        """Находит дубли для одного контакта."""
-        target_contact = await self.amocrm_service.get_contact_by_id(
-            subdomain, access_token, target_contact_id
-        )
+        """
+        Находит дубли для одного контакта.
+        Консьюмер merge_single ищет дубли пакетом (find_duplicates_for_contacts);
+        метод остаётся для поиска по одному контакту и его бенчмарка.
+        """
+        with stage("fetch"):
+            target_contact = await self.amocrm_service.get_contact_by_id(
+                subdomain, access_token, target_contact_id
+            )
         if not target_contact or (
             not merge_all and not self._is_recent(target_contact)
         ):
@@ -33,7 +45,17 @@ class DuplicateFinderService:
         candidates = await self._get_candidates(
             subdomain, access_token, target_contact_id, merge_all
         )
-        return await self._find_matching_group(target_contact, candidates, blocks)
+        CONTACTS_SCANNED.labels(subdomain).inc(len(candidates) + 1)
+        skipped = SkipCounter()
+        with stage("group"), tracing.span(
+            "find duplicates group",
+            attributes={"contacts.candidates": len(candidates), "contact.id": target_contact_id},
+        ):
+            group = await self._find_matching_group(
+                target_contact, candidates, blocks, skipped
+            )
+        skipped.flush(self.EMPTY_FIELD_MESSAGE, log=logger.bind(subdomain=subdomain))
+        return group
 
     async def find_duplicates_all_contacts(
         self,
@@ -43,28 +65,111 @@ class DuplicateFinderService:
         merge_all: bool = True,
     ) -> list[dict[str, any]]:
         """Находит все группы дублей."""
-        contacts = await self.amocrm_service.get_all_contacts(subdomain, access_token)
+        with stage("fetch"):
+            contacts = await self.amocrm_service.get_all_contacts(subdomain, access_token)
         if not contacts:
             logger.info("Контакты не найдены.")
             return []
 
         if not merge_all:
             contacts = [contact for contact in contacts if self._is_recent(contact)]
+        CONTACTS_SCANNED.labels(subdomain).inc(len(contacts))
 
-        return [
-            {
-                "group": sorted(group, key=lambda x: x.get("created_at", float("inf"))),
-                "matched_block_db_id": block["db_id"],
-            }
-            for block in blocks
-            for group in self._group_by_block(contacts, block)
-        ]
+        skipped = SkipCounter()
+        with stage("group"), tracing.span(
+            "find duplicates group",
+            attributes={"contacts.candidates": len(contacts), "blocks": len(blocks)},
+        ):
+            groups = [
+                {
+                    "group": sorted(
+                        group, key=lambda x: x.get("created_at", float("inf"))
+                    ),
+                    "matched_block_db_id": block["db_id"],
+                }
+                for block in blocks
+                for group in self._group_by_block(contacts, block, skipped)
+            ]
+        skipped.flush(self.EMPTY_FIELD_MESSAGE, log=logger.bind(subdomain=subdomain))
+        return groups
+
+    async def find_duplicates_for_contacts(
+        self,
+        subdomain: str,
+        access_token: str,
+        target_contact_ids: list[int],
+        blocks: list[dict],
+        merge_all: bool = True,
+    ) -> list[dict[str, any]]:
+        """
+        Находит группы дублей для пакета контактов за одну выгрузку контактов.
+        Для каждого блока один раз строится индекс контактов по значениям его
+        полей, и дубли каждого контакта пакета ищутся в индексе, а не проходом
+        по всем контактам. Контакт, уже попавший в найденную группу, повторно
+        не обрабатывается.
+        """
+        with stage("fetch"):
+            contacts = await self.amocrm_service.get_all_contacts(subdomain, access_token)
+        by_id = {contact["id"]: contact for contact in contacts}
+        if not merge_all:
+            contacts = [contact for contact in contacts if self._is_recent(contact)]
+        CONTACTS_SCANNED.labels(subdomain).inc(len(contacts))
+
+        groups = []
+        grouped_ids = set()
+        # Позиция блока → индекс контактов; строится при первом обращении
+        indexes: dict[int, dict[tuple, list[dict]]] = {}
+        skipped = SkipCounter()
+        for contact_id in target_contact_ids:
+            if contact_id in grouped_ids:
+                continue
+
+            target_contact = by_id.get(contact_id) or await self._get_contact_or_none(
+                subdomain, access_token, contact_id
+            )
+            if not target_contact or (
+                not merge_all and not self._is_recent(target_contact)
+            ):
+                self.log_sampler.log(
+                    "find_duplicates_for_contacts.not_found",
+                    "INFO",
+                    "Контакт {} не найден или старше 24 часов.",
+                    contact_id,
+                )
+                continue
+
+            with stage("group"), tracing.span(
+                "find duplicates group",
+                attributes={"contacts.candidates": len(contacts), "contact.id": contact_id},
+            ):
+                group = self._find_group_in_indexes(
+                    target_contact, contacts, blocks, indexes, grouped_ids, skipped
+                )
+            if group and len(group["group"]) >= 2:
+                grouped_ids.update(contact["id"] for contact in group["group"])
+                groups.append(group)
+        skipped.flush(self.EMPTY_FIELD_MESSAGE, log=logger.bind(subdomain=subdomain))
+        return groups
+
+    async def _get_contact_or_none(
+        self, subdomain: str, access_token: str, contact_id: int
+    ) -> dict | None:
+        """Получает контакт по ID; удалённый или поглощённый контакт не роняет весь пакет."""
+        try:
+            with stage("fetch"):
+                return await self.amocrm_service.get_contact_by_id(
+                    subdomain, access_token, contact_id
+                )
+        except AmoCRMServiceError as e:
+            logger.warning(f"Контакт {contact_id} недоступен: {e}")
+            return None
 
     async def _get_candidates(
         self, subdomain: str, access_token: str, contact_id: int, merge_all: bool
     ) -> list[dict]:
         """Получает список кандидатов на дубли."""
-        contacts = await self.amocrm_service.get_all_contacts(subdomain, access_token)
+        with stage("fetch"):
+            contacts = await self.amocrm_service.get_all_contacts(subdomain, access_token)
         candidates = [contact for contact in contacts if contact["id"] != contact_id]
         return (
             candidates
@@ -73,7 +178,11 @@ class DuplicateFinderService:
         )
 
     async def _find_matching_group(
-        self, target_contact: dict, candidates: list[dict], blocks: list[dict]
+        self,
+        target_contact: dict,
+        candidates: list[dict],
+        blocks: list[dict],
+        skipped: SkipCounter | None = None,
     ) -> dict | None:
         """Ищет первую подходящую группу дублей."""
         for block in blocks:
@@ -81,38 +190,95 @@ class DuplicateFinderService:
             if not fields:
                 continue
 
-            main_values = self._extract_values(target_contact, fields)
+            main_values = self._extract_values(target_contact, fields, skipped)
             if not main_values:
                 continue
 
             duplicates = [
                 candidate
                 for candidate in candidates
-                if self._is_duplicate(candidate, main_values, fields, exclusions)
+                if self._is_duplicate(candidate, main_values, fields, exclusions, skipped)
             ]
             if duplicates:
-                group = {
-                    target_contact["id"]: target_contact,
-                    **{c["id"]: c for c in duplicates},
-                }
-                return {
-                    "group": sorted(
-                        group.values(), key=lambda x: x.get("created_at", float("inf"))
-                    ),
-                    "matched_block_db_id": block.get("db_id"),
-                }
+                return self._make_group(target_contact, duplicates, block)
+        return None
+
+    def _find_group_in_indexes(
+        self,
+        target_contact: dict,
+        contacts: list[dict],
+        blocks: list[dict],
+        indexes: dict[int, dict[tuple, list[dict]]],
+        excluded_ids: set[int],
+        skipped: SkipCounter | None = None,
+    ) -> dict | None:
+        """
+        То же, что _find_matching_group, но дубли берутся из индексов блоков
+        (см. _build_block_index); контакты excluded_ids не рассматриваются.
+        """
+        for position, block in enumerate(blocks):
+            fields, exclusions = self._parse_block(block)
+            if not fields:
+                continue
+
+            main_values = self._extract_values(target_contact, fields, skipped)
+            if not main_values:
+                continue
+
+            if position not in indexes:
+                indexes[position] = self._build_block_index(
+                    contacts, fields, exclusions, skipped
+                )
+            duplicates = [
+                candidate
+                for candidate in indexes[position].get(tuple(main_values.values()), [])
+                if candidate["id"] != target_contact["id"]
+                and candidate["id"] not in excluded_ids
+            ]
+            if duplicates:
+                return self._make_group(target_contact, duplicates, block)
         return None
 
-    def _group_by_block(self, contacts: list[dict], block: dict) -> list[list[dict]]:
+    def _build_block_index(
+        self,
+        contacts: list[dict],
+        fields: list[str],
+        exclusions: dict,
+        skipped: SkipCounter | None = None,
+    ) -> dict[tuple, list[dict]]:
+        """Контакты по значениям полей блока; контакты под исключением в индекс не входят."""
+        index = defaultdict(list)
+        for contact in contacts:
+            values = self._extract_values(contact, fields, skipped)
+            if values and not self._has_exclusion(contact, exclusions, fields):
+                index[tuple(values.values())].append(contact)
+        return index
+
+    @staticmethod
+    def _make_group(target_contact: dict, duplicates: list[dict], block: dict) -> dict:
+        group = {
+            target_contact["id"]: target_contact,
+            **{c["id"]: c for c in duplicates},
+        }
+        return {
+            "group": sorted(
+                group.values(), key=lambda x: x.get("created_at", float("inf"))
+            ),
+            "matched_block_db_id": block.get("db_id"),
+        }
+
+    def _group_by_block(
+        self, contacts: list[dict], block: dict, skipped: SkipCounter | None = None
+    ) -> list[list[dict]]:
         """Группирует контакты по блоку."""
         fields, exclusions = self._parse_block(block)
         if not fields:
-            logger.debug(f"Блок без полей: {block}")
+            logger.debug("Блок без полей: {}", block)
             return []
 
         groups_dict = defaultdict(list)
         for contact in contacts:
-            values = self._extract_values(contact, fields)
+            values = self._extract_values(contact, fields, skipped)
             if values:
                 groups_dict[tuple(values.values())].append(contact)
 
@@ -122,22 +288,34 @@ class DuplicateFinderService:
             if len(group) > 1
         ]
 
-    def _extract_values(self, contact: dict, fields: list[str]) -> dict[str, str]:
-        """Извлекает значения полей из контакта."""
+    def _extract_values(
+        self, contact: dict, fields: list[str], skipped: SkipCounter | None = None
+    ) -> dict[str, str]:
+        """
+        Извлекает значения полей из контакта.
+        Контакт с пустым полем не логируется по отдельности, а учитывается
+        в skipped: итог по полям выводится один раз на задачу.
+        """
         values = {}
         for field in fields:
             value = self.extract_field_value_simple(contact, field)
             if not value:
-                logger.debug(f"Поле '{field}' пустое у контакта {contact['id']}")
+                if skipped is not None:
+                    skipped.add(field)
                 return {}
             values[field] = value
         return values
 
     def _is_duplicate(
-        self, candidate: dict, main_values: dict, fields: list[str], exclusions: dict
+        self,
+        candidate: dict,
+        main_values: dict,
+        fields: list[str],
+        exclusions: dict,
+        skipped: SkipCounter | None = None,
     ) -> bool:
         """Проверяет, является ли контакт дублем."""
-        candidate_values = self._extract_values(candidate, fields)
+        candidate_values = self._extract_values(candidate, fields, skipped)
         return (
             candidate_values
             and all(candidate_values[field] == main_values[field] for field in fields)
@@ -162,7 +340,8 @@ class DuplicateFinderService:
             if field.get("field_name") == field_name and field.get("values"):
                 value = field["values"][0].get("value")
                 if value:
-                    field_code = field.get("field_code", "").upper()
+                    # У пользовательских полей amoCRM field_code равен null
+                    field_code = (field.get("field_code") or "").upper()
                     return (
                         DuplicateFinderService.normalize_phone(value)
                         if field_code == "PHONE"
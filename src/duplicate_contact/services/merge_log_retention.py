@@ -0,0 +1,133 @@
+import asyncio
+from datetime import date
+
+from loguru import logger
+
+from src.common.config import (
+    MERGE_LOG_DEFAULT_DELETE_BATCH,
+    MERGE_LOG_DEFAULT_DELETE_MAX,
+    MERGE_LOG_MAINTENANCE_INTERVAL,
+    MERGE_LOG_PARTITIONS_AHEAD,
+    MERGE_LOG_RETENTION_MONTHS,
+)
+from src.common.database import DatabaseManager
+from src.duplicate_contact.repository import (
+    MERGE_LOG_PARTITION_PREFIX,
+    ContactDuplicateRepository,
+)
+
+
+def add_months(month_start: date, months: int) -> date:
+    """Первое число месяца, отстоящего на `months` от `month_start`."""
+    index = month_start.year * 12 + month_start.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+class MergeLogRetentionService:
+    """
+    Обслуживание помесячных партиций merge_block_logs: заранее создаёт партиции
+    на `months_ahead` месяцев вперёд и удаляет партиции старше `retention_months`;
+    старые строки партиции по умолчанию удаляет порциями.
+    Выполняется под advisory lock, поэтому из нескольких реплик работает одна.
+    """
+
+    def __init__(
+        self,
+        db_manager: DatabaseManager,
+        duplicate_repo: ContactDuplicateRepository,
+        retention_months: int = MERGE_LOG_RETENTION_MONTHS,
+        months_ahead: int = MERGE_LOG_PARTITIONS_AHEAD,
+        interval: int = MERGE_LOG_MAINTENANCE_INTERVAL,
+        delete_batch: int = MERGE_LOG_DEFAULT_DELETE_BATCH,
+        delete_max: int = MERGE_LOG_DEFAULT_DELETE_MAX,
+    ):
+        self.db_manager = db_manager
+        self.duplicate_repo = duplicate_repo
+        self.retention_months = retention_months
+        self.months_ahead = months_ahead
+        self.interval = interval
+        self.delete_batch = delete_batch
+        self.delete_max = delete_max
+
+    async def run(self):
+        """Периодически обслуживает партиции."""
+        while True:
+            try:
+                await self.maintain()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка обслуживания партиций merge_block_logs: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def maintain(self, today: date | None = None):
+        current_month = (today or date.today()).replace(day=1)
+        async with self.db_manager.get_session() as session:
+            async with session.begin():
+                if not await self.duplicate_repo.try_lock_merge_log_maintenance(
+                    session
+                ):
+                    logger.debug("Партиции merge_block_logs обслуживает другая реплика")
+                    return
+
+                # DDL над партициями не должен надолго блокировать вставку логов
+                await self.duplicate_repo.set_lock_timeout(session, seconds=5)
+                await self._create_partitions(session, current_month)
+                if self.retention_months:
+                    cutoff = add_months(current_month, -self.retention_months)
+                    await self._drop_partitions(session, cutoff)
+                    await self._prune_default_partition(session, cutoff)
+
+    async def _create_partitions(self, session, current_month: date):
+        for offset in range(self.months_ahead + 1):
+            month_start = add_months(current_month, offset)
+            try:
+                # Savepoint: ошибка одной партиции не откатывает остальные
+                async with session.begin_nested():
+                    await self.duplicate_repo.create_merge_log_partition(
+                        session, month_start, add_months(month_start, 1)
+                    )
+            except Exception as e:
+                # Например, в партиции по умолчанию уже есть строки за этот месяц
+                logger.error(f"Не удалось создать партицию за {month_start:%Y-%m}: {e}")
+
+    async def _drop_partitions(self, session, cutoff: date):
+        """Удаляет партиции месяцев, целиком лежащих раньше `cutoff`."""
+        for name in await self.duplicate_repo.get_merge_log_partitions(session):
+            suffix = name.removeprefix(MERGE_LOG_PARTITION_PREFIX)
+            if not (len(suffix) == 6 and suffix.isdigit()):
+                continue
+            if date(int(suffix[:4]), int(suffix[4:]), 1) >= cutoff:
+                continue
+            try:
+                # Savepoint: например, lock timeout не откатывает созданные партиции
+                async with session.begin_nested():
+                    await self.duplicate_repo.drop_merge_log_partition(session, name)
+            except Exception as e:
+                logger.error(f"Не удалось удалить партицию {name}: {e}")
+                continue
+            logger.info(f"Удалена партиция {name} (хранение {self.retention_months} мес.)")
+
+    async def _prune_default_partition(self, session, cutoff: date):
+        """
+        Удаляет из партиции по умолчанию строки старше `cutoff` порциями по
+        `delete_batch`, не больше `delete_max` за проход — остальное удалят
+        следующие проходы.
+        """
+        deleted = 0
+        while deleted < self.delete_max:
+            try:
+                async with session.begin_nested():
+                    count = await self.duplicate_repo.delete_default_partition_logs(
+                        session, cutoff, min(self.delete_batch, self.delete_max - deleted)
+                    )
+            except Exception as e:
+                logger.error(f"Не удалось очистить партицию по умолчанию: {e}")
+                break
+            deleted += count
+            if count < self.delete_batch:
+                break
+        if deleted:
+            logger.info(
+                f"Из партиции по умолчанию удалено {deleted} строк до {cutoff:%Y-%m-%d}"
+            )
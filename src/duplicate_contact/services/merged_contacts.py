@@ -0,0 +1,75 @@
+import time
+from datetime import datetime, timedelta, timezone
+
+from loguru import logger
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.common.config import MERGED_CONTACT_TTL
+from src.duplicate_contact.repository import ContactDuplicateRepository
+
+
+class MergedContactsService:
+    """
+    Tombstone-кэш контактов, поглощённых при склейке.
+    Проверка идёт сначала по памяти процесса, затем по таблице merged_contacts,
+    чтобы запись пережила рестарт и была видна другим репликам.
+    """
+
+    def __init__(
+        self, duplicate_repo: ContactDuplicateRepository, ttl: int = MERGED_CONTACT_TTL
+    ):
+        self.duplicate_repo = duplicate_repo
+        self.ttl = ttl
+        # subdomain → {contact_id: monotonic-время истечения}
+        self._tombstones: dict[str, dict[int, float]] = {}
+
+    async def add(
+        self, session: AsyncSession, subdomain: str, contact_ids: list[int]
+    ) -> None:
+        """Запоминает поглощённые контакты в памяти и в БД."""
+        contact_ids = [int(contact_id) for contact_id in contact_ids]
+        if not contact_ids:
+            return
+
+        self._remember(subdomain, contact_ids, time.monotonic() + self.ttl)
+        expires_at = datetime.now(timezone.utc) + timedelta(seconds=self.ttl)
+        await self.duplicate_repo.upsert_merged_contacts(
+            session, subdomain, contact_ids, expires_at
+        )
+        logger.bind(subdomain=subdomain).debug(
+            "Добавлены tombstones для контактов: {}", contact_ids
+        )
+
+    def is_merged_cached(self, subdomain: str, contact_id: int) -> bool:
+        """Проверяет tombstone только в памяти процесса, без обращения к БД."""
+        expires = self._tombstones.get(subdomain, {}).get(int(contact_id))
+        return expires is not None and expires > time.monotonic()
+
+    async def filter_not_merged(
+        self, session: AsyncSession, subdomain: str, contact_ids: list[int]
+    ) -> list[int]:
+        """Отбрасывает недавно поглощённые контакты: сначала по памяти, затем одним запросом к БД."""
+        contact_ids = [
+            int(contact_id)
+            for contact_id in contact_ids
+            if not self.is_merged_cached(subdomain, contact_id)
+        ]
+        merged = await self.duplicate_repo.get_merged_contacts(
+            session, subdomain, contact_ids
+        )
+        now = datetime.now(timezone.utc)
+        for contact_id, expires_at in merged.items():
+            remaining = (expires_at - now).total_seconds()
+            self._remember(subdomain, [contact_id], time.monotonic() + remaining)
+        return [contact_id for contact_id in contact_ids if contact_id not in merged]
+
+    def _remember(self, subdomain: str, contact_ids: list[int], expires: float) -> None:
+        """Добавляет записи в память, попутно вычищая просроченные."""
+        now = time.monotonic()
+        tombstones = {
+            contact_id: deadline
+            for contact_id, deadline in self._tombstones.get(subdomain, {}).items()
+            if deadline > now
+        }
+        tombstones.update(dict.fromkeys(contact_ids, expires))
+        self._tombstones[subdomain] = tombstones
@@ -0,0 +1,110 @@
+import asyncio
+import time
+
+import asyncpg
+import orjson
+from loguru import logger
+
+from src.common.config import (
+    DB_HOST,
+    DB_NAME,
+    DB_PASS,
+    DB_PORT,
+    DB_USER,
+    SETTINGS_CACHE_TTL,
+)
+from src.duplicate_contact.schemas import ContactDuplicateSettingsSchema
+
+# Канал NOTIFY, в который при изменении настроек публикуется subdomain
+SETTINGS_CHANGED_CHANNEL = "duplicate_settings_changed"
+
+
+class SettingsCache:
+    """
+    Кэш настроек дублей по subdomain: схема для обработчиков и готовый JSON
+    для ответа GetSettingsConsumer.
+    Записи сбрасываются при сохранении настроек и добавлении исключений,
+    в других репликах — по Postgres NOTIFY. TTL страхует от потерянных
+    уведомлений.
+    """
+
+    def __init__(self, ttl: int = SETTINGS_CACHE_TTL):
+        self.ttl = ttl
+        # subdomain → (схема, JSON, monotonic-время истечения)
+        self._entries: dict[str, tuple[ContactDuplicateSettingsSchema, str, float]] = {}
+        # Номер версии растёт при каждом сбросе: загруженные до сброса
+        # настройки не попадут в кэш
+        self._versions: dict[str, int] = {}
+        # Общий сброс (после переподключения LISTEN) меняет эпоху, а не версии
+        # закэшированных subdomain: так он отменяет и загрузки subdomain,
+        # которых в кэше ещё нет
+        self._epoch = 0
+
+    def get(self, subdomain: str) -> tuple[ContactDuplicateSettingsSchema, str] | None:
+        entry = self._entries.get(subdomain)
+        if entry is None:
+            return None
+        settings, settings_json, expires = entry
+        if expires <= time.monotonic():
+            self._entries.pop(subdomain, None)
+            return None
+        return settings, settings_json
+
+    def version(self, subdomain: str) -> int:
+        return self._epoch + self._versions.get(subdomain, 0)
+
+    def set(
+        self, subdomain: str, settings: ContactDuplicateSettingsSchema, version: int
+    ) -> str:
+        """Кэширует настройки, если их не сбросили во время загрузки; возвращает JSON."""
+        settings_json = orjson.dumps(settings.model_dump()).decode()
+        if version == self.version(subdomain):
+            self._entries[subdomain] = (
+                settings,
+                settings_json,
+                time.monotonic() + self.ttl,
+            )
+        return settings_json
+
+    def invalidate(self, subdomain: str | None = None) -> None:
+        """Сбрасывает настройки subdomain или весь кэш."""
+        if subdomain:
+            self._entries.pop(subdomain, None)
+            self._versions[subdomain] = self._versions.get(subdomain, 0) + 1
+        else:
+            self._entries.clear()
+            self._epoch += 1
+        logger.debug(f"Кэш настроек сброшен: {subdomain or 'все subdomain'}")
+
+    async def listen(self, reconnect_delay: int = 5):
+        """Слушает NOTIFY об изменении настроек и сбрасывает соответствующие записи."""
+        while True:
+            connection = None
+            try:
+                connection = await asyncpg.connect(
+                    user=DB_USER,
+                    password=DB_PASS,
+                    database=DB_NAME,
+                    host=DB_HOST,
+                    port=DB_PORT,
+                )
+                await connection.add_listener(SETTINGS_CHANGED_CHANNEL, self._on_notify)
+                # Уведомления, пришедшие до подписки, потеряны
+                self.invalidate()
+                logger.info("Подписка на изменения настроек дублей активна.")
+
+                closed = asyncio.Event()
+                connection.add_termination_listener(lambda _: closed.set())
+                await closed.wait()
+                logger.warning("Соединение LISTEN потеряно, переподключение...")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка подписки на изменения настроек: {e}")
+            finally:
+                if connection and not connection.is_closed():
+                    await connection.close()
+            await asyncio.sleep(reconnect_delay)
+
+    def _on_notify(self, connection, pid, channel, payload):
+        self.invalidate(payload or None)
@@ -2,7 +2,7 @@ import json
 
 
 async def prepare_merge_data(
-    main_contact: dict, duplicates: list[dict], priority_fields: list[dict]
+    main_contact: dict, duplicates: list[dict], priority_fields: list[str | dict]
 ) -> dict[str, any]:
     """Подготавливает данные для слияния контактов в amoCRM."""
     all_contacts = [main_contact] + duplicates
@@ -19,7 +19,7 @@ async def prepare_merge_data(
         "price": "PRICE",
     }
 
-    priority_field_names = {pf["field_name"] for pf in priority_fields}
+    priority_field_names = _priority_field_names(priority_fields)
     youngest = duplicates[-1] if duplicates else None
 
     for field, amo_key in standard_fields_map.items():
@@ -44,6 +44,13 @@ async def prepare_merge_data(
     return payload
 
 
+def _priority_field_names(priority_fields: list[str | dict]) -> set[str]:
+    """Имена приоритетных полей; в настройках они хранятся строками, в старом формате — словарями."""
+    return {
+        pf["field_name"] if isinstance(pf, dict) else pf for pf in priority_fields
+    }
+
+
 def _merge_tags(contacts: list[dict]) -> dict[str, list[int]]:
     """Объединяет теги из всех контактов."""
     tags = {
@@ -56,13 +63,13 @@ def _merge_tags(contacts: list[dict]) -> dict[str, list[int]]:
 
 
 def _merge_custom_fields(
-    main_contact: dict, duplicates: list[dict], priority_fields: list[dict]
+    main_contact: dict, duplicates: list[dict], priority_fields: list[str | dict]
 ) -> dict[int, any]:
     """Объединяет кастомные поля с учетом приоритетов и уникальности телефонов."""
     fields = extract_custom_fields(main_contact)
 
     # Преобразуем в множество имён полей, которые нужно заменять
-    priority_field_names = {pf["field_name"] for pf in priority_fields}
+    priority_field_names = _priority_field_names(priority_fields)
 
     # Берем из младшего дубля нужные приоритетные поля
     if duplicates:
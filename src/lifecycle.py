@@ -0,0 +1,68 @@
+import asyncio
+import time
+
+from loguru import logger
+
+from src.common import tracing
+from src.containers import ApplicationContainer
+
+
+async def prepare_infrastructure(container: ApplicationContainer):
+    """Ждёт БД, применяет миграции и объявляет очереди RabbitMQ, логируя время шагов."""
+    tracing.configure()
+    db_manager = container.database.db_manager()
+    started = time.perf_counter()
+    timings = {}
+    for step, run in (
+        ("wait_for_db", db_manager.wait_for_db),
+        ("migrations", db_manager.run_migrations),
+        ("rabbitmq", container.rabbitmq_manager().setup_rabbitmq),
+    ):
+        step_started = time.perf_counter()
+        await run()
+        timings[step] = f"{(time.perf_counter() - step_started) * 1000:.0f} ms"
+    logger.info(
+        f"Startup completed in {(time.perf_counter() - started) * 1000:.0f} ms: {timings}"
+    )
+
+
+def start_background_tasks(container: ApplicationContainer) -> list[asyncio.Task]:
+    """
+    Запускает фоновые задачи процесса: подписку кэша настроек консьюмеров
+    на NOTIFY об изменениях и обслуживание партиций merge_block_logs.
+    """
+    return [
+        asyncio.create_task(container.consumers.settings_cache().listen()),
+        asyncio.create_task(container.merge_log_retention().run()),
+    ]
+
+
+async def close_resources(container: ApplicationContainer):
+    """Закрывает соединения с БД, RabbitMQ и HTTP-сессии, открытые контейнером."""
+    rabbitmq_manager = container.rabbitmq_manager()
+    # Консьюмеры используют собственные экземпляры БД, соединения, паблишера,
+    # RPC и HTTP-сессии
+    consumer_resources = container.consumers
+
+    logger.info("Закрытие соединения с БД...")
+    await container.database.db_manager().close()
+    await consumer_resources.db_manager().close()
+
+    logger.info("Закрытие HTTP-сессий amoCRM...")
+    for client_session in (
+        container.services.client_session,
+        consumer_resources.client_session,
+    ):
+        if client_session.initialized:
+            await client_session().close()
+    container.shutdown_resources()
+
+    logger.info("Закрытие соединения с RabbitMQ...")
+    await consumer_resources.rmq_publisher().close()
+    await consumer_resources.token_service().rpc_client.close()
+    await consumer_resources.connection_manager().close()
+    await rabbitmq_manager.rmq_publisher.close()
+    await rabbitmq_manager.connection_manager.close()
+
+    tracing.shutdown()
+    logger.info("Все ресурсы успешно освобождены.")
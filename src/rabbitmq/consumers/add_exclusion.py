@@ -51,6 +51,8 @@ class ExclusionConsumer(BaseConsumer):
             else:
                 log.error("Контакт не добавлен в исключения: {}", result)
 
+        except (NetworkError, TokenError):
+            raise  # Для retry с задержкой
         except Exception as e:
             log.exception("Неизвестная ошибка при добавлении исключений: {}", e)
             raise ProcessingError(
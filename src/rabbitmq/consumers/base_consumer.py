@@ -1,10 +1,25 @@
 import json
 import asyncio
+import time
 import aio_pika
 from abc import ABC, abstractmethod
+from typing import Awaitable, Callable
 from loguru import logger
 
+from src.common.config import (
+    CONSUMER_CONCURRENCY,
+    CONSUMER_PREFETCH_MULTIPLIER,
+    QUEUE_CONCURRENCY,
+    QUEUE_TENANT_CONCURRENCY,
+    RETRY_MAX_ATTEMPTS,
+    TENANT_BACKLOG_MULTIPLIER,
+    TENANT_CONCURRENCY,
+    TENANT_MAX_DEFERRALS,
+    TENANT_WEIGHTS,
+)
 from src.common.database import DatabaseManager
+from src.common.metrics import CONSUMER_DEFERRED_TOTAL, CONSUMER_MESSAGE_SECONDS
+from src.common import profiling, tracing
 from src.common.exceptions import (
     ValidationError,
     SettingsNotFoundError,
@@ -12,48 +27,319 @@ from src.common.exceptions import (
     NetworkError,
     TokenError,
     AmoCRMServiceError,
+    SubdomainLockedError,
 )
 from src.rabbitmq.connection import RMQConnectionManager
 from src.rabbitmq.publisher import RMQPublisher
+from src.rabbitmq.scheduler import FairScheduler
+from src.rabbitmq.sharding import (
+    local_shard_queues,
+    shard_exchange_name,
+    sharding_enabled,
+)
 
-MAX_RETRIES = 1
+# Пауза после возврата сообщения в очередь из-за неудачной публикации
+# (пересылка в шард, отложенный повтор), секунд
+REQUEUE_DELAY = 1.0
 
 
 class BaseConsumer(ABC):
+    # Очередь распределяется по шардам по subdomain (см. src.rabbitmq.sharding)
+    sharded: bool = False
+
     def __init__(
         self,
         queue_name: str,
         connection_manager: RMQConnectionManager,
         rmq_publisher: RMQPublisher,
         db_manager: DatabaseManager,
+        concurrency: int | None = None,
+        tenant_concurrency: int | None = None,
     ):
         self.queue_name = queue_name
         self.connection_manager = connection_manager
         self.rmq_publisher = rmq_publisher
         self.db_manager = db_manager
+        self.concurrency = concurrency or QUEUE_CONCURRENCY.get(
+            queue_name, CONSUMER_CONCURRENCY
+        )
+        self.tenant_concurrency = tenant_concurrency or QUEUE_TENANT_CONCURRENCY.get(
+            queue_name, TENANT_CONCURRENCY
+        )
+        self.tenant_backlog = self.tenant_concurrency * TENANT_BACKLOG_MULTIPLIER
+        self._tasks: set[asyncio.Task] = set()
+        self._iterators: set[aio_pika.abc.AbstractQueueIterator] = set()
+        self._scheduler: FairScheduler | None = None
+        self._consuming: asyncio.Future | None = None
+        self._stopping = False
 
     async def start(self):
-        """Запускает консьюмера"""
-        while True:
+        """
+        Запускает консьюмера с пулом из `concurrency` обработчиков.
+        Полученные сообщения раскладываются по subdomain и запускаются
+        FairScheduler по кругу с лимитом `tenant_concurrency` на subdomain.
+        prefetch_count ограничивает буфер неподтверждённых сообщений
+        и тем самым создаёт backpressure на брокер. Сообщения subdomain сверх
+        `tenant_backlog` ожидающих откладываются в очередь задержки: иначе поток
+        одного аккаунта занял бы весь prefetch, и сообщения остальных
+        subdomain не доставлялись бы, пока свободны слоты обработки. Сообщение,
+        отложенное уже TENANT_MAX_DEFERRALS раз, ждёт в консьюмере: поток
+        крупного аккаунта не гоняется через очереди задержки бесконечно.
+        Для шардируемой очереди при включённом шардировании сообщения основной
+        очереди пересылаются в exchange шардов по subdomain, а обрабатываются
+        сообщения шардов этой реплики.
+        """
+        while not self._stopping:
+            dispatcher = None
             try:
                 connection = await self.connection_manager.connect()
                 channel = await connection.channel()
-                await channel.set_qos(prefetch_count=10)
-                queue = await channel.get_queue(self.queue_name)
+                await channel.set_qos(
+                    prefetch_count=self.concurrency * CONSUMER_PREFETCH_MULTIPLIER
+                )
+                scheduler = self._scheduler = FairScheduler(
+                    self.concurrency, self.tenant_concurrency, TENANT_WEIGHTS
+                )
+                dispatcher = asyncio.create_task(self._dispatch(scheduler))
+
+                async def schedule(message: aio_pika.IncomingMessage):
+                    await self._schedule(scheduler, message)
 
-                async with queue.iterator() as queue_iter:
-                    async for message in queue_iter:
-                        await self.process_message(message)
+                if self.sharded and sharding_enabled():
+                    consumers = [
+                        self._consume(channel, self.queue_name, self._forward_to_shard),
+                        *(
+                            self._consume(channel, shard_queue, schedule)
+                            for shard_queue in local_shard_queues(self.queue_name)
+                        ),
+                    ]
+                else:
+                    consumers = [self._consume(channel, self.queue_name, schedule)]
+                self._consuming = asyncio.create_task(self._consume_all(consumers))
+                await self._consuming
             except asyncio.CancelledError:
-                logger.warning(f"Консьюмер {self.queue_name} отменен.")
+                if self._stopping:
+                    # Обработчики завершает stop()
+                    logger.info(f"Консьюмер {self.queue_name} прекратил получение сообщений.")
+                else:
+                    logger.warning(f"Консьюмер {self.queue_name} отменен.")
+                    await self._cancel_in_flight()
                 break
             except Exception as e:
                 logger.error(f"Ошибка в работе консьюмера {self.queue_name}: {e}")
                 await asyncio.sleep(10)
+            finally:
+                if dispatcher:
+                    dispatcher.cancel()
+
+    async def stop(self, timeout: float):
+        """
+        Корректная остановка: прекращает получение сообщений, возвращает
+        в очередь полученные, но не запущенные сообщения, и ждёт завершения
+        обработчиков не дольше `timeout` секунд. Не успевшие обработчики
+        отменяются, их сообщения брокер доставит повторно.
+        """
+        self._stopping = True
+        log = logger.bind(queue=self.queue_name)
+
+        # Basic.cancel; сообщения из буфера итератора возвращаются в очередь
+        for queue_iter in list(self._iterators):
+            try:
+                await queue_iter.close()
+            except Exception as e:
+                log.warning(f"Не удалось остановить получение сообщений: {e}")
+        if self._consuming:
+            self._consuming.cancel()
+
+        if self._scheduler:
+            for message in self._scheduler.drain():
+                try:
+                    await message.nack(requeue=True)
+                except Exception as e:
+                    log.warning(f"Не удалось вернуть сообщение в очередь: {e}")
+
+        await self.flush_pending()
+
+        if not self._tasks:
+            return
+        log.info(f"Ожидание завершения {len(self._tasks)} обработчиков...")
+        _, pending = await asyncio.wait(set(self._tasks), timeout=timeout)
+        if pending:
+            log.warning(
+                f"{len(pending)} обработчиков не завершились за {timeout} с и отменены"
+            )
+            await self._cancel_in_flight()
+
+    async def flush_pending(self):
+        """Запускает отложенную работу немедленно; вызывается при остановке."""
+
+    @staticmethod
+    async def _consume_all(consumers: list[Awaitable[None]]):
+        """
+        Читает все очереди консьюмера. Если чтение одной очереди упало,
+        остальные отменяются: после переподключения рядом с новыми
+        читателями не должны остаться читатели старого канала.
+        """
+        tasks = [asyncio.ensure_future(consumer) for consumer in consumers]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _consume(
+        self,
+        channel: aio_pika.abc.AbstractChannel,
+        queue_name: str,
+        on_message: Callable[[aio_pika.IncomingMessage], Awaitable[None]],
+    ):
+        """Читает очередь и передаёт каждое сообщение в on_message."""
+        queue = await channel.get_queue(queue_name)
+        async with queue.iterator() as queue_iter:
+            self._iterators.add(queue_iter)
+            try:
+                async for message in queue_iter:
+                    await on_message(message)
+            finally:
+                self._iterators.discard(queue_iter)
+
+    async def _schedule(
+        self, scheduler: FairScheduler, message: aio_pika.IncomingMessage
+    ):
+        """Передаёт сообщение планировщику или откладывает его, если очередь subdomain полна."""
+        tenant = self._get_tenant(message)
+        if (
+            scheduler.backlog(tenant) >= self.tenant_backlog
+            and self._deferrals(message) < TENANT_MAX_DEFERRALS
+            and await self._defer(message, "tenant_backlog")
+        ):
+            return
+        scheduler.put(tenant, message)
+
+    @staticmethod
+    def _deferrals(message: aio_pika.IncomingMessage) -> int:
+        """Сколько раз сообщение уже откладывалось."""
+        try:
+            return int((message.headers or {}).get("x-deferred", 0))
+        except (TypeError, ValueError):
+            return 0
+
+    async def _defer(self, message: aio_pika.IncomingMessage, reason: str) -> bool:
+        """
+        Откладывает сообщение в очередь задержки без расхода попыток повтора.
+        Возвращает False, если отложить не удалось и сообщение надо обработать.
+        """
+        log = logger.bind(queue=self.queue_name)
+        try:
+            await self.rmq_publisher.publish_deferred(message, self.queue_name, reason)
+        except Exception as e:
+            log.warning(f"Не удалось отложить сообщение ({reason}): {e}")
+            return False
+        CONSUMER_DEFERRED_TOTAL.labels(self.queue_name, reason).inc()
+        try:
+            await message.ack()
+        except Exception as e:
+            # Копия уже отложена; неподтверждённый оригинал брокер доставит повторно
+            log.error(f"Не удалось подтвердить отложенное сообщение: {e}")
+        return True
+
+    async def _forward_to_shard(self, message: aio_pika.IncomingMessage):
+        """
+        Пересылает сообщение основной очереди в шард его subdomain.
+        Пересылка идёт последовательно, поэтому порядок сообщений
+        одного subdomain сохраняется. Сбой публикации временный (брокер
+        недоступен), поэтому сообщение возвращается в очередь, а не в DLQ;
+        пауза не даёт пересылке крутиться вхолостую, пока брокер не ответит.
+        """
+        try:
+            await self.rmq_publisher.forward(
+                message,
+                shard_exchange_name(self.queue_name),
+                routing_key=self._get_tenant(message),
+            )
+            await message.ack()
+        except Exception as e:
+            logger.bind(queue=self.queue_name).error(
+                f"Не удалось переслать сообщение в шард, возврат в очередь: {e}"
+            )
+            await message.nack(requeue=True)
+            await asyncio.sleep(REQUEUE_DELAY)
+
+    async def _dispatch(self, scheduler: FairScheduler):
+        """Запускает сообщения в порядке, который выдаёт планировщик."""
+        while True:
+            tenant, message = await scheduler.get()
+            task = asyncio.create_task(
+                self._process_and_release(message, scheduler, tenant)
+            )
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    @staticmethod
+    def _get_tenant(message: aio_pika.IncomingMessage) -> str:
+        """Определяет subdomain сообщения для планировщика."""
+        try:
+            return str(json.loads(message.body).get("subdomain") or "")
+        except Exception:
+            return ""
+
+    async def _process_and_release(
+        self, message: aio_pika.IncomingMessage, scheduler: FairScheduler, tenant: str
+    ):
+        """
+        Обрабатывает сообщение и освобождает слот планировщика.
+        Каждое сообщение подтверждается по своему delivery_tag (multiple=False),
+        поэтому порядок завершения обработчиков не влияет на ack соседних.
+        Сообщение с заголовком x-profile или subdomain с включённым
+        профилированием обрабатывается под профайлером (см. src.common.profiling).
+        Обработка — корневой спан трассы, продолжающий контекст из заголовков
+        сообщения (см. src.common.tracing).
+        """
+        try:
+            with tracing.span(
+                f"consume {self.queue_name}",
+                kind=tracing.SpanKind.CONSUMER,
+                attributes={
+                    "messaging.system": "rabbitmq",
+                    "messaging.destination.name": self.queue_name,
+                    "messaging.message.conversation_id": message.correlation_id,
+                    "messaging.rabbitmq.retry": message.headers.get("x-retry"),
+                    "subdomain": tenant,
+                },
+                parent=tracing.extract_context(message.headers),
+            ):
+                if profiling.should_profile(message.headers, tenant):
+                    await profiling.run_profiled(
+                        self.process_message(message), self.queue_name, tenant
+                    )
+                else:
+                    await self.process_message(message)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.bind(queue=self.queue_name).exception(
+                "Необработанная ошибка консьюмера: {}", e
+            )
+            if not message.processed:
+                try:
+                    await message.reject(requeue=False)
+                except Exception as reject_error:
+                    logger.error(f"Не удалось отклонить сообщение: {reject_error}")
+        finally:
+            scheduler.task_done(tenant)
+
+    async def _cancel_in_flight(self):
+        """Отменяет незавершённые обработчики сообщений."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
 
     async def process_message(self, message: aio_pika.IncomingMessage):
         retry_count = message.headers.get("x-retry", 0)
         log = logger.bind(queue=self.queue_name)
+        started = time.perf_counter()
+        outcome = "rejected"
         try:
             body = message.body.decode("utf-8")
             data = json.loads(body)
@@ -65,28 +351,58 @@ class BaseConsumer(ABC):
                     await self.handle_message(data, session)
 
             await message.ack()
+            outcome = "processed"
             log.debug("Сообщение успешно обработано")
         except json.JSONDecodeError as e:
             log.error(f"Некорректный JSON: {e}")
             await message.reject(requeue=False)
+        except SubdomainLockedError as e:
+            # Занятый lock — не ошибка сообщения: откладываем без расхода попыток
+            log.info(f"{e}, сообщение отложено")
+            if await self._defer(message, "subdomain_locked"):
+                outcome = "deferred"
+            else:
+                await message.nack(requeue=True)
+                outcome = "requeued"
         except (NetworkError, TokenError) as e:
             log.error(f"Ошибка с retry: {e}")
-            if retry_count >= MAX_RETRIES:
+            if retry_count >= RETRY_MAX_ATTEMPTS:
                 log.error("Лимит повторов исчерпан, отправка в DLX")
                 await message.reject(requeue=False)
             else:
                 log.warning(f"Повторная попытка #{retry_count + 1}")
-                await self.rmq_publisher.republish_message(message, retry_count + 1)
-                await message.ack()
+                try:
+                    await self.rmq_publisher.publish_retry(
+                        message, self.queue_name, retry_count + 1, e
+                    )
+                except Exception as publish_error:
+                    # Например, нет подтверждения или очередь задержки переполнена:
+                    # ошибка временная, сообщение не должно уйти в DLQ
+                    log.error(
+                        f"Не удалось отложить повтор, возврат в очередь: {publish_error}"
+                    )
+                    await message.nack(requeue=True)
+                    outcome = "requeued"
+                    await asyncio.sleep(REQUEUE_DELAY)
+                else:
+                    await message.ack()
+                    outcome = "retried"
         except AmoCRMServiceError as e:
             log.error("Ошибка API amoCRM: {}", e)
             await message.reject(requeue=False)
         except (ValidationError, SettingsNotFoundError, ProcessingError) as e:
             log.error(f"Логическая ошибка: {e}")
             await message.reject(requeue=False)
-        except ProcessingError as e:
+        except Exception as e:
             log.exception(f"Неизвестная ошибка: {e}")
             await message.reject(requeue=False)
+        finally:
+            CONSUMER_MESSAGE_SECONDS.labels(self.queue_name, outcome).observe(
+                time.perf_counter() - started
+            )
+            tracing.set_attributes({"messaging.outcome": outcome})
+            if outcome == "rejected":
+                tracing.set_error("Сообщение отклонено")
 
     @abstractmethod
     async def handle_message(self, data: dict, session):
@@ -1,4 +1,3 @@
-import json
 from loguru import logger
 from sqlalchemy.ext.asyncio import AsyncSession
 
@@ -8,7 +7,6 @@ from src.common.exceptions import (
     NetworkError,
     ValidationError,
 )
-from src.duplicate_contact.schemas import ContactDuplicateSettingsSchema
 from src.duplicate_contact.services.duplicate_settings import DuplicateSettingsService
 from src.rabbitmq.consumers.base_consumer import BaseConsumer
 
@@ -38,16 +36,13 @@ class GetSettingsConsumer(BaseConsumer):
 
         try:
             log.info("Получение настроек дублей")
-            settings = await self.duplicate_settings_service.get_duplicate_settings(
-                session, subdomain
+            settings_json = (
+                await self.duplicate_settings_service.get_duplicate_settings_json(
+                    session, subdomain
+                )
             )
 
             if data.get("reply_to"):
-                settings_json = json.dumps(
-                    settings.model_dump()
-                    if isinstance(settings, ContactDuplicateSettingsSchema)
-                    else settings
-                )
                 await self.rmq_publisher.send_response(
                     settings_json, data["reply_to"], data.get("correlation_id")
                 )
@@ -8,7 +8,9 @@ from src.common.exceptions import (
     SettingsNotFoundError,
     ProcessingError,
     ValidationError,
+    TokenError,
 )
+from src.common.profiling import stage
 from src.common.token_service import TokenService
 from src.duplicate_contact.services.contact_merge_service import ContactMergeService
 from src.duplicate_contact.services.duplicate_settings import (
@@ -20,6 +22,8 @@ from src.rabbitmq.consumers.base_consumer import BaseConsumer
 class MergeAllContactsConsumer(BaseConsumer):
     """Консьюмер для обработки дублей контактов."""
 
+    sharded = True
+
     def __init__(
         self,
         queue_name: str,
@@ -43,10 +47,12 @@ class MergeAllContactsConsumer(BaseConsumer):
 
         try:
             log.info("Начало объединения всех дублей")
-            access_token = await self.token_service.get_tokens(subdomain)
-            settings = await self.duplicate_settings_service.get_duplicate_settings(
-                session, subdomain
-            )
+            with stage("token"):
+                access_token = await self.token_service.get_tokens(subdomain)
+            with stage("settings"):
+                settings = await self.duplicate_settings_service.get_duplicate_settings(
+                    session, subdomain
+                )
 
             if not settings.merge_is_active:
                 log.info("Слияние отключено в настройках")
@@ -56,5 +62,7 @@ class MergeAllContactsConsumer(BaseConsumer):
                 settings, access_token, session
             )
             log.info("Объединение завершено")
+        except (NetworkError, TokenError):
+            raise  # Для retry с задержкой
         except Exception as e:
             raise ProcessingError(f"Ошибка объединения всех контактов. Error: {e}")
@@ -1,22 +1,55 @@
+import asyncio
+import contextvars
 import json
 from loguru import logger
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from src.common.config import (
+    MERGE_SINGLE_BATCH_SIZE,
+    MERGE_SINGLE_DEBOUNCE_SECONDS,
+    QUEUE_CONCURRENCY,
+    QUEUE_TENANT_CONCURRENCY,
+)
 from src.common.exceptions import (
     AmoCRMServiceError,
     ValidationError,
     SettingsNotFoundError,
     NetworkError,
     ProcessingError,
+    TokenError,
 )
+from src.common import profiling, tracing
+from src.common.profiling import stage
 from src.common.token_service import TokenService
 from src.duplicate_contact.services.contact_merge_service import ContactMergeService
 from src.duplicate_contact.services.duplicate_settings import DuplicateSettingsService
+from src.duplicate_contact.services.merged_contacts import MergedContactsService
 from src.rabbitmq.consumers.base_consumer import BaseConsumer
 
 
+class _ContactBatch:
+    """contact_id одного subdomain, накопленные за окно debounce."""
+
+    def __init__(self):
+        # contact_id → результат обработки контакта для ожидающих сообщений
+        self.futures: dict[int, asyncio.Future] = {}
+        self.timer: asyncio.TimerHandle | None = None
+        # Спаны сообщений пакета: спан пакета ссылается на их трассы
+        self.links: list = []
+
+
 class MergeSingleContactConsumer(BaseConsumer):
-    """Консьюмер для объединения дублей одного контакта."""
+    """
+    Консьюмер для объединения дублей одного контакта.
+    Сообщения одного subdomain копятся в пакет в течение окна debounce,
+    после чего пакет обрабатывается одной выгрузкой контактов и одним
+    проходом поиска. Каждое сообщение подтверждается после обработки пакета.
+    Профилируемые сообщения обрабатываются сразу и без пакета.
+    Если пакет завершился неповторяемой ошибкой, его контакты обрабатываются
+    по одному, чтобы один проблемный контакт не отправлял в повтор весь пакет.
+    """
+
+    sharded = True
 
     def __init__(
         self,
@@ -27,11 +60,32 @@ class MergeSingleContactConsumer(BaseConsumer):
         duplicate_service: ContactMergeService,
         token_service: TokenService,
         duplicate_settings_service: DuplicateSettingsService,
+        merged_contacts_service: MergedContactsService,
+        concurrency: int | None = None,
+        tenant_concurrency: int | None = None,
+        debounce_seconds: float = MERGE_SINGLE_DEBOUNCE_SECONDS,
+        batch_size: int = MERGE_SINGLE_BATCH_SIZE,
     ):
-        super().__init__(queue_name, connection_manager, rmq_publisher, db_manager)
+        # Пакет не может быть больше числа одновременно обрабатываемых сообщений
+        # одного subdomain; общий пул вдвое больше, чтобы крупный аккаунт
+        # не занимал все слоты очереди
+        super().__init__(
+            queue_name,
+            connection_manager,
+            rmq_publisher,
+            db_manager,
+            concurrency or QUEUE_CONCURRENCY.get(queue_name, batch_size * 2),
+            tenant_concurrency
+            or QUEUE_TENANT_CONCURRENCY.get(queue_name, batch_size),
+        )
         self.duplicate_service = duplicate_service
         self.token_service = token_service
         self.duplicate_settings_service = duplicate_settings_service
+        self.merged_contacts_service = merged_contacts_service
+        self.debounce_seconds = debounce_seconds
+        self.batch_size = batch_size
+        self._batches: dict[str, _ContactBatch] = {}
+        self._batch_tasks: set[asyncio.Task] = set()
 
     async def handle_message(self, data: dict, session: AsyncSession):
         """Обрабатывает сообщение для объединения дублей одного контакта."""
@@ -46,24 +100,175 @@ class MergeSingleContactConsumer(BaseConsumer):
             raise ValidationError("Subdomain и contact_id обязательны в сообщении")
 
         try:
-            log.info("Начало обработки дублей для одного контакта")
-            access_token = await self.token_service.get_tokens(subdomain)
-            log.debug("Токен успешно получен")
-
-            settings = await self.duplicate_settings_service.get_duplicate_settings(
-                session, subdomain
-            )
+            if self.merged_contacts_service.is_merged_cached(subdomain, contact_id):
+                log.info("Контакт уже поглощён при склейке, сообщение пропущено")
+                return
 
-            if not settings.merge_is_active:
-                log.info("Слияние отключено в настройках")
+            if profiling.active():
+                # Задача пакета не наследует сессию профиля этого сообщения,
+                # а pyinstrument в async_mode видит только задачу сообщения,
+                # поэтому профилируемый контакт обрабатывается без пакета
+                log.info("Профилируемый контакт обрабатывается вне пакета")
+                await self._merge_batch(subdomain, [int(contact_id)])
                 return
 
-            await self.duplicate_service.merge_single_contact(
-                settings, access_token, contact_id, session
-            )
-            log.info("Контакт успешно объединён")
+            log.info("Контакт добавлен в пакет на объединение")
+            await self._add_to_batch(subdomain, int(contact_id))
 
+        except (NetworkError, TokenError):
+            raise  # Для retry с задержкой
         except Exception as e:
             raise ProcessingError(
                 f"Ошибка обработки для contact_id={contact_id}. Error={e}"
             )
+
+    async def _add_to_batch(self, subdomain: str, contact_id: int):
+        """Добавляет контакт в пакет subdomain и ждёт результата по этому контакту."""
+        batch = self._batches.get(subdomain)
+        if batch is None:
+            batch = self._batches[subdomain] = _ContactBatch()
+            # Пакет общий для сообщений: не наследует контекст первого из них
+            batch.timer = asyncio.get_running_loop().call_later(
+                self.debounce_seconds,
+                self._flush_batch,
+                subdomain,
+                context=contextvars.Context(),
+            )
+
+        future = batch.futures.get(contact_id)
+        if future is None:
+            future = batch.futures[contact_id] = (
+                asyncio.get_running_loop().create_future()
+            )
+        if link := tracing.current_link():
+            batch.links.append(link)
+        # При остановке не ждём окно debounce
+        if len(batch.futures) >= self.batch_size or self._stopping:
+            self._flush_batch(subdomain)
+
+        await asyncio.shield(future)
+
+    async def flush_pending(self):
+        """Запускает обработку всех накапливаемых пакетов, не дожидаясь debounce."""
+        for subdomain in list(self._batches):
+            self._flush_batch(subdomain)
+
+    async def _cancel_in_flight(self):
+        """
+        Отменяет обработчики сообщений и пакеты: задача пакета не должна
+        пережить остановку и обращаться к уже закрытым пулу БД и каналам.
+        """
+        for task in self._batch_tasks:
+            task.cancel()
+        await asyncio.gather(*self._batch_tasks, return_exceptions=True)
+        await super()._cancel_in_flight()
+
+    def _flush_batch(self, subdomain: str):
+        """Закрывает пакет subdomain и запускает его обработку."""
+        batch = self._batches.pop(subdomain, None)
+        if batch is None:
+            return
+        if batch.timer:
+            batch.timer.cancel()
+
+        # Без контекста сообщения, закрывшего пакет: трассу пакета задают links
+        task = asyncio.create_task(
+            self._run_batch(subdomain, batch), context=contextvars.Context()
+        )
+        self._batch_tasks.add(task)
+        task.add_done_callback(self._batch_tasks.discard)
+
+    async def _run_batch(self, subdomain: str, batch: _ContactBatch):
+        with tracing.span(
+            "merge_single batch",
+            attributes={"subdomain": subdomain, "contacts": len(batch.futures)},
+            links=batch.links,
+        ):
+            await self._settle_batch(subdomain, batch.futures)
+
+    async def _settle_batch(
+        self, subdomain: str, futures: dict[int, asyncio.Future]
+    ):
+        """Обрабатывает пакет и передаёт результат каждому ожидающему сообщению."""
+        try:
+            await self._merge_batch(subdomain, list(futures))
+        except asyncio.CancelledError:
+            for future in futures.values():
+                future.cancel()
+            raise
+        except (NetworkError, TokenError) as e:
+            # Временная ошибка касается всего пакета: повторяется каждое сообщение
+            for future in futures.values():
+                self._settle(future, e)
+        except Exception as e:
+            if len(futures) == 1:
+                self._settle(next(iter(futures.values())), e)
+                return
+            logger.bind(queue=self.queue_name, subdomain=subdomain).warning(
+                f"Ошибка пакета из {len(futures)} контактов, "
+                f"контакты обрабатываются по одному: {e}"
+            )
+            await self._run_per_contact(subdomain, futures)
+        else:
+            for future in futures.values():
+                self._settle(future)
+
+    async def _run_per_contact(
+        self, subdomain: str, futures: dict[int, asyncio.Future]
+    ):
+        """Обрабатывает контакты пакета по отдельности, каждый со своим результатом."""
+        for contact_id, future in futures.items():
+            try:
+                await self._merge_batch(subdomain, [contact_id])
+            except asyncio.CancelledError:
+                for pending in futures.values():
+                    pending.cancel()
+                raise
+            except Exception as e:
+                self._settle(future, e)
+            else:
+                self._settle(future)
+
+    @staticmethod
+    def _settle(future: asyncio.Future, error: Exception | None = None):
+        if future.done():
+            return
+        if error is None:
+            future.set_result(None)
+            return
+        future.set_exception(error)
+        # Исключение получат ожидающие сообщения; помечаем его прочитанным
+        future.exception()
+
+    async def _merge_batch(self, subdomain: str, contact_ids: list[int]):
+        """Объединяет дубли для пакета контактов одного subdomain."""
+        log = logger.bind(queue=self.queue_name, subdomain=subdomain)
+        async with self.db_manager.get_session() as session:
+            async with session.begin():
+                with stage("db"):
+                    contact_ids = await self.merged_contacts_service.filter_not_merged(
+                        session, subdomain, contact_ids
+                    )
+                if not contact_ids:
+                    log.info("Все контакты пакета уже поглощены при склейке")
+                    return
+
+                log.info(f"Начало обработки пакета из {len(contact_ids)} контактов")
+                with stage("token"):
+                    access_token = await self.token_service.get_tokens(subdomain)
+                log.debug("Токен успешно получен")
+
+                with stage("settings"):
+                    settings = (
+                        await self.duplicate_settings_service.get_duplicate_settings(
+                            session, subdomain
+                        )
+                    )
+                if not settings.merge_is_active:
+                    log.info("Слияние отключено в настройках")
+                    return
+
+                await self.duplicate_service.merge_contacts_batch(
+                    settings, access_token, contact_ids, session
+                )
+                log.info("Пакет контактов успешно обработан")
@@ -1,9 +1,33 @@
 import asyncio
 import aio_pika
+from aio_pika.exceptions import ChannelPreconditionFailed
 from loguru import logger
+from src.common.config import (
+    RMQ_MANAGEMENT_URL,
+    RMQ_REDRIVE_ENABLED,
+    RMQ_SHARD_COUNT,
+    SHUTDOWN_DRAIN_TIMEOUT,
+)
 from src.common.database import DatabaseManager
+from src.common.metrics import QUEUE_ARGUMENTS_MISMATCH
 from src.rabbitmq.connection import RMQConnectionManager
+from src.rabbitmq.policies import apply_policies
 from src.rabbitmq.publisher import RMQPublisher
+from src.rabbitmq.queue_settings import (
+    DEAD_LETTER_QUEUES,
+    DLX_EXCHANGE,
+    main_queue_arguments,
+    parking_queue_name,
+    queue_settings,
+)
+from src.rabbitmq.redrive import DeadLetterRedriver
+from src.rabbitmq.retry import retry_delays, retry_queue_name
+from src.rabbitmq.sharding import (
+    local_shard_ids,
+    shard_exchange_name,
+    shard_queue_name,
+    sharding_enabled,
+)
 
 
 class RMQManager:
@@ -15,59 +39,171 @@ class RMQManager:
         db_manager: DatabaseManager,
         rmq_publisher: RMQPublisher,
         consumers: list,
+        redriver: DeadLetterRedriver | None = None,
     ):
         self.connection_manager = connection_manager
         self.db_manager = db_manager
         self.rmq_publisher = rmq_publisher
         self.consumers = consumers
+        self.redriver = redriver
+        self._running_consumers: list = []
 
     async def setup_rabbitmq(self):
         """Настройка всех очередей и Dead Letter Exchange (DLX)."""
+        await self._apply_policies()
         async with self.connection_manager as connection:
             channel = await connection.channel()
 
             # Создаём DLX
             dlx_exchange = await channel.declare_exchange(
-                "dlx_exchange_duplicate",
+                DLX_EXCHANGE,
                 type=aio_pika.ExchangeType.DIRECT,
                 durable=True,
             )
 
-            # Определяем мёртвые очереди для каждой основной очереди
-            dead_letter_queues = {
-                "duplicate_contacts_merge_all": "dead_letter_merge_duplicates_all_contacts",
-                "duplicate_contacts_save_settings": "dead_letter_duplicate_contacts_save_settings",
-                "duplicate_contacts_merge_single": "dead_letter_duplicate_contacts_merge_single",
-                "duplicate_contacts_add_in_exclusion": "dead_letter_duplicate_contacts_add_in_exclusion",
-                "duplicate_contacts_get_settings": "dead_letter_duplicate_contacts_get_settings",
-            }
+            dead_letter_queues = DEAD_LETTER_QUEUES
 
-            # Создаем и связываем DLX
+            # Создаем и связываем DLX; parking-очереди для сообщений,
+            # которые не удалось обработать после возвратов из DLQ
             for queue_name, dlq_name in dead_letter_queues.items():
                 dead_letter_queue = await channel.declare_queue(dlq_name, durable=True)
                 await dead_letter_queue.bind(dlx_exchange, routing_key=dlq_name)
+                await channel.declare_queue(parking_queue_name(dlq_name), durable=True)
 
-            # Создаем основные очереди с DLX
-            for queue_name, dlq_name in dead_letter_queues.items():
-                await channel.declare_queue(
-                    queue_name,
-                    durable=True,
-                    arguments={
-                        "x-dead-letter-exchange": "dlx_exchange_duplicate",
-                        "x-dead-letter-routing-key": dlq_name,
-                        "x-message-ttl": 60000,  # TTL 60 секунд
-                        "x-max-length": 1000,  # Максимальная длина очереди
-                    },
+            # Создаем основные очереди с DLX и политикой переполнения
+            for queue_name in dead_letter_queues:
+                if queue_settings(queue_name)["overflow"] == "reject-publish":
+                    logger.warning(
+                        f"Очередь {queue_name}: при overflow=reject-publish брокер "
+                        f"теряет повторы, которые очереди задержки возвращают в "
+                        f"заполненную очередь; используйте reject-publish-dlx"
+                    )
+                await self._declare_queue(
+                    connection, queue_name, main_queue_arguments(queue_name)
                 )
 
-            logger.info("✅ RabbitMQ: все очереди и DLX настроены.")
+            # Очереди задержки для повторов: по TTL сообщение возвращается
+            # через default exchange обратно в основную очередь
+            for queue_name in dead_letter_queues:
+                for delay_ms in retry_delays():
+                    await channel.declare_queue(
+                        retry_queue_name(queue_name, delay_ms),
+                        durable=True,
+                        arguments={
+                            "x-dead-letter-exchange": "",
+                            "x-dead-letter-routing-key": queue_name,
+                            "x-message-ttl": delay_ms,
+                        },
+                    )
+
+            if sharding_enabled():
+                await self._setup_shards(connection, channel)
+
+            logger.info("✅ RabbitMQ: все очереди, DLX и очереди повторов настроены.")
+
+    @staticmethod
+    async def _apply_policies():
+        """Применяет политики очередей, если задан management API (см. src.rabbitmq.policies)."""
+        if not RMQ_MANAGEMENT_URL:
+            return
+        try:
+            await apply_policies()
+        except Exception as e:
+            logger.error(f"Не удалось применить политики очередей RabbitMQ: {e}")
+
+    @staticmethod
+    async def _declare_queue(
+        connection: aio_pika.abc.AbstractConnection, queue_name: str, arguments: dict
+    ):
+        """
+        Объявляет очередь в отдельном канале: при несовпадении аргументов
+        с уже существующей очередью брокер закрывает канал (PRECONDITION_FAILED).
+        Существующая очередь в этом случае используется как есть, а параметры
+        к ней доносит политика (src.rabbitmq.policies); несовпадение видно
+        в метрике rabbitmq_queue_arguments_mismatch.
+        """
+        channel = await connection.channel()
+        try:
+            await channel.declare_queue(queue_name, durable=True, arguments=arguments)
+            QUEUE_ARGUMENTS_MISMATCH.labels(queue_name).set(0)
+        except ChannelPreconditionFailed as e:
+            QUEUE_ARGUMENTS_MISMATCH.labels(queue_name).set(1)
+            hint = (
+                "параметры применены политикой"
+                if RMQ_MANAGEMENT_URL
+                else "примените политики: python -m src.rabbitmq.policies"
+            )
+            logger.error(
+                f"Очередь {queue_name} уже существует с другими аргументами и "
+                f"используется как есть; {hint}. Лимиты max-length и message-ttl "
+                f"ниже заданных политикой снимает только пересоздание очереди: {e}"
+            )
+        finally:
+            if not channel.is_closed:
+                await channel.close()
+
+    async def _setup_shards(
+        self,
+        connection: aio_pika.abc.AbstractConnection,
+        channel: aio_pika.abc.AbstractChannel,
+    ):
+        """
+        Создаёт для шардируемых очередей exchange x-consistent-hash и шардовые
+        очереди. Сообщения одного subdomain всегда попадают в один шард,
+        поэтому аккаунт обрабатывается одной репликой.
+        Требует плагин rabbitmq_consistent_hash_exchange.
+        """
+        sharded_queues = {
+            consumer.queue_name for consumer in self.consumers if consumer.sharded
+        }
+        for queue_name in sharded_queues:
+            exchange = await channel.declare_exchange(
+                shard_exchange_name(queue_name), type="x-consistent-hash", durable=True
+            )
+            for shard_id in range(RMQ_SHARD_COUNT):
+                shard_name = shard_queue_name(queue_name, shard_id)
+                await self._declare_queue(
+                    connection, shard_name, main_queue_arguments(queue_name)
+                )
+                shard_queue = await channel.get_queue(shard_name)
+                # Для x-consistent-hash routing_key привязки — вес шарда
+                await shard_queue.bind(exchange, routing_key="1")
+        logger.info(f"RabbitMQ: настроено {RMQ_SHARD_COUNT} шардов для {sharded_queues}")
 
     async def start_all_consumers(self):
         """Запускает все консьюмеры."""
         await self.setup_rabbitmq()  # Создаём очереди перед запуском консьюмеров
+        await self.start_consumers()
+
+    async def start_consumers(self, consumers: list | None = None, redrive: bool = True):
+        """
+        Запускает консьюмеры (по умолчанию все) в уже настроенных очередях.
+        redrive — запускать ли вместе с ними возврат сообщений из DLQ.
+        """
+        consumers = self.consumers if consumers is None else consumers
+        self._running_consumers = consumers
+        logger.info(
+            f"Запуск консьюмеров: {[consumer.queue_name for consumer in consumers]}"
+        )
 
-        logger.info("Запуск всех консьюмеров...")
+        if sharding_enabled() and any(consumer.sharded for consumer in consumers):
+            # Ошибка настройки шардов останавливает запуск, а не повторяется
+            # в цикле переподключения каждого консьюмера
+            logger.info(f"Шарды этой реплики: {local_shard_ids()}")
+
+        tasks = [consumer.start() for consumer in consumers]
+        if redrive and self.redriver and RMQ_REDRIVE_ENABLED:
+            tasks.append(self.redriver.run())
 
         # Запускаем всех консьюмеров асинхронно
-        await asyncio.gather(*(consumer.start() for consumer in self.consumers))
+        await asyncio.gather(*tasks)
         logger.info("Все консьюмеры завершили выполнение (это не должно произойти!)")
+
+    async def stop_consumers(self, timeout: float = SHUTDOWN_DRAIN_TIMEOUT):
+        """Корректно останавливает запущенные консьюмеры, дожидаясь обработки сообщений."""
+        logger.info("Остановка консьюмеров: ожидание обрабатываемых сообщений...")
+        await asyncio.gather(
+            *(consumer.stop(timeout) for consumer in self._running_consumers),
+            return_exceptions=True,
+        )
+        logger.info("Консьюмеры остановлены.")
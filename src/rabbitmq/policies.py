@@ -0,0 +1,123 @@
+"""
+Политики RabbitMQ с параметрами основных очередей.
+
+Аргументы существующей очереди изменить нельзя: повторное объявление с
+другими аргументами отклоняется (PRECONDITION_FAILED), и очередь работает
+со старыми. Политика применяется к уже созданным очередям, поэтому те же
+параметры (queue_settings) публикуются и политикой на основную очередь и
+её шарды. Учтите, как брокер совмещает политику с аргументами очереди:
+- для max-length и message-ttl действует меньшее из значений, так что
+  лимит, заданный аргументом при создании очереди, политикой не поднять —
+  такую очередь нужно пересоздать;
+- overflow и queue-mode из аргументов важнее политики; очереди, созданные
+  до появления этих аргументов, получают их из политики.
+
+Политики применяются при настройке RabbitMQ через management API, если задан
+RMQ_MANAGEMENT_URL. Без него команды rabbitmqctl выводит
+
+    python -m src.rabbitmq.policies
+    python -m src.rabbitmq.policies --apply   # через RMQ_MANAGEMENT_URL
+"""
+
+import argparse
+import asyncio
+import json
+import re
+import shlex
+from urllib.parse import quote
+
+import aiohttp
+from loguru import logger
+
+from src.common.config import RMQ_MANAGEMENT_URL, RMQ_PASSWORD, RMQ_USER, RMQ_VHOST
+from src.rabbitmq.queue_settings import DEAD_LETTER_QUEUES, queue_settings
+
+# Приоритет выше политик по умолчанию (0): к очереди применяется одна политика
+POLICY_PRIORITY = 10
+POLICY_PREFIX = "duplicate-contact"
+
+
+def policy_name(queue_name: str) -> str:
+    return f"{POLICY_PREFIX}.{queue_name}"
+
+
+def policy_pattern(queue_name: str) -> str:
+    """Основная очередь и её шарды (см. shard_queue_name)."""
+    return rf"^{re.escape(queue_name)}(\.shard\.\d+)?$"
+
+
+def policy_definition(queue_name: str) -> dict:
+    settings = queue_settings(queue_name)
+    definition = {"overflow": settings["overflow"]}
+    if settings["max_length"]:
+        definition["max-length"] = settings["max_length"]
+    if settings["message_ttl"]:
+        definition["message-ttl"] = settings["message_ttl"]
+    if settings["lazy"]:
+        definition["queue-mode"] = "lazy"
+    return definition
+
+
+def queue_policies() -> dict[str, dict]:
+    """Политики всех основных очередей в формате management API."""
+    return {
+        policy_name(queue_name): {
+            "pattern": policy_pattern(queue_name),
+            "definition": policy_definition(queue_name),
+            "priority": POLICY_PRIORITY,
+            "apply-to": "queues",
+        }
+        for queue_name in DEAD_LETTER_QUEUES
+    }
+
+
+def rabbitmqctl_commands(vhost: str = RMQ_VHOST or "/") -> list[str]:
+    return [
+        " ".join(
+            [
+                "rabbitmqctl set_policy",
+                f"-p {shlex.quote(vhost)}",
+                f"--priority {policy['priority']}",
+                f"--apply-to {policy['apply-to']}",
+                shlex.quote(name),
+                shlex.quote(policy["pattern"]),
+                shlex.quote(json.dumps(policy["definition"])),
+            ]
+        )
+        for name, policy in queue_policies().items()
+    ]
+
+
+async def apply_policies(
+    management_url: str = RMQ_MANAGEMENT_URL, vhost: str = RMQ_VHOST or "/"
+) -> None:
+    """Создаёт или обновляет политики очередей через management API."""
+    auth = aiohttp.BasicAuth(RMQ_USER or "", RMQ_PASSWORD or "")
+    base_url = f"{management_url.rstrip('/')}/api/policies/{quote(vhost, safe='')}"
+    async with aiohttp.ClientSession(
+        auth=auth, timeout=aiohttp.ClientTimeout(total=10)
+    ) as session:
+        for name, policy in queue_policies().items():
+            async with session.put(
+                f"{base_url}/{quote(name, safe='')}", json=policy
+            ) as response:
+                if response.status not in (201, 204):
+                    raise RuntimeError(
+                        f"Политика {name} не применена: "
+                        f"{response.status} {await response.text()}"
+                    )
+    logger.info(f"RabbitMQ: применены политики очередей {sorted(queue_policies())}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--apply", action="store_true", help="Применить через RMQ_MANAGEMENT_URL"
+    )
+    args = parser.parse_args()
+    if args.apply:
+        if not RMQ_MANAGEMENT_URL:
+            parser.error("RMQ_MANAGEMENT_URL не задан")
+        asyncio.run(apply_policies())
+    else:
+        print("\n".join(rabbitmqctl_commands()))
@@ -1,30 +1,67 @@
+import asyncio
+import itertools
+from datetime import datetime, timezone
+
 import aio_pika
+from aio_pika.abc import AbstractChannel
+from aio_pika.exceptions import ChannelInvalidStateError
 from loguru import logger
+
+from src.common import tracing
+from src.common.config import RMQ_PUBLISHER_CHANNELS, RMQ_PUBLISH_TIMEOUT
 from src.rabbitmq.connection import RMQConnectionManager
+from src.rabbitmq.retry import retry_delay, retry_queue_name
 
 
 class RMQPublisher:
-    def __init__(self, connection_manager: RMQConnectionManager):
+    """
+    Публикация сообщений через пул долгоживущих каналов с publisher confirms.
+    Каналы создаются один раз и переиспользуются; закрытый канал
+    пересоздаётся при следующей публикации.
+    """
+
+    def __init__(
+        self,
+        connection_manager: RMQConnectionManager,
+        pool_size: int = RMQ_PUBLISHER_CHANNELS,
+    ):
         self.connection_manager = connection_manager
+        self.pool_size = max(1, pool_size)
+        self._channels: list[AbstractChannel] = []
+        self._counter = itertools.count()
+        self._lock = asyncio.Lock()
 
     async def send_response(
         self, message_body: str, reply_to: str, correlation_id: str
     ):
-        connection = await self.connection_manager.connect()
-        channel = await connection.channel()
         message = aio_pika.Message(
             body=message_body.encode("utf-8"),
             correlation_id=correlation_id,
             delivery_mode=aio_pika.DeliveryMode.PERSISTENT,
         )
-        await channel.default_exchange.publish(message, routing_key=reply_to)
+        await self.publish(message, routing_key=reply_to)
         logger.info(f"Ответ отправлен в {reply_to}")
 
-    async def republish_message(
-        self, message: aio_pika.IncomingMessage, new_retry_count: int
+    async def publish_retry(
+        self,
+        message: aio_pika.IncomingMessage,
+        queue_name: str,
+        attempt: int,
+        error: Exception,
     ):
+        """
+        Откладывает повтор сообщения: публикует его в очередь задержки,
+        откуда по TTL оно вернётся в `queue_name`. Метаданные повтора
+        передаются в заголовках.
+        """
+        delay_ms = retry_delay(attempt)
         new_headers = dict(message.headers) if message.headers else {}
-        new_headers["x-retry"] = new_retry_count
+        new_headers["x-retry"] = attempt
+        new_headers["x-retry-delay-ms"] = delay_ms
+        new_headers["x-retry-error"] = str(error)[:500]
+        new_headers.setdefault(
+            "x-first-failed-at", datetime.now(timezone.utc).isoformat()
+        )
 
         new_message = aio_pika.Message(
             body=message.body,
@@ -33,11 +70,121 @@ class RMQPublisher:
             reply_to=message.reply_to,
             delivery_mode=aio_pika.DeliveryMode.PERSISTENT,
         )
+        await self.publish(
+            new_message, routing_key=retry_queue_name(queue_name, delay_ms)
+        )
+
+        logger.info(f"Повтор #{attempt} для {queue_name} отложен на {delay_ms} мс")
+
+    async def publish_deferred(
+        self,
+        message: aio_pika.IncomingMessage,
+        queue_name: str,
+        reason: str,
+    ):
+        """
+        Откладывает сообщение, не расходуя попытки повтора: x-retry не меняется,
+        а число откладываний в x-deferred задаёт экспоненциальную задержку.
+        Используется, когда сообщение нельзя обработать сейчас по причине,
+        не связанной с самим сообщением.
+        """
+        new_headers = dict(message.headers) if message.headers else {}
+        deferred = new_headers.get("x-deferred", 0) + 1
+        new_headers["x-deferred"] = deferred
+        new_headers["x-deferred-reason"] = reason
+        delay_ms = retry_delay(deferred)
 
-        connection = await self.connection_manager.connect()
-        channel = await connection.channel()
-        await channel.default_exchange.publish(
-            new_message, routing_key=message.routing_key
+        new_message = aio_pika.Message(
+            body=message.body,
+            headers=new_headers,
+            correlation_id=message.correlation_id,
+            reply_to=message.reply_to,
+            delivery_mode=aio_pika.DeliveryMode.PERSISTENT,
         )
+        await self.publish(
+            new_message, routing_key=retry_queue_name(queue_name, delay_ms)
+        )
+        logger.debug(f"Сообщение {queue_name} отложено на {delay_ms} мс: {reason}")
+
+    async def publish(
+        self, message: aio_pika.Message, routing_key: str, exchange_name: str = ""
+    ):
+        """Публикует сообщение (по умолчанию в default exchange) и ждёт подтверждения брокера."""
+        tracing.inject_headers(message.headers)
+        channel = await self._get_channel()
+        try:
+            return await self._publish(channel, message, routing_key, exchange_name)
+        except ChannelInvalidStateError:
+            logger.warning("Канал публикации закрыт, повтор на новом канале")
+            channel = await self._get_channel(force_new=True)
+            return await self._publish(channel, message, routing_key, exchange_name)
+
+    async def forward(
+        self, message: aio_pika.IncomingMessage, exchange_name: str, routing_key: str
+    ):
+        """Пересылает входящее сообщение в exchange, сохраняя заголовки и свойства."""
+        new_message = aio_pika.Message(
+            body=message.body,
+            headers=dict(message.headers) if message.headers else {},
+            correlation_id=message.correlation_id,
+            reply_to=message.reply_to,
+            delivery_mode=aio_pika.DeliveryMode.PERSISTENT,
+        )
+        await self.publish(new_message, routing_key, exchange_name=exchange_name)
+
+    @staticmethod
+    async def _publish(
+        channel: AbstractChannel,
+        message: aio_pika.Message,
+        routing_key: str,
+        exchange_name: str,
+    ):
+        exchange = (
+            await channel.get_exchange(exchange_name, ensure=False)
+            if exchange_name
+            else channel.default_exchange
+        )
+        return await exchange.publish(
+            message, routing_key=routing_key, timeout=RMQ_PUBLISH_TIMEOUT
+        )
+
+    async def publish_batch(self, messages: list[tuple[aio_pika.Message, str]]):
+        """
+        Публикует пачку сообщений одновременно и ждёт все подтверждения.
+        Брокер подтверждает такие публикации пачкой (multiple=True),
+        поэтому ожидание занимает один round trip вместо N.
+        """
+        return await asyncio.gather(
+            *(self.publish(message, routing_key) for message, routing_key in messages)
+        )
+
+    async def close(self):
+        """Закрывает каналы публикации."""
+        channels, self._channels = self._channels, []
+        for channel in channels:
+            if not channel.is_closed:
+                await channel.close()
+        logger.info("Каналы публикации RabbitMQ закрыты.")
+
+    async def _get_channel(self, force_new: bool = False) -> AbstractChannel:
+        """Возвращает канал из пула по кругу, при необходимости восстанавливая его."""
+        index = next(self._counter) % self.pool_size
+        if (
+            not force_new
+            and index < len(self._channels)
+            and not self._channels[index].is_closed
+        ):
+            return self._channels[index]
 
-        logger.info(f"Сообщение републиковалось с x-retry={new_retry_count}")
+        async with self._lock:
+            connection = await self.connection_manager.connect()
+            while len(self._channels) < self.pool_size:
+                self._channels.append(
+                    await connection.channel(publisher_confirms=True)
+                )
+            if force_new or self._channels[index].is_closed:
+                self._channels[index] = await connection.channel(
+                    publisher_confirms=True
+                )
+                logger.info("Канал публикации RabbitMQ пересоздан.")
+            return self._channels[index]
@@ -0,0 +1,59 @@
+from src.common.config import (
+    RMQ_QUEUE_LAZY,
+    RMQ_QUEUE_MAX_LENGTH,
+    RMQ_QUEUE_MESSAGE_TTL,
+    RMQ_QUEUE_OVERFLOW,
+    RMQ_QUEUE_SETTINGS,
+)
+
+DLX_EXCHANGE = "dlx_exchange_duplicate"
+
+# Мёртвые очереди для каждой основной очереди
+DEAD_LETTER_QUEUES = {
+    "duplicate_contacts_merge_all": "dead_letter_merge_duplicates_all_contacts",
+    "duplicate_contacts_save_settings": "dead_letter_duplicate_contacts_save_settings",
+    "duplicate_contacts_merge_single": "dead_letter_duplicate_contacts_merge_single",
+    "duplicate_contacts_add_in_exclusion": "dead_letter_duplicate_contacts_add_in_exclusion",
+    "duplicate_contacts_get_settings": "dead_letter_duplicate_contacts_get_settings",
+}
+
+# Значения по умолчанию, отличные от общих: ответ на RPC-запрос настроек
+# через минуту уже никому не нужен, поэтому его не храним и не возвращаем из DLQ
+QUEUE_DEFAULTS = {
+    "duplicate_contacts_get_settings": {"message_ttl": 60000, "redrive": False},
+}
+
+
+def queue_settings(queue_name: str) -> dict:
+    """Параметры очереди: общие значения, значения очереди и переопределения из env."""
+    return {
+        "max_length": RMQ_QUEUE_MAX_LENGTH,
+        "overflow": RMQ_QUEUE_OVERFLOW,
+        "message_ttl": RMQ_QUEUE_MESSAGE_TTL,
+        "lazy": RMQ_QUEUE_LAZY,
+        "redrive": True,
+        **QUEUE_DEFAULTS.get(queue_name, {}),
+        **RMQ_QUEUE_SETTINGS.get(queue_name, {}),
+    }
+
+
+def main_queue_arguments(queue_name: str) -> dict:
+    """Аргументы основной (и шардовой) очереди с DLX."""
+    settings = queue_settings(queue_name)
+    arguments = {
+        "x-dead-letter-exchange": DLX_EXCHANGE,
+        "x-dead-letter-routing-key": DEAD_LETTER_QUEUES[queue_name],
+        "x-overflow": settings["overflow"],
+    }
+    if settings["max_length"]:
+        arguments["x-max-length"] = settings["max_length"]
+    if settings["message_ttl"]:
+        arguments["x-message-ttl"] = settings["message_ttl"]
+    if settings["lazy"]:
+        arguments["x-queue-mode"] = "lazy"
+    return arguments
+
+
+def parking_queue_name(dlq_name: str) -> str:
+    """Очередь для сообщений, которые не удалось обработать после всех возвратов из DLQ."""
+    return f"{dlq_name}.parking"
@@ -0,0 +1,161 @@
+import asyncio
+
+import aio_pika
+from loguru import logger
+
+from src.common.config import (
+    RETRY_MAX_ATTEMPTS,
+    RMQ_REDRIVE_BATCH,
+    RMQ_REDRIVE_FILL_RATIO,
+    RMQ_REDRIVE_INTERVAL,
+    RMQ_REDRIVE_MAX_COUNT,
+    RMQ_REDRIVE_RATE,
+)
+from src.rabbitmq.connection import RMQConnectionManager
+from src.rabbitmq.publisher import RMQPublisher
+from src.rabbitmq.queue_settings import (
+    DEAD_LETTER_QUEUES,
+    parking_queue_name,
+    queue_settings,
+)
+
+
+class DeadLetterRedriver:
+    """
+    Возвращает сообщения из DLQ в основные очереди.
+    Сообщения возвращаются с ограничением скорости и только пока основная
+    очередь заполнена меньше чем на `fill_ratio`, чтобы возврат не вызвал
+    новое переполнение. Сообщение, возвращённое `max_redrives` раз, а также
+    отклонённое консьюмером из-за логической ошибки, уходит в parking-очередь.
+    """
+
+    def __init__(
+        self,
+        connection_manager: RMQConnectionManager,
+        rmq_publisher: RMQPublisher,
+        interval: float = RMQ_REDRIVE_INTERVAL,
+        rate: float = RMQ_REDRIVE_RATE,
+        batch_size: int = RMQ_REDRIVE_BATCH,
+        fill_ratio: float = RMQ_REDRIVE_FILL_RATIO,
+        max_redrives: int = RMQ_REDRIVE_MAX_COUNT,
+    ):
+        self.connection_manager = connection_manager
+        self.rmq_publisher = rmq_publisher
+        self.interval = interval
+        self.rate = rate
+        self.batch_size = batch_size
+        self.fill_ratio = fill_ratio
+        self.max_redrives = max_redrives
+
+    async def run(self):
+        """Периодически обходит DLQ всех очередей, для которых включён возврат."""
+        while True:
+            try:
+                connection = await self.connection_manager.connect()
+                async with connection.channel() as channel:
+                    while True:
+                        for queue_name, dlq_name in DEAD_LETTER_QUEUES.items():
+                            if queue_settings(queue_name)["redrive"]:
+                                await self._redrive_queue(channel, queue_name, dlq_name)
+                        await asyncio.sleep(self.interval)
+            except asyncio.CancelledError:
+                logger.warning("Возврат сообщений из DLQ остановлен.")
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка возврата сообщений из DLQ: {e}")
+                await asyncio.sleep(self.interval)
+
+    async def _redrive_queue(
+        self, channel: aio_pika.abc.AbstractChannel, queue_name: str, dlq_name: str
+    ):
+        log = logger.bind(queue=queue_name)
+        capacity = await self._capacity(channel, queue_name)
+        if capacity <= 0:
+            log.debug("Основная очередь заполнена, возврат из DLQ отложен")
+            return
+
+        dead_letter_queue = await channel.get_queue(dlq_name)
+        redriven = parked = 0
+        for _ in range(capacity):
+            message = await dead_letter_queue.get(fail=False)
+            if message is None:
+                break
+
+            try:
+                if self._should_redrive(message):
+                    await self.rmq_publisher.publish(
+                        self._redrive_message(message), routing_key=queue_name
+                    )
+                    redriven += 1
+                else:
+                    await self.rmq_publisher.publish(
+                        self._copy_message(message, dict(message.headers or {})),
+                        routing_key=parking_queue_name(dlq_name),
+                    )
+                    parked += 1
+                await message.ack()
+            except Exception as e:
+                # Например, nack брокера при переполненной основной очереди
+                log.warning(f"Не удалось вернуть сообщение из DLQ: {e}")
+                await message.nack(requeue=True)
+                break
+            await asyncio.sleep(1 / self.rate)
+
+        if redriven or parked:
+            log.info(
+                f"Из {dlq_name} возвращено {redriven} сообщений, "
+                f"отправлено в parking {parked}"
+            )
+
+    async def _capacity(
+        self, channel: aio_pika.abc.AbstractChannel, queue_name: str
+    ) -> int:
+        """Сколько сообщений можно вернуть в основную очередь за проход."""
+        max_length = queue_settings(queue_name)["max_length"]
+        if not max_length:
+            return self.batch_size
+
+        queue = await channel.declare_queue(queue_name, passive=True)
+        free = int(max_length * self.fill_ratio) - queue.declaration_result.message_count
+        return min(self.batch_size, free)
+
+    def _should_redrive(self, message: aio_pika.IncomingMessage) -> bool:
+        """
+        Истёкшие и вытесненные при переполнении сообщения возвращаются.
+        Отклонённые консьюмером — только если исчерпаны повторы сетевых
+        ошибок: ошибки валидации при повторе не исчезнут.
+        """
+        headers = message.headers or {}
+        if headers.get("x-redrive-count", 0) >= self.max_redrives:
+            return False
+        if self._death_reason(headers) == "rejected":
+            return headers.get("x-retry", 0) >= RETRY_MAX_ATTEMPTS
+        return True
+
+    @staticmethod
+    def _death_reason(headers: dict) -> str | None:
+        """Причина последнего попадания в DLQ из заголовка x-death."""
+        deaths = headers.get("x-death") or []
+        if not deaths:
+            return None
+        reason = deaths[0].get("reason")
+        return reason.decode() if isinstance(reason, bytes) else reason
+
+    def _redrive_message(self, message: aio_pika.IncomingMessage) -> aio_pika.Message:
+        headers = dict(message.headers or {})
+        headers["x-redrive-count"] = headers.get("x-redrive-count", 0) + 1
+        # После возврата сообщение снова получает полный набор повторов
+        headers.pop("x-retry", None)
+        return self._copy_message(message, headers)
+
+    @staticmethod
+    def _copy_message(
+        message: aio_pika.IncomingMessage, headers: dict
+    ) -> aio_pika.Message:
+        return aio_pika.Message(
+            body=message.body,
+            headers=headers,
+            correlation_id=message.correlation_id,
+            reply_to=message.reply_to,
+            delivery_mode=aio_pika.DeliveryMode.PERSISTENT,
+        )
@@ -0,0 +1,20 @@
+from src.common.config import RETRY_BASE_DELAY_MS, RETRY_MAX_ATTEMPTS
+
+
+def retry_delays() -> list[int]:
+    """Задержки (мс) для каждой попытки: экспоненциальный рост от базовой."""
+    return [RETRY_BASE_DELAY_MS * 2**attempt for attempt in range(RETRY_MAX_ATTEMPTS)]
+
+
+def retry_delay(attempt: int) -> int:
+    """Задержка перед попыткой номер `attempt` (начиная с 1)."""
+    delays = retry_delays()
+    return delays[min(attempt, len(delays)) - 1]
+
+
+def retry_queue_name(queue_name: str, delay_ms: int) -> str:
+    """
+    Имя очереди задержки. Сообщение лежит в ней delay_ms, после чего
+    по TTL возвращается через dead-letter в основную очередь.
+    """
+    return f"{queue_name}.retry.{delay_ms}"
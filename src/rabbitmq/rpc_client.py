@@ -2,55 +2,102 @@ import asyncio
 import aio_pika
 import json
 import uuid
+from aio_pika.abc import AbstractChannel
 from loguru import logger
-from fastapi import HTTPException
-import async_timeout
 
+from src.common import tracing
 from src.common.exceptions import AmoCRMServiceError
 from src.rabbitmq.connection import RMQConnectionManager
 
+# Псевдо-очередь RabbitMQ direct reply-to: ответы приходят прямо в канал
+# отправителя, без объявления и удаления временных очередей.
+REPLY_TO_QUEUE = "amq.rabbitmq.reply-to"
+
 
 class RPCClient:
-    """Клиент для отправки RPC-запросов через RabbitMQ."""
+    """
+    Клиент для отправки RPC-запросов через RabbitMQ.
+    Использует один долгоживущий канал с единственным консьюмером
+    direct reply-to, который раздаёт ответы ожидающим future по correlation_id.
+    """
 
     def __init__(self, connection_manager: RMQConnectionManager):
         self.connection_manager = connection_manager
+        self._channel: AbstractChannel | None = None
+        self._futures: dict[str, asyncio.Future] = {}
+        self._lock = asyncio.Lock()
 
     async def send_rpc_request_and_wait_for_reply(
         self, subdomain: str, client_id: str, timeout: int = 30
     ):
         """Отправляет RPC-запрос и ожидает ответ."""
-
         correlation_id = str(uuid.uuid4())
-
-        connection = await self.connection_manager.connect()
-        channel = await connection.channel()
-        reply_queue = await channel.declare_queue(exclusive=True)
+        future = asyncio.get_running_loop().create_future()
+        self._futures[correlation_id] = future
 
         try:
-            async with async_timeout.timeout(timeout):
+            with tracing.span(
+                "rpc tokens_get_user",
+                kind=tracing.SpanKind.CLIENT,
+                attributes={"subdomain": subdomain},
+            ):
+                channel = await self._get_channel()
                 message = aio_pika.Message(
                     body=json.dumps(
                         {"client_id": client_id, "subdomain": subdomain}
                     ).encode(),
                     correlation_id=correlation_id,
-                    reply_to=reply_queue.name,
+                    reply_to=REPLY_TO_QUEUE,
                 )
-
+                tracing.inject_headers(message.headers)
                 await channel.default_exchange.publish(
                     message, routing_key="tokens_get_user"
                 )
-
-                async with reply_queue.iterator() as iter:
-                    async for msg in iter:
-                        async with msg.process():
-                            if msg.correlation_id == correlation_id:
-                                return json.loads(msg.body.decode())
-
+                return await asyncio.wait_for(future, timeout)
         except asyncio.TimeoutError:
             logger.error("RPC timeout")
-            await reply_queue.delete()
             raise AmoCRMServiceError("Service timeout during RPC")
-
         finally:
-            await reply_queue.delete()
+            self._futures.pop(correlation_id, None)
+
+    async def close(self):
+        """Отменяет ожидающие запросы и закрывает канал ответов."""
+        for future in self._futures.values():
+            if not future.done():
+                future.cancel()
+        self._futures.clear()
+        if self._channel and not self._channel.is_closed:
+            await self._channel.close()
+        self._channel = None
+
+    async def _get_channel(self) -> AbstractChannel:
+        """Возвращает канал RPC, создавая его и консьюмер ответов при необходимости."""
+        if self._channel and not self._channel.is_closed:
+            return self._channel
+
+        async with self._lock:
+            if self._channel and not self._channel.is_closed:
+                return self._channel
+
+            connection = await self.connection_manager.connect()
+            channel = await connection.channel()
+            reply_queue = await channel.get_queue(REPLY_TO_QUEUE, ensure=False)
+            # Direct reply-to требует no_ack и подписки до первой публикации
+            await reply_queue.consume(self._on_reply, no_ack=True)
+            self._channel = channel
+            logger.info("RPC-канал direct reply-to готов.")
+            return channel
+
+    async def _on_reply(self, message: aio_pika.abc.AbstractIncomingMessage):
+        """Передаёт ответ ожидающему future; ответы без получателя отбрасываются."""
+        future = self._futures.pop(message.correlation_id, None)
+        if future is None or future.done():
+            logger.warning(
+                "Получен ответ RPC без ожидающего запроса: {}", message.correlation_id
+            )
+            return
+
+        try:
+            future.set_result(json.loads(message.body.decode()))
+        except Exception as e:
+            future.set_exception(e)
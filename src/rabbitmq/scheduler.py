@@ -0,0 +1,107 @@
+import asyncio
+from collections import deque
+from typing import Any
+
+
+class FairScheduler:
+    """
+    Справедливое распределение сообщений между subdomain (Deficit Round Robin).
+
+    Сообщения раскладываются по очередям subdomain, которые обходятся по кругу:
+    за один круг subdomain получает столько сообщений, каков его вес.
+    Одновременно выполняется не больше `concurrency` сообщений всего и не
+    больше `tenant_concurrency` сообщений одного subdomain, поэтому поток
+    сообщений крупного аккаунта не вытесняет мелкие.
+    """
+
+    def __init__(
+        self,
+        concurrency: int,
+        tenant_concurrency: int,
+        weights: dict[str, int] | None = None,
+    ):
+        self.concurrency = concurrency
+        self.tenant_concurrency = tenant_concurrency
+        self.weights = weights or {}
+        self._queues: dict[str, deque] = {}
+        self._ring: deque[str] = deque()
+        self._deficit: dict[str, int] = {}
+        self._running: dict[str, int] = {}
+        self._total_running = 0
+        self._wakeup = asyncio.Event()
+
+    def put(self, tenant: str, item: Any) -> None:
+        """Ставит элемент в очередь subdomain."""
+        queue = self._queues.get(tenant)
+        if queue is None:
+            queue = self._queues[tenant] = deque()
+            self._ring.append(tenant)
+            self._deficit[tenant] = 0
+        queue.append(item)
+        self._wakeup.set()
+
+    async def get(self) -> tuple[str, Any]:
+        """Ждёт и возвращает следующий элемент, который можно запустить."""
+        while True:
+            picked = self._pick()
+            if picked is not None:
+                return picked
+            self._wakeup.clear()
+            await self._wakeup.wait()
+
+    def task_done(self, tenant: str) -> None:
+        """Освобождает слот subdomain после обработки элемента."""
+        self._running[tenant] -= 1
+        if not self._running[tenant]:
+            del self._running[tenant]
+        self._total_running -= 1
+        self._wakeup.set()
+
+    def drain(self) -> list[Any]:
+        """Забирает все ещё не запущенные элементы."""
+        items = [item for queue in self._queues.values() for item in queue]
+        self._queues.clear()
+        self._ring.clear()
+        self._deficit.clear()
+        return items
+
+    def backlog(self, tenant: str) -> int:
+        """Число ожидающих запуска элементов subdomain."""
+        queue = self._queues.get(tenant)
+        return len(queue) if queue else 0
+
+    @property
+    def pending(self) -> int:
+        return sum(len(queue) for queue in self._queues.values())
+
+    @property
+    def running(self) -> int:
+        return self._total_running
+
+    def _pick(self) -> tuple[str, Any] | None:
+        if self._total_running >= self.concurrency:
+            return None
+
+        for _ in range(len(self._ring)):
+            tenant = self._ring[0]
+            if self._running.get(tenant, 0) >= self.tenant_concurrency:
+                self._ring.rotate(-1)
+                continue
+
+            if self._deficit[tenant] <= 0:
+                self._deficit[tenant] += self.weights.get(tenant, 1)
+
+            queue = self._queues[tenant]
+            item = queue.popleft()
+            self._deficit[tenant] -= 1
+            self._running[tenant] = self._running.get(tenant, 0) + 1
+            self._total_running += 1
+
+            if not queue:
+                self._ring.popleft()
+                del self._queues[tenant]
+                del self._deficit[tenant]
+            elif self._deficit[tenant] <= 0:
+                self._ring.rotate(-1)
+            return tenant, item
+        return None
@@ -0,0 +1,49 @@
+from src.common.config import (
+    RMQ_REPLICA_COUNT,
+    RMQ_REPLICA_INDEX,
+    RMQ_SHARD_COUNT,
+    RMQ_SHARD_IDS,
+)
+
+
+def sharding_enabled() -> bool:
+    return RMQ_SHARD_COUNT > 0
+
+
+def shard_exchange_name(queue_name: str) -> str:
+    """Exchange типа x-consistent-hash, распределяющий сообщения очереди по шардам."""
+    return f"{queue_name}.sharded"
+
+
+def shard_queue_name(queue_name: str, shard_id: int) -> str:
+    return f"{queue_name}.shard.{shard_id}"
+
+
+def local_shard_ids() -> list[int]:
+    """
+    Шарды этой реплики: RMQ_SHARD_IDS либо, если он пуст, шарды по номеру
+    реплики. Без явной настройки каждая реплика взяла бы все шарды, и порядок
+    обработки subdomain внутри шарда не соблюдался бы, поэтому это ошибка.
+    """
+    if RMQ_SHARD_IDS:
+        shard_ids = RMQ_SHARD_IDS
+    elif 0 <= RMQ_REPLICA_INDEX < RMQ_REPLICA_COUNT:
+        shard_ids = [
+            shard_id
+            for shard_id in range(RMQ_SHARD_COUNT)
+            if shard_id % RMQ_REPLICA_COUNT == RMQ_REPLICA_INDEX
+        ]
+    else:
+        raise ValueError(
+            "Шардирование включено (RMQ_SHARD_COUNT > 0): задайте RMQ_SHARD_IDS "
+            "или RMQ_REPLICA_INDEX и RMQ_REPLICA_COUNT (0 <= index < count)"
+        )
+    unknown = [shard_id for shard_id in shard_ids if not 0 <= shard_id < RMQ_SHARD_COUNT]
+    if unknown:
+        raise ValueError(f"Шарды {unknown} вне диапазона 0..{RMQ_SHARD_COUNT - 1}")
+    return shard_ids
+
+
+def local_shard_queues(queue_name: str) -> list[str]:
+    """Шардовые очереди, которые обрабатывает эта реплика."""
+    return [shard_queue_name(queue_name, shard_id) for shard_id in local_shard_ids()]
@@ -0,0 +1,154 @@
+"""Склейка большой группы деревом против склейки в самый старый контакт."""
+
+import asyncio
+import copy
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from benchmarks.synthetic import AccountProfile, generate_contacts, generate_priority_fields
+from src.common.exceptions import NetworkError
+from src.duplicate_contact.services import contact_merge_service
+from src.duplicate_contact.services.contact_merge_service import ContactMergeService
+from src.duplicate_contact.utils.prepare_merge_data import prepare_merge_data
+
+STANDARD_FIELDS = {
+    "NAME": "name",
+    "MAIN_USER_ID": "responsible_user_id",
+    "DATE_CREATE": "created_at",
+    "PRICE": "price",
+}
+
+
+class FakeAmocrm:
+    """Применяет склейки к контактам в памяти так, как их применяет amoCRM."""
+
+    def __init__(self, contacts: list[dict], fail_on_call: int | None = None):
+        self.contacts = {contact["id"]: copy.deepcopy(contact) for contact in contacts}
+        self.fields = {
+            field["field_id"]: field
+            for contact in contacts
+            for field in contact["custom_fields_values"]
+        }
+        self.payloads = []
+        self.fail_on_call = fail_on_call
+
+    async def merge_contacts(self, subdomain, access_token, payload):
+        self.payloads.append(payload)
+        if len(self.payloads) == self.fail_on_call:
+            raise NetworkError("amoCRM недоступен")
+        survivor = self.contacts[payload["result_element[ID]"]]
+        for contact_id in payload["id[]"]:
+            if contact_id != survivor["id"]:
+                del self.contacts[contact_id]
+        for amo_key, field in STANDARD_FIELDS.items():
+            survivor[field] = payload.get(f"result_element[{amo_key}]")
+        survivor["custom_fields_values"] = [
+            self._field(key, value)
+            for key, value in payload.items()
+            if key.startswith("result_element[cfv]")
+        ]
+        survivor["_embedded"]["tags"] = [
+            {"id": tag_id} for tag_id in payload.get("result_element[TAGS][]", [])
+        ]
+        survivor["_embedded"]["leads"] = [
+            {"id": lead_id} for lead_id in payload.get("result_element[LEADS][]", [])
+        ]
+        return {"merged": payload["id[]"]}
+
+    def _field(self, key: str, value) -> dict:
+        field_id = int(key.split("[")[2].rstrip("]"))
+        if isinstance(value, list):
+            values = [
+                {"value": item["VALUE"], "enum_code": item["DESCRIPTION"]}
+                for item in map(json.loads, value)
+            ]
+        else:
+            values = [{"value": value}]
+        return {**self.fields[field_id], "values": values}
+
+    async def get_contact_by_id(self, subdomain, access_token, contact_id, with_leads=False):
+        return copy.deepcopy(self.contacts.get(contact_id))
+
+    async def add_tag_merged_to_contact(self, subdomain, access_token, contact_id, all_tags):
+        pass
+
+
+class FakeMergedContacts:
+    def __init__(self):
+        self.absorbed = []
+
+    async def add(self, session, subdomain, contact_ids):
+        self.absorbed.extend(contact_ids)
+
+
+def make_group(size: int) -> list[dict]:
+    contacts = generate_contacts(AccountProfile(contacts=size, seed=3))
+    group = sorted(contacts, key=lambda contact: contact["created_at"])
+    # У самого молодого контакта нет приоритетных полей: значения должны
+    # прийти из самого старого, а не из выжившего промежуточной склейки
+    group[-1]["name"] = None
+    group[-1]["custom_fields_values"] = [
+        field for field in group[-1]["custom_fields_values"] if field["field_name"] != "Город"
+    ]
+    return group
+
+
+def merge(group: list[dict], amocrm: FakeAmocrm, merged_contacts: FakeMergedContacts):
+    service = ContactMergeService(
+        find_duplicate_service=None,
+        duplicate_repo=None,
+        amocrm_service=amocrm,
+        merged_contacts_service=merged_contacts,
+    )
+    settings = SimpleNamespace(
+        subdomain="test", priority_fields=generate_priority_fields()
+    )
+    return asyncio.run(
+        service._merge_contact_group({"group": group}, settings, "", session=None)
+    )
+
+
+@pytest.fixture(autouse=True)
+def small_chunks(monkeypatch):
+    monkeypatch.setattr(contact_merge_service, "MERGE_CHUNK_SIZE", 3)
+
+
+def test_tree_payload_matches_flat_merge():
+    group = make_group(10)
+    main_contact, *duplicates = group
+    flat = asyncio.run(
+        prepare_merge_data(main_contact, duplicates, generate_priority_fields())
+    )
+    amocrm = FakeAmocrm(group)
+    merged_contacts = FakeMergedContacts()
+
+    result = merge(group, amocrm, merged_contacts)
+
+    # 10 → 4 выживших (3 склейки) → 2 выживших (1 склейка) → итоговая склейка
+    assert len(amocrm.payloads) == 5
+    final = amocrm.payloads[-1]
+    assert result == {"merged": final["id[]"]}
+    assert final["id[]"] == [main_contact["id"], group[9]["id"]]
+    assert {k: v for k, v in final.items() if k != "id[]"} == {
+        k: v for k, v in flat.items() if k != "id[]"
+    }
+    assert set(amocrm.contacts) == {main_contact["id"]}
+    assert sorted(set(merged_contacts.absorbed)) == sorted(c["id"] for c in duplicates)
+
+
+def test_absorbed_contacts_are_recorded_when_final_merge_fails():
+    group = make_group(10)
+    amocrm = FakeAmocrm(group, fail_on_call=5)
+    merged_contacts = FakeMergedContacts()
+
+    with pytest.raises(NetworkError):
+        merge(group, amocrm, merged_contacts)
+
+    # Промежуточные уровни склеили всех, кроме самого старого и самого молодого
+    survivors = [group[0]["id"], group[9]["id"]]
+    assert sorted(amocrm.contacts) == sorted(survivors)
+    assert sorted(merged_contacts.absorbed) == sorted(
+        contact["id"] for contact in group if contact["id"] not in survivors
+    )
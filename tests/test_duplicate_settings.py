@@ -0,0 +1,215 @@
+"""Кэш настроек дублей и сохранение настроек изменениями, а не перезаписью."""
+
+import asyncio
+import json
+
+from sqlalchemy.dialects import postgresql
+
+from src.duplicate_contact.repository import ContactDuplicateRepository
+from src.duplicate_contact.schemas import ContactDuplicateSettingsSchema
+from src.duplicate_contact.services import settings_cache as settings_cache_module
+from src.duplicate_contact.services.duplicate_settings import DuplicateSettingsService
+from src.duplicate_contact.services.settings_cache import SettingsCache
+
+
+def schema(subdomain: str = "acme", **fields) -> ContactDuplicateSettingsSchema:
+    return ContactDuplicateSettingsSchema(subdomain=subdomain, **fields)
+
+
+def test_cache_entry_expires(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(settings_cache_module.time, "monotonic", lambda: now[0])
+    cache = SettingsCache(ttl=10)
+    cache.set("acme", schema(), cache.version("acme"))
+
+    assert cache.get("acme")[0].subdomain == "acme"
+    now[0] = 110.0
+    assert cache.get("acme") is None
+
+
+def test_invalidation_during_load_is_not_overwritten():
+    cache = SettingsCache()
+    version = cache.version("acme")
+    cache.invalidate("acme")
+
+    settings_json = cache.set("acme", schema(merge_all=False), version)
+
+    assert json.loads(settings_json)["merge_all"] is False
+    assert cache.get("acme") is None
+    cache.set("acme", schema(), cache.version("acme"))
+    assert cache.get("acme") is not None
+
+
+def test_invalidating_one_subdomain_keeps_others():
+    cache = SettingsCache()
+    cache.set("acme", schema("acme"), cache.version("acme"))
+    cache.set("other", schema("other"), cache.version("other"))
+
+    cache._on_notify(None, 1, settings_cache_module.SETTINGS_CHANGED_CHANNEL, "acme")
+
+    assert cache.get("acme") is None
+    assert cache.get("other") is not None
+
+
+def test_full_invalidation_cancels_loads_of_uncached_subdomains():
+    cache = SettingsCache()
+    cache.set("acme", schema("acme"), cache.version("acme"))
+    version = cache.version("new")
+
+    cache.invalidate()
+    cache.set("new", schema("new"), version)
+
+    assert cache.get("acme") is None
+    assert cache.get("new") is None
+
+
+class Session:
+    def __init__(self):
+        self.statements = []
+        self.commits = 0
+        self.rollbacks = 0
+
+    async def execute(self, statement, params=None):
+        self.statements.append(statement)
+        return Result()
+
+    async def commit(self):
+        self.commits += 1
+
+    async def rollback(self):
+        self.rollbacks += 1
+
+
+class Result:
+    def all(self):
+        return []
+
+    def scalar_one(self):
+        return 1
+
+
+class Repository:
+    """Запоминает аргументы sync_*; id блоков и полей выдаёт детерминированно."""
+
+    def __init__(self):
+        self.calls = {}
+        self.loads = 0
+
+    async def get_settings_tree_json(self, session, subdomain):
+        self.loads += 1
+        return json.dumps({"subdomain": subdomain, "priority_fields": ["Имя"]})
+
+    async def upsert_settings(self, session, data):
+        return 7
+
+    async def sync_priority_fields(self, session, settings_id, field_names):
+        self.calls["priority_fields"] = (settings_id, field_names)
+
+    async def sync_blocks(self, session, settings_id, block_ids):
+        self.calls["blocks"] = (settings_id, block_ids)
+        return {block_id: block_id * 100 for block_id in block_ids}
+
+    async def sync_block_fields(self, session, block_db_ids, fields):
+        self.calls["block_fields"] = (block_db_ids, fields)
+        return {field: index for index, field in enumerate(fields, 1)}
+
+    async def sync_exclusion_values(self, session, block_field_ids, exclusions):
+        self.calls["exclusions"] = (block_field_ids, exclusions)
+
+    async def notify_settings_changed(self, session, channel, subdomain):
+        self.calls["notify"] = subdomain
+
+
+def test_save_passes_deduplicated_tree_to_sync():
+    repo = Repository()
+    cache = SettingsCache()
+    cache.set("acme", schema(), cache.version("acme"))
+    service = DuplicateSettingsService(repo, cache)
+    session = Session()
+    data = schema(
+        priority_fields=["Имя", {"field_name": "Телефон"}, "Имя"],
+        blocks=[
+            {
+                "block_id": 1,
+                "fields": [
+                    {
+                        "field_name": "Телефон",
+                        "exclusion_fields": [{"value": "000"}, {"value": "000"}],
+                    },
+                    {"field_name": "Email"},
+                ],
+            },
+            {"block_id": 2, "fields": []},
+        ],
+    )
+
+    result = asyncio.run(service.add_duplicate_settings(session, data))
+
+    assert result == {"id": 7, "subdomain": "acme"}
+    assert repo.calls["priority_fields"] == (7, ["Имя", "Телефон"])
+    assert repo.calls["blocks"] == (7, [1, 2])
+    assert repo.calls["block_fields"] == ([100, 200], [(100, "Телефон"), (100, "Email")])
+    assert repo.calls["exclusions"] == ([1, 2], [(1, "Телефон", "000")])
+    assert repo.calls["notify"] == "acme"
+    assert session.commits == 1
+    assert cache.get("acme") is None
+
+
+def test_settings_are_loaded_once_until_invalidated():
+    repo = Repository()
+    cache = SettingsCache()
+    service = DuplicateSettingsService(repo, cache)
+
+    async def main():
+        first = await service.get_duplicate_settings(Session(), "acme")
+        await service.get_duplicate_settings_json(Session(), "acme")
+        cache.invalidate("acme")
+        await service.get_duplicate_settings(Session(), "acme")
+        return first
+
+    first = asyncio.run(main())
+
+    assert first.priority_fields == ["Имя"]
+    assert repo.loads == 2
+
+
+def compiled(statement) -> str:
+    return str(statement.compile(dialect=postgresql.dialect()))
+
+
+def test_sync_statements_delete_missing_rows_and_upsert_the_rest():
+    repo = ContactDuplicateRepository()
+    session = Session()
+
+    async def main():
+        await repo.sync_priority_fields(session, 7, ["Имя"])
+        await repo.sync_blocks(session, 7, [1, 2])
+        await repo.sync_block_fields(session, [100], [(100, "Телефон")])
+
+    asyncio.run(main())
+    statements = [compiled(statement) for statement in session.statements]
+
+    assert len(statements) == 6
+    for delete, upsert in zip(statements[::2], statements[1::2]):
+        assert delete.startswith("DELETE") and "NOT IN" in delete
+        assert upsert.startswith("INSERT") and "ON CONFLICT" in upsert
+    assert "DO NOTHING" in statements[1]
+    assert "RETURNING" in statements[3] and "RETURNING" in statements[5]
+
+
+def test_sync_with_empty_input_only_deletes():
+    repo = ContactDuplicateRepository()
+    session = Session()
+
+    async def main():
+        await repo.sync_priority_fields(session, 7, [])
+        mapping = await repo.sync_blocks(session, 7, [])
+        await repo.sync_block_fields(session, [], [])
+        await repo.sync_exclusion_values(session, [], [])
+        return mapping
+
+    assert asyncio.run(main()) == {}
+    assert [compiled(statement).split()[0] for statement in session.statements] == [
+        "DELETE",
+        "DELETE",
+    ]
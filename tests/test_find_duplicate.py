@@ -0,0 +1,107 @@
+"""Поиск дублей пакета контактов по индексам блоков."""
+
+import asyncio
+import random
+
+from benchmarks.synthetic import AccountProfile, generate_blocks, generate_contacts
+from src.common.log_sampling import SkipCounter
+from src.duplicate_contact.services.find_duplicate import DuplicateFinderService
+
+
+class ContactsStub:
+    def __init__(self, contacts: list[dict]):
+        self.contacts = contacts
+
+    async def get_all_contacts(self, subdomain: str, access_token: str) -> list[dict]:
+        return self.contacts
+
+    async def get_contact_by_id(self, subdomain, access_token, contact_id, with_leads=False):
+        return None
+
+
+async def find_by_scan(finder, contacts, target_ids, blocks) -> list[dict]:
+    """Прежний алгоритм: для каждого контакта пакета проход по всем контактам."""
+    by_id = {contact["id"]: contact for contact in contacts}
+    groups, grouped_ids = [], set()
+    for contact_id in target_ids:
+        if contact_id in grouped_ids or contact_id not in by_id:
+            continue
+        candidates = [
+            contact
+            for contact in contacts
+            if contact["id"] != contact_id and contact["id"] not in grouped_ids
+        ]
+        group = await finder._find_matching_group(
+            by_id[contact_id], candidates, blocks, SkipCounter()
+        )
+        if group and len(group["group"]) >= 2:
+            grouped_ids.update(contact["id"] for contact in group["group"])
+            groups.append(group)
+    return groups
+
+
+def summarize(groups: list[dict]) -> list[tuple]:
+    return [
+        ([contact["id"] for contact in group["group"]], group["matched_block_db_id"])
+        for group in groups
+    ]
+
+
+def test_batch_matches_per_contact_scan():
+    profile = AccountProfile(contacts=1000, duplicate_rate=0.3, exclusions=20, seed=7)
+    contacts = generate_contacts(profile)
+    blocks = generate_blocks(profile, contacts)
+    finder = DuplicateFinderService(ContactsStub(contacts))
+    ids = [contact["id"] for contact in contacts]
+    # Повторы и несуществующий контакт тоже встречаются в пакете
+    target_ids = random.Random(1).sample(ids, 150) + ids[:5] + [-1]
+
+    async def main():
+        batch = await finder.find_duplicates_for_contacts("test", "", target_ids, blocks)
+        scan = await find_by_scan(finder, contacts, target_ids, blocks)
+        return batch, scan
+
+    batch, scan = asyncio.run(main())
+
+    assert batch
+    assert summarize(batch) == summarize(scan)
+
+
+def test_excluded_values_are_not_indexed():
+    def contact(contact_id: int, phone: str) -> dict:
+        return {
+            "id": contact_id,
+            "created_at": contact_id,
+            "custom_fields_values": [
+                {
+                    "field_name": "Телефон",
+                    "field_code": "PHONE",
+                    "values": [{"value": phone}],
+                }
+            ],
+        }
+
+    contacts = [
+        contact(1, "+7 900 000-00-01"),
+        contact(2, "89000000001"),
+        contact(3, "+7 900 000-00-02"),
+        contact(4, "89000000002"),
+    ]
+    blocks = [
+        {
+            "db_id": 10,
+            "fields": [
+                {
+                    "field_name": "Телефон",
+                    "exclusion_fields": [{"value": "79000000002"}],
+                }
+            ],
+        }
+    ]
+    finder = DuplicateFinderService(ContactsStub(contacts))
+
+    groups = asyncio.run(
+        finder.find_duplicates_for_contacts("test", "", [2, 3], blocks)
+    )
+
+    assert summarize(groups) == [([1, 2], 10)]
@@ -0,0 +1,118 @@
+"""ElasticsearchBulkSink против локальной заглушки Elasticsearch на aiohttp."""
+
+import asyncio
+
+import orjson
+from aiohttp import web
+from loguru import logger
+
+from src.common.log_shipper import ElasticsearchBulkSink
+
+INDEX = "test-logs"
+
+
+async def start_stub(errors: int = 0) -> tuple[web.AppRunner, str, list[list[dict]]]:
+    """Заглушка _bulk: запоминает пачки и отклоняет первые `errors` записей каждой."""
+    batches: list[list[dict]] = []
+
+    async def bulk(request: web.Request) -> web.Response:
+        assert request.content_type == "application/x-ndjson"
+        body = await request.read()
+        assert body.endswith(b"\n")
+        batches.append([orjson.loads(line) for line in body.splitlines()])
+        count = len(batches[-1]) // 2
+        items = [
+            {"index": {"status": 400, "error": {"type": "mapper_parsing_exception"}}}
+            if i < errors
+            else {"index": {"status": 201}}
+            for i in range(count)
+        ]
+        return web.json_response({"errors": errors > 0, "items": items})
+
+    app = web.Application()
+    app.router.add_post("/_bulk", bulk)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    host, port = runner.addresses[0][:2]
+    return runner, f"http://{host}:{port}", batches
+
+
+async def ship(sink: ElasticsearchBulkSink, count: int) -> None:
+    handler_id = logger.add(sink, level="INFO")
+    try:
+        sink.start()
+        for i in range(count):
+            logger.bind(n=i).info(f"message {i}")
+        # stop() ждёт поток отправки; loop заглушки в это время должен работать
+        await asyncio.to_thread(sink.stop)
+    finally:
+        logger.remove(handler_id)
+
+
+def test_batches_are_ndjson_bulk_requests():
+    async def main():
+        runner, url, batches = await start_stub()
+        try:
+            sink = ElasticsearchBulkSink(url, INDEX, batch_size=4, flush_interval=0.1)
+            await ship(sink, 10)
+        finally:
+            await runner.cleanup()
+        return sink, batches
+
+    sink, batches = asyncio.run(main())
+
+    assert [len(batch) // 2 for batch in batches] == [4, 4, 2]
+    documents = []
+    for batch in batches:
+        actions, batch_documents = batch[::2], batch[1::2]
+        assert actions == [{"index": {"_index": INDEX}}] * len(actions)
+        documents.extend(batch_documents)
+    assert [document["message"] for document in documents] == [
+        f"message {i}" for i in range(10)
+    ]
+    assert documents[0]["log.level"] == "INFO"
+    assert documents[0]["extra"] == {"n": 0}
+    assert sink.stats == {"enqueued": 10, "dropped": 0, "sent": 10, "failed": 0}
+
+
+def test_rejected_items_are_counted_as_failed():
+    async def main():
+        runner, url, batches = await start_stub(errors=1)
+        try:
+            sink = ElasticsearchBulkSink(url, INDEX, batch_size=5, flush_interval=0.1)
+            await ship(sink, 5)
+        finally:
+            await runner.cleanup()
+        return sink
+
+    sink = asyncio.run(main())
+
+    assert sink.stats == {"enqueued": 5, "dropped": 0, "sent": 4, "failed": 1}
+
+
+def test_unreachable_elasticsearch_counts_failed_batch():
+    async def main():
+        runner, url, _ = await start_stub()
+        await runner.cleanup()  # порт освобождён, соединение отклоняется
+        sink = ElasticsearchBulkSink(url, INDEX, batch_size=3, flush_interval=0.1)
+        await ship(sink, 3)
+        return sink
+
+    sink = asyncio.run(main())
+
+    assert sink.stats == {"enqueued": 3, "dropped": 0, "sent": 0, "failed": 3}
+
+
+def test_full_queue_drops_records_without_blocking():
+    sink = ElasticsearchBulkSink("http://127.0.0.1:9", INDEX, max_queue_size=2)
+    handler_id = logger.add(sink, level="INFO")
+    try:
+        # Поток отправки не запущен: очередь не разгружается
+        for i in range(5):
+            logger.info(f"message {i}")
+    finally:
+        logger.remove(handler_id)
+
+    assert sink.stats == {"enqueued": 2, "dropped": 3, "sent": 0, "failed": 0}
@@ -0,0 +1,138 @@
+"""Запрос токена через RPCClient с заглушкой соединения RabbitMQ."""
+
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+from opentelemetry import trace
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+
+from src.common.exceptions import AmoCRMServiceError, TokenError
+from src.common.token_service import TokenService
+from src.rabbitmq.rpc_client import REPLY_TO_QUEUE, RPCClient
+
+
+class FakeQueue:
+    def __init__(self):
+        self.callback = None
+
+    async def consume(self, callback, no_ack: bool):
+        assert no_ack
+        self.callback = callback
+
+
+class FakeExchange:
+    """Сервис токенов: отвечает в direct reply-to на запрос tokens_get_user."""
+
+    def __init__(self, reply_queue: FakeQueue, reply: dict | None):
+        self.reply_queue = reply_queue
+        self.reply = reply
+        self.published = []
+
+    async def publish(self, message, routing_key: str):
+        self.published.append((message, routing_key))
+        assert message.reply_to == REPLY_TO_QUEUE
+        if self.reply is None:
+            return  # ответа нет — таймаут
+        request = json.loads(message.body)
+        response = SimpleNamespace(
+            correlation_id=message.correlation_id,
+            body=json.dumps({**self.reply, "subdomain": request["subdomain"]}).encode(),
+        )
+        asyncio.get_running_loop().call_soon(
+            asyncio.ensure_future, self.reply_queue.callback(response)
+        )
+
+
+class FakeChannel:
+    def __init__(self, reply: dict | None):
+        self.is_closed = False
+        self.reply_queue = FakeQueue()
+        self.default_exchange = FakeExchange(self.reply_queue, reply)
+
+    async def get_queue(self, name: str, ensure: bool):
+        assert name == REPLY_TO_QUEUE
+        return self.reply_queue
+
+    async def close(self):
+        self.is_closed = True
+
+
+class FakeConnectionManager:
+    def __init__(self, reply: dict | None):
+        self.channel = FakeChannel(reply)
+
+    async def connect(self):
+        return SimpleNamespace(channel=self._channel)
+
+    async def _channel(self):
+        return self.channel
+
+
+TOKENS = {"access_token": "access", "refresh_token": "refresh", "expires_in": 60}
+
+
+def request_token(connection_manager: FakeConnectionManager) -> str:
+    async def main():
+        rpc_client = RPCClient(connection_manager)
+        try:
+            return await TokenService(rpc_client).get_tokens("example")
+        finally:
+            await rpc_client.close()
+
+    return asyncio.run(main())
+
+
+@pytest.fixture(scope="module")
+def spans():
+    """Экспорт спанов в память, как при включённом TRACING_EXPORTER."""
+    exporter = InMemorySpanExporter()
+    provider = TracerProvider()
+    provider.add_span_processor(SimpleSpanProcessor(exporter))
+    trace.set_tracer_provider(provider)
+    return exporter
+
+
+def test_token_request_without_tracing():
+    connection_manager = FakeConnectionManager(TOKENS)
+
+    assert request_token(connection_manager) == "access"
+    ((message, routing_key),) = connection_manager.channel.default_exchange.published
+    assert routing_key == "tokens_get_user"
+    assert json.loads(message.body)["subdomain"] == "example"
+
+
+def test_token_request_is_traced(spans):
+    spans.clear()
+    connection_manager = FakeConnectionManager(TOKENS)
+
+    assert request_token(connection_manager) == "access"
+    (span,) = [span for span in spans.get_finished_spans() if span.name == "rpc tokens_get_user"]
+    assert span.kind == trace.SpanKind.CLIENT
+    assert span.attributes["subdomain"] == "example"
+    ((message, _),) = connection_manager.channel.default_exchange.published
+    assert "traceparent" in message.headers
+
+
+def test_invalid_reply_is_token_error():
+    connection_manager = FakeConnectionManager({"access_token": "access"})
+
+    with pytest.raises(TokenError):
+        request_token(connection_manager)
+
+
+def test_missing_reply_times_out():
+    async def main():
+        rpc_client = RPCClient(FakeConnectionManager(None))
+        try:
+            await rpc_client.send_rpc_request_and_wait_for_reply(
+                "example", "client", timeout=0.05
+            )
+        finally:
+            await rpc_client.close()
+
+    with pytest.raises(AmoCRMServiceError):
+        asyncio.run(main())
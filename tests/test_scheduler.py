@@ -0,0 +1,172 @@
+"""FairScheduler и откладывание сообщений крупного subdomain."""
+
+import asyncio
+import json
+
+from src.rabbitmq.consumers import base_consumer
+from src.rabbitmq.consumers.base_consumer import BaseConsumer
+from src.rabbitmq.scheduler import FairScheduler
+
+
+def take(scheduler: FairScheduler, count: int) -> list[tuple[str, str]]:
+    """Запускает до `count` элементов, не дожидаясь новых."""
+    picked = []
+    while len(picked) < count and (item := scheduler._pick()) is not None:
+        picked.append(item)
+    return picked
+
+
+def fill(scheduler: FairScheduler, tenant: str, count: int) -> None:
+    for i in range(count):
+        scheduler.put(tenant, f"{tenant}{i}")
+
+
+def test_round_robin_across_tenants():
+    scheduler = FairScheduler(concurrency=100, tenant_concurrency=100)
+    fill(scheduler, "big", 6)
+    fill(scheduler, "a", 2)
+    fill(scheduler, "b", 2)
+
+    order = [item for _, item in take(scheduler, 10)]
+
+    assert order == ["big0", "a0", "b0", "big1", "a1", "b1", "big2", "big3", "big4", "big5"]
+
+
+def test_weight_gives_more_items_per_round():
+    scheduler = FairScheduler(concurrency=100, tenant_concurrency=100, weights={"big": 3})
+    fill(scheduler, "big", 6)
+    fill(scheduler, "a", 3)
+
+    order = [item for _, item in take(scheduler, 9)]
+
+    assert order == ["big0", "big1", "big2", "a0", "big3", "big4", "big5", "a1", "a2"]
+
+
+def test_tenant_cap_lets_other_tenants_run():
+    scheduler = FairScheduler(concurrency=10, tenant_concurrency=2)
+    fill(scheduler, "big", 8)
+    fill(scheduler, "a", 1)
+
+    picked = take(scheduler, 10)
+
+    assert [tenant for tenant, _ in picked].count("big") == 2
+    assert ("a", "a0") in picked
+    assert scheduler.running == 3
+    assert scheduler.backlog("big") == 6
+
+    scheduler.task_done("big")
+    assert take(scheduler, 10) == [("big", "big2")]
+
+
+def test_total_concurrency_cap():
+    scheduler = FairScheduler(concurrency=3, tenant_concurrency=10)
+    for tenant in "abcde":
+        fill(scheduler, tenant, 1)
+
+    assert len(take(scheduler, 10)) == 3
+    assert scheduler.pending == 2
+
+    scheduler.task_done("a")
+    assert take(scheduler, 10) == [("d", "d0")]
+
+
+def test_get_waits_for_a_free_slot():
+    async def main():
+        scheduler = FairScheduler(concurrency=1, tenant_concurrency=1)
+        fill(scheduler, "a", 2)
+        first = await scheduler.get()
+        waiter = asyncio.create_task(scheduler.get())
+        await asyncio.sleep(0)
+        blocked = not waiter.done()
+        scheduler.task_done("a")
+        return first, blocked, await asyncio.wait_for(waiter, 1)
+
+    first, blocked, second = asyncio.run(main())
+
+    assert first == ("a", "a0")
+    assert blocked
+    assert second == ("a", "a1")
+
+
+def test_drain_returns_pending_items():
+    scheduler = FairScheduler(concurrency=1, tenant_concurrency=1)
+    fill(scheduler, "a", 2)
+    fill(scheduler, "b", 1)
+    take(scheduler, 1)
+
+    assert sorted(scheduler.drain()) == ["a1", "b0"]
+    assert scheduler.pending == 0
+
+
+class Message:
+    def __init__(self, subdomain: str, deferred: int = 0):
+        self.body = json.dumps({"subdomain": subdomain}).encode()
+        self.headers = {"x-deferred": deferred} if deferred else {}
+        self.acked = False
+
+    async def ack(self):
+        self.acked = True
+
+
+class Publisher:
+    def __init__(self, fail: bool = False):
+        self.deferred = []
+        self.fail = fail
+
+    async def publish_deferred(self, message, queue_name, reason):
+        if self.fail:
+            raise ConnectionError("брокер недоступен")
+        self.deferred.append((message, reason))
+
+
+class Consumer(BaseConsumer):
+    async def handle_message(self, data, session):
+        pass
+
+
+def schedule(messages: list[Message], publisher: Publisher, backlog: int = 2):
+    consumer = Consumer("queue", None, publisher, None, concurrency=10, tenant_concurrency=1)
+    consumer.tenant_backlog = backlog
+    scheduler = FairScheduler(consumer.concurrency, consumer.tenant_concurrency)
+
+    async def main():
+        for message in messages:
+            await consumer._schedule(scheduler, message)
+
+    asyncio.run(main())
+    return scheduler
+
+
+def test_messages_over_tenant_backlog_are_deferred():
+    publisher = Publisher()
+    big = [Message("big") for _ in range(5)]
+
+    scheduler = schedule([*big, Message("small")], publisher)
+
+    assert scheduler.backlog("big") == 2
+    assert scheduler.backlog("small") == 1
+    assert [message for message, _ in publisher.deferred] == big[2:]
+    assert {reason for _, reason in publisher.deferred} == {"tenant_backlog"}
+    assert all(message.acked for message in big[2:])
+
+
+def test_deferral_limit_keeps_message_in_consumer(monkeypatch):
+    monkeypatch.setattr(base_consumer, "TENANT_MAX_DEFERRALS", 3)
+    publisher = Publisher()
+    messages = [Message("big"), Message("big"), Message("big", deferred=2), Message("big", deferred=3)]
+
+    scheduler = schedule(messages, publisher)
+
+    assert [message for message, _ in publisher.deferred] == [messages[2]]
+    assert scheduler.backlog("big") == 3
+    assert not messages[3].acked
+
+
+def test_failed_deferral_keeps_message_in_consumer():
+    publisher = Publisher(fail=True)
+    messages = [Message("big") for _ in range(3)]
+
+    scheduler = schedule(messages, publisher)
+
+    assert scheduler.backlog("big") == 3
+    assert not any(message.acked for message in messages)
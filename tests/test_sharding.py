@@ -0,0 +1,47 @@
+"""Распределение шардов между репликами консьюмеров."""
+
+import pytest
+
+from src.rabbitmq import sharding
+
+
+def configure(monkeypatch, count=6, ids=(), index=-1, replicas=0):
+    monkeypatch.setattr(sharding, "RMQ_SHARD_COUNT", count)
+    monkeypatch.setattr(sharding, "RMQ_SHARD_IDS", list(ids))
+    monkeypatch.setattr(sharding, "RMQ_REPLICA_INDEX", index)
+    monkeypatch.setattr(sharding, "RMQ_REPLICA_COUNT", replicas)
+
+
+def test_explicit_shard_ids(monkeypatch):
+    configure(monkeypatch, ids=[4, 1], index=0, replicas=2)
+
+    assert sharding.local_shard_ids() == [4, 1]
+    assert sharding.local_shard_queues("q") == ["q.shard.4", "q.shard.1"]
+
+
+def test_replicas_split_all_shards(monkeypatch):
+    owners = {}
+    for index in range(4):
+        configure(monkeypatch, count=10, index=index, replicas=4)
+        for shard_id in sharding.local_shard_ids():
+            assert shard_id not in owners
+            owners[shard_id] = index
+
+    assert sorted(owners) == list(range(10))
+    assert owners[5] == 1
+
+
+@pytest.mark.parametrize(
+    "settings",
+    [
+        {},
+        {"replicas": 2},
+        {"index": 2, "replicas": 2},
+        {"ids": [6]},
+    ],
+)
+def test_missing_or_invalid_settings_fail(monkeypatch, settings):
+    configure(monkeypatch, **settings)
+
+    with pytest.raises(ValueError):
+        sharding.local_shard_ids()
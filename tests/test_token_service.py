@@ -0,0 +1,121 @@
+"""Кэш токенов TokenService: single-flight, отмена и сброс кэша."""
+
+import asyncio
+
+from src.common.exceptions import TokenError
+from src.common.token_service import TokenService
+
+
+class FakeRPCClient:
+    """Отвечает на запрос токена, когда тест откроет release."""
+
+    def __init__(self, expires_in: int = 3600):
+        self.calls = 0
+        self.expires_in = expires_in
+        self.release = asyncio.Event()
+        self.error: Exception | None = None
+
+    async def send_rpc_request_and_wait_for_reply(self, subdomain, client_id, timeout=30):
+        self.calls += 1
+        call = self.calls
+        await self.release.wait()
+        if self.error:
+            raise self.error
+        return {
+            "access_token": f"access-{call}",
+            "refresh_token": "refresh",
+            "expires_in": self.expires_in,
+        }
+
+
+def test_concurrent_callers_share_one_rpc():
+    async def main():
+        rpc = FakeRPCClient()
+        service = TokenService(rpc)
+        waiters = [asyncio.create_task(service.get_tokens("example")) for _ in range(20)]
+        await asyncio.sleep(0)
+        rpc.release.set()
+        tokens = await asyncio.gather(*waiters)
+        cached = await service.get_tokens("example")
+        return rpc.calls, tokens, cached
+
+    calls, tokens, cached = asyncio.run(main())
+
+    assert calls == 1
+    assert tokens == ["access-1"] * 20
+    assert cached == "access-1"
+
+
+def test_cancelled_waiter_does_not_cancel_shared_rpc():
+    async def main():
+        rpc = FakeRPCClient()
+        service = TokenService(rpc)
+        cancelled = asyncio.create_task(service.get_tokens("example"))
+        waiter = asyncio.create_task(service.get_tokens("example"))
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        await asyncio.sleep(0)
+        rpc.release.set()
+        token = await waiter
+        return rpc.calls, cancelled.cancelled(), token, await service.get_tokens("example")
+
+    calls, was_cancelled, token, cached = asyncio.run(main())
+
+    assert was_cancelled
+    assert calls == 1
+    assert token == cached == "access-1"
+
+
+def test_invalidate_during_refresh_discards_the_old_token():
+    async def main():
+        rpc = FakeRPCClient()
+        service = TokenService(rpc)
+        stale = asyncio.create_task(service.get_tokens("example"))
+        await asyncio.sleep(0)
+        service.invalidate("example")  # например, 401 от amoCRM
+        fresh = asyncio.create_task(service.get_tokens("example"))
+        await asyncio.sleep(0)
+        rpc.release.set()
+        await asyncio.gather(stale, fresh)
+        return rpc.calls, fresh.result(), await service.get_tokens("example")
+
+    calls, fresh, cached = asyncio.run(main())
+
+    # Запрос после сброса не присоединяется к начатому до него
+    assert calls == 2
+    assert fresh == cached == "access-2"
+
+
+def test_token_near_expiry_is_refreshed_in_background():
+    async def main():
+        rpc = FakeRPCClient(expires_in=10)
+        rpc.release.set()
+        service = TokenService(rpc, refresh_margin=60)
+        first = await service.get_tokens("example")
+        # Токен ещё действует: отдаётся сразу, обновление идёт в фоне
+        second = await service.get_tokens("example")
+        await asyncio.sleep(0.01)
+        return rpc.calls, first, second
+
+    calls, first, second = asyncio.run(main())
+
+    assert (first, second) == ("access-1", "access-1")
+    assert calls == 2
+
+
+def test_rpc_failure_is_token_error_for_every_waiter():
+    async def main():
+        rpc = FakeRPCClient()
+        rpc.error = RuntimeError("RPC недоступен")
+        service = TokenService(rpc)
+        waiters = [asyncio.create_task(service.get_tokens("example")) for _ in range(3)]
+        await asyncio.sleep(0)
+        rpc.release.set()
+        results = await asyncio.gather(*waiters, return_exceptions=True)
+        return rpc.calls, results, service._in_flight
+
+    calls, results, in_flight = asyncio.run(main())
+
+    assert calls == 1
+    assert all(isinstance(result, TokenError) for result in results)
+    assert not in_flight